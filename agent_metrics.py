@@ -0,0 +1,288 @@
+"""
+Agent Runtime Metrics
+=====================
+
+为 uiautomator_controller.py / runner_api.py 提供轻量级的指标采集层（仅依赖标准库）。
+
+- Counter: 单调递增计数器，例如解析失败次数、各任务状态的分布
+- Histogram: 分桶直方图，记录每个阶段（截图、模型推理、解析、执行、整步）的耗时
+- span(): 上下文管理器，自动把代码块耗时记录到 `agent_stage_seconds{stage=...}`
+- scope(): 为当前线程内的 span 附加标签，例如推测执行的截图和推理记为 `{speculative="true"}`，不计入正常步骤
+
+导出方式:
+1. Prometheus textfile collector: `REGISTRY.write_textfile("/var/lib/node_exporter/agent.prom")`
+2. HTTP 端点: `REGISTRY.serve(9464)`，访问 http://host:9464/metrics
+
+使用方法:
+    from agent_metrics import REGISTRY
+    with REGISTRY.span("model"):
+        outputs = query(...)
+    REGISTRY.counter("agent_parse_failures_total", "...").inc()
+"""
+
+import os
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 默认分桶覆盖 5ms ~ 120s，适合截图、本地/远程推理与设备操作的耗时
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+class Counter:
+    """单调递增计数器，按标签区分。"""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation=""):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError("Counter can only increase")
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name + "_total" if not self.name.endswith("_total") else self.name, key, value
+
+
+class Gauge:
+    """可增可减的瞬时值，例如当前对话历史长度。"""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation=""):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, key, value
+
+
+class _HistogramState:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, num_buckets):
+        self.counts = [0] * (num_buckets + 1)  # 最后一个桶为 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    """分桶直方图，可以按桶估计 p50/p99。"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation="", buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                state = self._states[key] = _HistogramState(len(self.buckets))
+            state.counts[idx] += 1
+            state.sum += value
+            state.count += 1
+
+    def count(self, **labels):
+        state = self._states.get(_label_key(labels))
+        return 0 if state is None else state.count
+
+    def quantile(self, q, **labels):
+        """按桶线性插值估计分位数，与 Prometheus 的 histogram_quantile 一致。"""
+        state = self._states.get(_label_key(labels))
+        if state is None or state.count == 0:
+            return None
+        rank = q * state.count
+        cumulative = 0
+        lower = 0.0
+        for upper, n in zip(self.buckets + (float("inf"),), state.counts):
+            if cumulative + n >= rank and n > 0:
+                if upper == float("inf"):
+                    return self.buckets[-1]
+                return lower + (upper - lower) * (rank - cumulative) / n
+            cumulative += n
+            lower = upper
+        return self.buckets[-1]
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(state.counts), state.sum, state.count) for key, state in self._states.items()]
+        for key, counts, total, count in items:
+            cumulative = 0
+            for upper, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                yield self.name + "_bucket", key + (("le", _format_value(upper)),), cumulative
+            yield self.name + "_sum", key, total
+            yield self.name + "_count", key, count
+
+
+class MetricsRegistry:
+    """指标注册表，负责创建指标、记录阶段耗时并以 Prometheus 文本格式导出。"""
+
+    def __init__(self, namespace="agent"):
+        self.namespace = namespace
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._server = None
+        # 每个线程 scope() 附加到 span 的标签
+        self._scope = threading.local()
+        self.stage_seconds = self.histogram("stage_seconds", "Latency of each runtime stage in seconds.")
+
+    def _get_or_create(self, cls, name, documentation, **kwargs):
+        full_name = name if name.startswith(self.namespace + "_") else f"{self.namespace}_{name}"
+        with self._lock:
+            metric = self._metrics.get(full_name)
+            if metric is None:
+                metric = self._metrics[full_name] = cls(full_name, documentation, **kwargs)
+            elif not isinstance(metric, cls):
+                raise TypeError(f"Metric {full_name} already registered as {metric.kind}")
+        return metric
+
+    def counter(self, name, documentation=""):
+        return self._get_or_create(Counter, name, documentation)
+
+    def gauge(self, name, documentation=""):
+        return self._get_or_create(Gauge, name, documentation)
+
+    def histogram(self, name, documentation="", buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, buckets=buckets)
+
+    @contextmanager
+    def scope(self, **labels):
+        """代码块内当前线程记录的 span 都附加 `labels`。"""
+        previous = getattr(self._scope, "labels", {})
+        self._scope.labels = {**previous, **labels}
+        try:
+            yield
+        finally:
+            self._scope.labels = previous
+
+    @contextmanager
+    def span(self, stage, **labels):
+        """记录代码块耗时到 `<namespace>_stage_seconds{stage=...}`，异常时额外计数。"""
+        labels = {**getattr(self._scope, "labels", {}), **labels}
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.counter("stage_errors_total", "Number of exceptions raised per stage.").inc(stage=stage, **labels)
+            raise
+        finally:
+            self.stage_seconds.observe(time.perf_counter() - start, stage=stage, **labels)
+
+    def render(self):
+        """以 Prometheus 文本格式（兼容 OpenMetrics 抓取）输出所有指标。"""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            if metric.documentation:
+                lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample_name, key, value in metric.samples():
+                lines.append(f"{sample_name}{_format_labels(key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """原子写入 Prometheus textfile collector 所需的 .prom 文件。"""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def serve(self, port, addr="0.0.0.0"):
+        """在后台线程启动 /metrics HTTP 端点，返回服务器对象。"""
+        if self._server is not None:
+            return self._server
+        registry = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((addr, port), _Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server
+
+    def summary(self, stages=("capture", "model", "parse", "execute", "step")):
+        """返回各阶段 p50/p99（秒），用于运行结束时打印。"""
+        result = {}
+        for stage in stages:
+            if self.stage_seconds.count(stage=stage) == 0:
+                continue
+            result[stage] = {
+                "count": self.stage_seconds.count(stage=stage),
+                "p50": self.stage_seconds.quantile(0.5, stage=stage),
+                "p99": self.stage_seconds.quantile(0.99, stage=stage),
+            }
+        return result
+
+
+# 进程级默认注册表
+REGISTRY = MetricsRegistry()
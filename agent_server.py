@@ -0,0 +1,340 @@
+"""
+AgentCPM-GUI HTTP Service
+=========================
+
+把 uiautomator_controller.py 中的 AgentCPMController / UIAutomatorController 包装成 HTTP 服务，
+其他系统可以直接通过 HTTP 调用智能体，而不必启动脚本。
+
+接口:
+- POST /step: 单步推理。请求体 {"session_id": "...", "instruction": "...", "image": "<base64 PNG/JPEG>"}，
+  返回 {"session_id": "...", "action": {...}, "status": "..."}。省略 session_id 时服务端会新建会话。
+- DELETE /sessions/{session_id}: 结束会话并释放历史。
+- POST /devices: 注册设备 {"device_id": "..."}；GET /devices 列出已注册设备。
+- POST /episode: 在已注册设备上执行完整任务 {"device_id": "...", "instruction": "...", "max_steps": 10}，
+  以 NDJSON 流的形式逐步返回 step 事件，最后返回 end 事件。设备正在执行其他任务时返回 409；
+  与其他请求同时开始时冲突在流中报告（status 为 busy 的 end 事件）。
+- GET /healthz: 健康检查，返回队列、会话、设备状态。
+- GET /metrics: Prometheus 指标（见 agent_metrics.py）。
+
+会话在服务端维护，每个会话只保留最近 --max-history-turns 轮对话；超过 --session-ttl 未访问或超过
+--max-sessions 时按最近最少使用淘汰。模型请求最多并发 --max-concurrency 个，排队超过 --max-queue 时
+直接返回 503 并带 Retry-After，避免请求无限堆积。
+
+安装:
+   pip install fastapi uvicorn
+
+使用方法:
+   python agent_server.py --port 8000 --device DEVICE_ID
+   curl -X POST localhost:8000/step -H 'Content-Type: application/json' \\
+        -d '{"instruction": "打开设置", "image": "'$(base64 -w0 screen.png)'"}'
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from io import BytesIO
+
+from PIL import Image
+
+try:
+    import uvicorn
+    from fastapi import FastAPI, HTTPException
+    from fastapi.responses import PlainTextResponse, StreamingResponse
+    from pydantic import BaseModel
+except ImportError as e:
+    raise ImportError("agent_server.py requires fastapi and uvicorn: pip install fastapi uvicorn") from e
+
+from agent_metrics import REGISTRY
+from uiautomator_controller import AgentCPMController, UIAutomatorController
+
+class QueueFull(Exception):
+    """等待中的请求数超过上限。"""
+
+
+class RequestGate:
+    """限制并发模型请求数，并对排队请求数设置上限（背压）。"""
+
+    def __init__(self, max_concurrency=1, max_queue=16):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.waiting = 0
+        self.running = 0
+        self._queue_gauge = REGISTRY.gauge("server_queue_depth", "Requests waiting for a model slot.")
+        self._inflight_gauge = REGISTRY.gauge("server_inflight", "Requests currently holding a model slot.")
+        self._rejected = REGISTRY.counter("server_rejected_total", "Requests rejected because the queue is full.")
+
+    async def __aenter__(self):
+        if self.waiting >= self.max_queue and self._semaphore.locked():
+            self._rejected.inc()
+            raise QueueFull()
+        self.waiting += 1
+        self._queue_gauge.set(self.waiting)
+        start = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+            self._queue_gauge.set(self.waiting)
+        REGISTRY.stage_seconds.observe(time.perf_counter() - start, stage="queue")
+        self.running += 1
+        self._inflight_gauge.set(self.running)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.running -= 1
+        self._inflight_gauge.set(self.running)
+        self._semaphore.release()
+
+
+class Session:
+    __slots__ = ("session_id", "history", "last_access", "steps", "lock")
+
+    def __init__(self, session_id, max_history_turns):
+        self.session_id = session_id
+        # 每轮对话包含 user + assistant 两条消息
+        self.history = deque(maxlen=2 * max_history_turns)
+        self.last_access = time.monotonic()
+        self.steps = 0
+        # 同一会话的请求需要串行，否则历史顺序会错乱
+        self.lock = asyncio.Lock()
+
+
+class SessionStore:
+    """服务端会话存储，按 TTL 和容量（LRU）淘汰。"""
+
+    def __init__(self, max_sessions=1024, ttl=1800, max_history_turns=8):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_history_turns = max_history_turns
+        self._sessions = OrderedDict()
+        self._evicted = REGISTRY.counter("server_sessions_evicted_total", "Sessions dropped by TTL or capacity.")
+        self._gauge = REGISTRY.gauge("server_sessions", "Live server-side sessions.")
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_access <= self.ttl and len(self._sessions) <= self.max_sessions:
+                break
+            self._sessions.popitem(last=False)
+            self._evicted.inc()
+
+    def get_or_create(self, session_id=None):
+        self._expire()
+        if session_id is None:
+            session_id = uuid.uuid4().hex
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = Session(session_id, self.max_history_turns)
+        else:
+            self._sessions.move_to_end(session_id)
+        session.last_access = time.monotonic()
+        self._expire()
+        self._gauge.set(len(self._sessions))
+        return session
+
+    def drop(self, session_id):
+        found = self._sessions.pop(session_id, None) is not None
+        self._gauge.set(len(self._sessions))
+        return found
+
+
+class StepRequest(BaseModel):
+    instruction: str
+    image: str
+    session_id: str = None
+
+
+class DeviceRequest(BaseModel):
+    device_id: str = None
+
+
+class EpisodeRequest(BaseModel):
+    instruction: str
+    device_id: str = None
+    max_steps: int = 10
+    settle_seconds: float = 1.0
+
+
+def decode_image(image_base64):
+    if image_base64.startswith("data:"):
+        image_base64 = image_base64.split(",", 1)[1]
+    return Image.open(BytesIO(base64.b64decode(image_base64))).convert("RGB")
+
+
+def create_app(agent, sessions, gate, devices=None):
+    app = FastAPI(title="AgentCPM-GUI")
+    devices = {} if devices is None else devices
+    device_locks = {}
+    registry_lock = threading.Lock()
+
+    def register_device(device_id):
+        # uiautomator2 连接是阻塞操作，放到线程中执行
+        with registry_lock:
+            key = device_id or "default"
+            if key not in devices:
+                devices[key] = UIAutomatorController(device_id)
+            device_locks.setdefault(key, asyncio.Lock())
+            return key
+
+    for key in list(devices):
+        device_locks[key] = asyncio.Lock()
+
+    @app.post("/step")
+    async def step(req: StepRequest):
+        REGISTRY.counter("server_requests_total", "HTTP requests by endpoint.").inc(endpoint="step")
+        try:
+            image = decode_image(req.image)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
+        created = req.session_id is None or req.session_id not in sessions
+        session = sessions.get_or_create(req.session_id)
+        try:
+            # 先进入 gate 再取会话锁：同一会话排队的请求同样计入 max_queue，排满时返回 503
+            async with gate, session.lock:
+                start = time.perf_counter()
+                action = await asyncio.to_thread(agent.get_action, image, req.instruction, session.history)
+                REGISTRY.stage_seconds.observe(time.perf_counter() - start, stage="step")
+        except QueueFull:
+            if created and session.steps == 0:
+                # 被拒绝的请求不应留下空会话占用容量
+                sessions.drop(session.session_id)
+            raise HTTPException(status_code=503, detail="Too many pending requests", headers={"Retry-After": "1"})
+        if action is None:
+            raise HTTPException(status_code=502, detail="Model returned no valid action")
+        session.steps += 1
+        return {"session_id": session.session_id, "step": session.steps, "action": action.to_dict(), "status": action.status}
+
+    @app.delete("/sessions/{session_id}")
+    async def drop_session(session_id: str):
+        if not sessions.drop(session_id):
+            raise HTTPException(status_code=404, detail="Unknown session")
+        return {"session_id": session_id, "dropped": True}
+
+    @app.get("/devices")
+    async def list_devices():
+        return {"devices": sorted(devices), "busy": sorted(k for k, lock in device_locks.items() if lock.locked())}
+
+    @app.post("/devices")
+    async def add_device(req: DeviceRequest):
+        try:
+            key = await asyncio.to_thread(register_device, req.device_id)
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"Failed to connect device: {e}")
+        return {"device_id": key}
+
+    @app.post("/episode")
+    async def episode(req: EpisodeRequest):
+        REGISTRY.counter("server_requests_total", "HTTP requests by endpoint.").inc(endpoint="episode")
+        key = req.device_id or "default"
+        if key not in devices:
+            raise HTTPException(status_code=404, detail=f"Device {key} is not registered")
+        lock = device_locks[key]
+        if lock.locked():
+            raise HTTPException(status_code=409, detail=f"Device {key} is running another episode")
+        ui_controller = devices[key]
+
+        async def events():
+            # 锁在生成器开始执行后才获取：响应从未被迭代（客户端在开始传输前断开）时不会一直占用设备
+            if lock.locked():
+                # 预检查之后被并发的 /episode 抢先，响应头已发出，只能在流中报告冲突
+                yield json.dumps({"event": "end", "status": "busy", "code": 409,
+                                  "error": f"Device {key} is running another episode"}) + "\n"
+                return
+            async with lock:
+                history = deque(maxlen=2 * sessions.max_history_turns)
+                status = "continue"
+                step_count = 0
+                while status == "continue" and step_count < req.max_steps:
+                    step_count += 1
+                    step_start = time.perf_counter()
+                    screenshot = await asyncio.to_thread(ui_controller.take_screenshot)
+                    try:
+                        async with gate:
+                            action = await asyncio.to_thread(agent.get_action, screenshot, req.instruction, history)
+                    except QueueFull:
+                        # episode 已经占用了设备，排队满时等待而不是中止
+                        await asyncio.sleep(1)
+                        step_count -= 1
+                        continue
+                    if action is None:
+                        status = "failed"
+                        yield json.dumps({"event": "step", "step": step_count, "error": "Model returned no valid action"}, ensure_ascii=False) + "\n"
+                        break
+                    with REGISTRY.span("execute"):
+                        status = await asyncio.to_thread(ui_controller.execute_action, action)
+                    with REGISTRY.span("settle"):
+                        await asyncio.sleep(req.settle_seconds)
+                    latency = time.perf_counter() - step_start
+                    REGISTRY.stage_seconds.observe(latency, stage="step")
+                    yield json.dumps({
+                        "event": "step",
+                        "step": step_count,
+                        "action": action.to_dict(),
+                        "status": status,
+                        "latency_ms": round(latency * 1000, 1),
+                    }, ensure_ascii=False) + "\n"
+                if status == "continue":
+                    status = "max_steps"
+                REGISTRY.counter("tasks_total", "Finished tasks by final status.").inc(status=status)
+                yield json.dumps({"event": "end", "status": status, "steps": step_count}) + "\n"
+
+        return StreamingResponse(events(), media_type="application/x-ndjson")
+
+    @app.get("/healthz")
+    async def healthz():
+        return {
+            "status": "ok",
+            "queue_depth": gate.waiting,
+            "inflight": gate.running,
+            "max_queue": gate.max_queue,
+            "sessions": len(sessions),
+            "devices": sorted(devices),
+        }
+
+    @app.get("/metrics")
+    async def metrics():
+        return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP service for AgentCPM-GUI")
+    parser.add_argument("--host", type=str, default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--model", type=str, help="Path to AgentCPM-GUI model", default="model/AgentCPM-GUI")
+    parser.add_argument("--device-gpu", type=str, help="GPU device to use", default="cuda:0")
+    parser.add_argument("--device", type=str, action="append", default=[], help="Device ID to register at startup, can be repeated")
+    parser.add_argument("--resize-policy", type=str, default="legacy", help="Screenshot resize policy")
+    parser.add_argument("--strict-actions", action="store_true", help="Treat actions violating the schema as invalid instead of executing them")
+    parser.add_argument("--max-concurrency", type=int, default=1, help="Concurrent model requests")
+    parser.add_argument("--max-queue", type=int, default=16, help="Pending requests before returning 503")
+    parser.add_argument("--max-sessions", type=int, default=1024)
+    parser.add_argument("--session-ttl", type=float, default=1800, help="Seconds before an idle session is dropped")
+    parser.add_argument("--max-history-turns", type=int, default=8, help="Conversation turns kept per session")
+    args = parser.parse_args()
+
+    agent = AgentCPMController(args.model, args.device_gpu, resize_policy=args.resize_policy, strict_actions=args.strict_actions)
+    sessions = SessionStore(args.max_sessions, args.session_ttl, args.max_history_turns)
+    devices = {device_id: UIAutomatorController(device_id) for device_id in args.device}
+
+    gate = RequestGate(args.max_concurrency, args.max_queue)
+    app = create_app(agent, sessions, gate, devices)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
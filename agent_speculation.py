@@ -0,0 +1,132 @@
+"""
+Speculative Next-Screen Inference
+=================================
+
+执行确定性动作（PRESS BACK / HOME，或 TYPE 之后的 PRESS ENTER）后，下一屏幕通常在动作下发后很快就已确定。
+SpeculativeExecutor 在动作执行后立即截图并在后台线程中启动模型推理，与等待 UI 稳定（settle）的时间重叠；
+UI 稳定后再截一次图，用低分辨率灰度帧差确认两帧一致：
+- 一致（命中）: 直接复用推测结果，并把推测期间产生的对话历史合并回控制器
+- 不一致或推测失败（未命中）: 丢弃推测结果，按原流程对稳定后的截图重新推理
+
+指标（见 agent_metrics.py）:
+- agent_speculation_total{result="hit|miss|failed"}: 推测结果分布
+- agent_speculation_wasted_seconds_total: 被丢弃的推测所消耗的推理时间
+- agent_speculation_frame_diff: 推测帧与稳定帧的帧差分布
+
+推测执行中的截图和推理阶段记为 `agent_stage_seconds{speculative="true"}`（见 `capture`），每步的正常阶段只记录一次。
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageChops, ImageStat
+
+from agent_metrics import REGISTRY
+
+# 帧差直方图分桶（0~1，灰度平均绝对差 / 255）
+FRAME_DIFF_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+
+
+def frame_diff(a, b, size=(64, 128)):
+    """两帧缩小为灰度小图后的平均绝对差，范围 0~1。"""
+    a = a.convert("L").resize(size, resample=Image.Resampling.BOX)
+    b = b.convert("L").resize(size, resample=Image.Resampling.BOX)
+    return ImageStat.Stat(ImageChops.difference(a, b)).mean[0] / 255.0
+
+
+def is_deterministic(action, prev_action=None):
+    """下一屏幕可由动作本身确定的动作：BACK / HOME，以及紧跟在 TYPE 之后的 ENTER。"""
+    if action is None or action.status != "continue":
+        return False
+    if action.press in ("BACK", "HOME"):
+        return True
+    return action.press == "ENTER" and prev_action is not None and prev_action.text is not None
+
+
+def capture(ui_controller):
+    """推测用的截图，阶段耗时记在 speculative 标签下。"""
+    with REGISTRY.scope(speculative="true"):
+        return ui_controller.take_screenshot()
+
+
+class SpeculativeExecutor:
+    def __init__(self, agent_controller, threshold=0.01):
+        self.agent_controller = agent_controller
+        self.threshold = threshold
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="speculate")
+        self._pending = None
+        self._results = REGISTRY.counter("speculation_total", "Speculative inferences by result.")
+        self._wasted = REGISTRY.counter("speculation_wasted_seconds_total", "Model time spent on discarded speculative inferences.")
+        self._saved = REGISTRY.counter("speculation_saved_seconds_total", "Model time reused from speculative inferences.")
+        self._diff = REGISTRY.histogram("speculation_frame_diff", "Frame difference between speculative and settled screenshots.", buckets=FRAME_DIFF_BUCKETS)
+
+    @property
+    def pending(self):
+        return self._pending is not None
+
+    def _run(self, frame, instruction, history):
+        start = time.perf_counter()
+        with REGISTRY.scope(speculative="true"):
+            action = self.agent_controller.get_action(frame, instruction, history)
+        return action, time.perf_counter() - start
+
+    def start(self, frame, instruction):
+        """对动作执行后立即截取的画面启动后台推理，使用对话历史的副本，不影响控制器状态。"""
+        self.cancel()
+        # 截图是惰性加载的，先读入内存，避免文件被下一次截图覆盖
+        frame.load()
+        base_history = list(self.agent_controller.conversation_history)
+        history = list(base_history)
+        future = self._pool.submit(self._run, frame, instruction, history)
+        self._pending = (frame, instruction, base_history, history, future)
+
+    def resolve(self, settled_frame, instruction):
+        """用稳定后的截图确认推测结果；命中时返回动作，否则返回 None，由调用方重新推理。"""
+        if self._pending is None:
+            return None
+        frame, spec_instruction, base_history, history, future = self._pending
+        self._pending = None
+        try:
+            action, elapsed = future.result()
+        except Exception as e:
+            print(f"Speculative inference failed: {e}")
+            action, elapsed = None, 0.0
+
+        if action is None:
+            self._results.inc(result="failed")
+            self._wasted.inc(elapsed)
+            return None
+        diff = frame_diff(frame, settled_frame)
+        self._diff.observe(diff)
+        if diff > self.threshold or spec_instruction != instruction \
+                or list(self.agent_controller.conversation_history) != base_history:
+            self._results.inc(result="miss")
+            self._wasted.inc(elapsed)
+            return None
+
+        self._results.inc(result="hit")
+        self._saved.inc(elapsed)
+        self.agent_controller.conversation_history.extend(history[len(base_history):])
+        return action
+
+    def cancel(self):
+        """放弃尚未确认的推测（例如任务结束）。"""
+        if self._pending is None:
+            return
+        future = self._pending[-1]
+        self._pending = None
+        try:
+            _, elapsed = future.result()
+        except Exception:
+            elapsed = 0.0
+        self._results.inc(result="miss")
+        self._wasted.inc(elapsed)
+
+    def hit_rate(self):
+        hits = self._results.value(result="hit")
+        total = hits + self._results.value(result="miss") + self._results.value(result="failed")
+        return hits / total if total else None
+
+    def shutdown(self):
+        self.cancel()
+        self._pool.shutdown(wait=True)
@@ -0,0 +1,110 @@
+"""
+Micro-benchmark: parse + validate cost per action.
+
+Compares the previous path (`json.loads` + `jsonschema.validate`, and `json5.loads` + `jsonschema.validate`
+as used by the RFT reward) with the compiled validator in `eval/utils/action_parser.py`.
+
+Usage:
+    python benchmarks/bench_action_parse.py --repeat 20000
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from eval.utils.action_parser import compile_validator, try_load_action
+
+SAMPLES = [
+    '{"thought":"点击会员按钮进入会员页面","POINT":[729,69]}',
+    '{"thought":"向上滑动查看更多内容","POINT":[500,700],"to":"up","duration":300}',
+    '{"POINT":[500,500],"to":[120,860]}',
+    '{"thought":"返回上一页","PRESS":"BACK"}',
+    '{"thought":"输入搜索内容","TYPE":"周杰伦的歌"}',
+    '{"duration":3000}',
+    '{"thought":"任务已完成","STATUS":"finish"}',
+    '{"POINT":[1500,300]}',
+    '{"POINT":[500,300],"PRESS":"HOME"}',
+    '{"PRESS":"home"}',
+    'not a json',
+]
+
+
+def bench(name, fn, repeat):
+    # warm up
+    for s in SAMPLES:
+        fn(s)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for s in SAMPLES:
+            fn(s)
+    elapsed = time.perf_counter() - start
+    per_action = elapsed / (repeat * len(SAMPLES)) * 1e6
+    print(f"{name:<40} {per_action:8.2f} us/action")
+    return per_action
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark action parse + validate")
+    parser.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args()
+
+    results = {}
+    for schema_file in ["schema.json", "schema_for_extraction.json"]:
+        schema = json.load(open(os.path.join(REPO_ROOT, "eval/utils/schema", schema_file), encoding="utf-8"))
+        validator = compile_validator(schema)
+        print(f"== {schema_file} ==")
+
+        results[(schema_file, "compiled")] = bench("json.loads + compiled validator", lambda s: try_load_action(s, validator), args.repeat)
+
+        try:
+            import jsonschema
+        except ImportError:
+            print("jsonschema not installed, skip baseline")
+            continue
+
+        def baseline(s):
+            try:
+                jsonschema.validate(json.loads(s), schema)
+            except Exception:
+                pass
+
+        draft = jsonschema.validators.validator_for(schema)(schema)
+
+        def precompiled(s):
+            try:
+                draft.validate(json.loads(s))
+            except Exception:
+                pass
+
+        results[(schema_file, "jsonschema")] = bench("json.loads + jsonschema.validate", baseline, args.repeat // 10)
+        results[(schema_file, "precompiled")] = bench("json.loads + jsonschema Validator", precompiled, args.repeat // 10)
+
+        try:
+            import json5
+        except ImportError:
+            continue
+
+        def reward_baseline(s):
+            try:
+                jsonschema.validate(json5.loads(s, allow_duplicate_keys=False), schema)
+            except Exception:
+                pass
+        bench("json5.loads + jsonschema.validate", reward_baseline, max(args.repeat // 100, 1))
+
+        # sanity check: both validators agree on every sample
+        for s in SAMPLES:
+            try:
+                data = json.loads(s)
+            except ValueError:
+                continue
+            assert validator.is_valid(data) == draft.is_valid(data), s
+        print(f"speedup vs jsonschema.validate: {results[(schema_file, 'jsonschema')] / results[(schema_file, 'compiled')]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Micro-benchmark: screenshot resize cost and visual-token count per resize policy.
+
+For every policy in `eval/utils/resize_policy.py` this measures the time of the policy resize plus the
+processor's slice resize (BICUBIC to the refine size, as in `slice_image`), and reports the number of visual
+query tokens the resulting image produces.
+
+Usage:
+    python benchmarks/bench_resize_policy.py --repeat 20
+    python benchmarks/bench_resize_policy.py --image path/to/screenshot.png
+"""
+
+import os
+import sys
+import time
+import argparse
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from PIL import Image
+
+from eval.utils.resize_policy import ResizePolicy, slice_plan, visual_token_count
+
+# common phone screenshot resolutions
+SIZES = [(1080, 2400), (1080, 1920), (1440, 3200), (720, 1600), (2400, 1080)]
+
+
+def processor_resize(img, policy):
+    # the resize done by `slice_image` on the refined image; a no-op copy if the size already matches
+    _, grid, refine_size = slice_plan(img.size, policy.max_slice_nums, policy.scale_resolution, policy.patch_size)
+    if grid is None:
+        return img
+    return img.resize(refine_size, Image.Resampling.BICUBIC)
+
+
+def bench(policy, img, repeat):
+    policy(img)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        resized = policy(img)
+    policy_ms = (time.perf_counter() - start) / repeat * 1e3
+    start = time.perf_counter()
+    for _ in range(repeat):
+        processor_resize(resized, policy)
+    processor_ms = (time.perf_counter() - start) / repeat * 1e3
+    return resized.size, policy_ms, processor_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark screenshot resize policies")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--image", type=str, default=None, help="Benchmark a real screenshot instead of synthetic sizes")
+    args = parser.parse_args()
+
+    if args.image:
+        images = [Image.open(args.image).convert("RGB")]
+    else:
+        # noise defeats any shortcut a resampler could take on flat colors
+        images = [Image.effect_noise(size, 64).convert("RGB") for size in SIZES]
+
+    print(f"{'input':>10} {'policy':>8} {'output':>10} {'policy ms':>10} {'slice ms':>9} {'total ms':>9} {'tokens':>7}")
+    for img in images:
+        for name in sorted(ResizePolicy.PRESETS):
+            policy = ResizePolicy.from_name(name)
+            size, policy_ms, processor_ms = bench(policy, img, args.repeat)
+            tokens = visual_token_count(size, max_slice_nums=policy.max_slice_nums,
+                                        scale_resolution=policy.scale_resolution, patch_size=policy.patch_size)
+            print(f"{'%dx%d' % img.size:>10} {name:>8} {'%dx%d' % size:>10} {policy_ms:10.2f} {processor_ms:9.2f} "
+                  f"{policy_ms + processor_ms:9.2f} {tokens:7d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,12 +5,13 @@ os.chdir(os.path.dirname(os.path.abspath(__file__)))
 import json
 import torch
 import random
-import jsonschema
 from tqdm import tqdm
 from transformers import AutoTokenizer,AutoModelForCausalLM
 from concurrent.futures import ProcessPoolExecutor,as_completed,ThreadPoolExecutor
 from PIL import Image
 from utils.utils import get_dataset_dir
+from utils.action_parser import compile_validator
+from utils.resize_policy import DEFAULT_RESIZE_POLICY, ResizePolicy
 import argparse
 import logging
 import time
@@ -48,6 +49,7 @@ SYSTEM_PROMPT = f'''# Role
 {json.dumps(ACTION_SCHEMA, indent=None, ensure_ascii=False, separators=(',', ':'))}'''
 
 EXTRACT_SCHEMA = json.load(open(os.path.join(current_dir, 'utils/schema', 'schema_for_extraction.json'), encoding="utf-8"))
+EXTRACT_VALIDATOR = compile_validator(EXTRACT_SCHEMA)
 
 
 _llm = None
@@ -80,34 +82,19 @@ def run_episode(episode, msg,):
 def extract_and_validate_json(input_string):
     try:
         json_obj = json.loads(input_string)
-        jsonschema.validate(json_obj, EXTRACT_SCHEMA)
-        return json_obj
     except json.JSONDecodeError as e:
         print("Error, JSON is NOT valid.")
         return input_string
-    except Exception as e:
-        print(f"Error, JSON is NOT valid according to the schema.{input_string}", e)
+    err = EXTRACT_VALIDATOR.error(json_obj)
+    if err is not None:
+        print(f"Error, JSON is NOT valid according to the schema.{input_string}", err)
         return input_string
+    return json_obj
 
-def load_image(episode, image_path, data_name):
-    # resize the image proportionally so that the longer side is at most 1120
-    def __resize__(origin_img):
-        resolution = origin_img.size
-        w,h = resolution
-        max_line_res = 1120
-        if max_line_res is not None:
-            max_line = max_line_res
-            if h > max_line:
-                w = int(w * max_line / h)
-                h = max_line
-            if w > max_line:
-                h = int(h * max_line / w)
-                w = max_line
-        img = origin_img.resize((w,h),resample=Image.Resampling.LANCZOS)
-        return img
-
+def load_image(episode, image_path, data_name, resize_policy=DEFAULT_RESIZE_POLICY):
+    # resize the image proportionally so that the longer side is at most 1120, see utils/resize_policy.py
     image = Image.open(image_path).convert("RGB")
-    image = __resize__(image)
+    image = resize_policy(image)
 
     if data_name == 'android_control_low_test':
         query = episode['low_instruction']
@@ -131,6 +118,7 @@ def predict(args):
     args.data_dir, args.split, data_subset = get_dataset_dir(args.data_name)
     print(f"Predicting on: {args.data_dir}/{args.split}")
     print(f"Data subset: {data_subset}")
+    resize_policy = ResizePolicy.from_name(args.resize_policy)
 
     if multiprocessing.get_start_method(allow_none=True) != "spawn":
         multiprocessing.set_start_method("spawn", force=True)
@@ -178,7 +166,7 @@ def predict(args):
                             image_path = image_path.replace(".jpeg", ".png")
                             if not os.path.exists(image_path):
                                 image_path = episode['image_path']
-                        future.append(executor.submit(load_image, episode, image_path, args.data_name))
+                        future.append(executor.submit(load_image, episode, image_path, args.data_name, resize_policy))
 
                 for f in as_completed(future):
                     all_tasks.append(f.result())
@@ -211,6 +199,7 @@ if __name__ == "__main__":
     parser.add_argument("--model_path", type=str, required=True, help="Model path")
     parser.add_argument("--output_dir", type=str, required=True, help="Directory to save results")
     parser.add_argument("--data_name", type=str, required=True, choices=['gui_odyssey_test', 'chinese_app_test', 'aitz_test', 'android_control_high_test', 'android_control_low_test'], help="Eval dataset name")
+    parser.add_argument("--resize_policy", type=str, default="legacy", choices=sorted(ResizePolicy.PRESETS), help="Screenshot resize policy")
     args = parser.parse_args()
     random.seed(args.seed)
 
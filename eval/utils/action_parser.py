@@ -0,0 +1,383 @@
+"""Fast action parsing shared by the runtime, the evaluator and the RFT reward functions.
+
+`compile_validator` turns the action JSON schema (`schema/schema.json`, `schema/schema_for_extraction.json`
+or the `SCHEMA` dict used in RFT) into a tree of plain Python checks once, so validating a step costs a few
+dict lookups instead of a full `jsonschema.validate` call. Only the keywords used by our action schemas are
+supported; compiling a schema with any other validation keyword raises `NotImplementedError`.
+
+`Action` is the typed representation of a single validated action.
+"""
+
+import os
+import json
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, Union
+
+current_file_path = os.path.abspath(__file__)
+schema_dir = os.path.join(os.path.dirname(current_file_path), 'schema')
+
+
+class ValidationError(ValueError):
+    """The instance does not satisfy the compiled schema."""
+
+
+# keywords that only annotate the schema and never affect validation
+_ANNOTATIONS = {"description", "default", "title", "examples", "optional", "$defs", "definitions", "$schema", "$id", "$comment"}
+
+_TYPE_CHECKS = {
+    "object": lambda x: isinstance(x, dict),
+    "array": lambda x: isinstance(x, list),
+    "string": lambda x: isinstance(x, str),
+    "null": lambda x: x is None,
+    "boolean": lambda x: isinstance(x, bool),
+    "integer": lambda x: (isinstance(x, int) and not isinstance(x, bool)) or (isinstance(x, float) and x.is_integer()),
+    "number": lambda x: isinstance(x, (int, float)) and not isinstance(x, bool),
+}
+
+
+def _equal(a, b):
+    # JSON semantics: true != 1
+    if isinstance(a, bool) or isinstance(b, bool):
+        return type(a) is type(b) and a == b
+    return a == b
+
+
+class _Compiler:
+    def __init__(self, root: dict):
+        self.root = root
+        self.refs = {}
+
+    def resolve(self, ref: str):
+        if ref in self.refs:
+            return self.refs[ref]
+        if not ref.startswith("#/"):
+            raise NotImplementedError(f"Only local $ref is supported, got {ref}")
+        target = self.root
+        for part in ref[2:].split("/"):
+            target = target[part]
+        # register a trampoline first so that recursive references terminate
+        holder = []
+        self.refs[ref] = lambda x: holder[0](x)
+        holder.append(self.compile(target))
+        self.refs[ref] = holder[0]
+        return holder[0]
+
+    def compile(self, schema) -> Callable[[Any], Optional[str]]:
+        if schema is True or schema == {}:
+            return lambda x: None
+        if schema is False:
+            return lambda x: "False schema does not allow any value"
+
+        checks = []
+        for key, value in schema.items():
+            if key in _ANNOTATIONS:
+                continue
+            builder = getattr(self, "_kw_" + key.lstrip("$"), None)
+            if builder is None:
+                raise NotImplementedError(f"Unsupported schema keyword: {key}")
+            check = builder(value, schema)
+            if check is not None:
+                checks.append(check)
+
+        if len(checks) == 1:
+            return checks[0]
+
+        def run_all(x):
+            for check in checks:
+                err = check(x)
+                if err is not None:
+                    return err
+            return None
+        return run_all
+
+    # ---- keywords ----
+    def _kw_ref(self, ref, schema):
+        target = self.resolve(ref)
+        return lambda x: target(x)
+
+    def _kw_type(self, types, schema):
+        if isinstance(types, str):
+            check_type = _TYPE_CHECKS[types]
+            return lambda x: None if check_type(x) else f"{x!r} is not of type '{types}'"
+        type_checks = [_TYPE_CHECKS[t] for t in types]
+        return lambda x: None if any(c(x) for c in type_checks) else f"{x!r} is not of type {types}"
+
+    def _kw_enum(self, options, schema):
+        hashable = all(isinstance(o, str) for o in options)
+        if hashable:
+            option_set = frozenset(options)
+            return lambda x: None if isinstance(x, str) and x in option_set else f"{x!r} is not one of {options}"
+        return lambda x: None if any(_equal(x, o) for o in options) else f"{x!r} is not one of {options}"
+
+    def _kw_const(self, const, schema):
+        return lambda x: None if _equal(x, const) else f"{const!r} was expected"
+
+    def _kw_minimum(self, bound, schema):
+        return lambda x: f"{x!r} is less than the minimum of {bound}" if _TYPE_CHECKS["number"](x) and x < bound else None
+
+    def _kw_maximum(self, bound, schema):
+        return lambda x: f"{x!r} is greater than the maximum of {bound}" if _TYPE_CHECKS["number"](x) and x > bound else None
+
+    def _kw_minItems(self, bound, schema):
+        return lambda x: f"{x!r} should be non-empty" if isinstance(x, list) and len(x) < bound else None
+
+    def _kw_maxItems(self, bound, schema):
+        return lambda x: f"{x!r} is too long" if isinstance(x, list) and len(x) > bound else None
+
+    def _kw_items(self, item_schema, schema):
+        check = self.compile(item_schema)
+
+        def check_items(x):
+            if not isinstance(x, list):
+                return None
+            for item in x:
+                err = check(item)
+                if err is not None:
+                    return err
+            return None
+        return check_items
+
+    def _kw_required(self, required, schema):
+        required = tuple(required)
+
+        def check_required(x):
+            if not isinstance(x, dict):
+                return None
+            for key in required:
+                if key not in x:
+                    return f"'{key}' is a required property"
+            return None
+        return check_required
+
+    def _kw_properties(self, properties, schema):
+        checks = {key: self.compile(sub) for key, sub in properties.items()}
+
+        def check_properties(x):
+            if not isinstance(x, dict):
+                return None
+            for key, value in x.items():
+                check = checks.get(key)
+                if check is not None:
+                    err = check(value)
+                    if err is not None:
+                        return err
+            return None
+        return check_properties
+
+    def _kw_additionalProperties(self, additional, schema):
+        known = frozenset(schema.get("properties", {}))
+        if additional is False:
+            def check_additional(x):
+                if not isinstance(x, dict):
+                    return None
+                extra = [key for key in x if key not in known]
+                if extra:
+                    return f"Additional properties are not allowed ({', '.join(map(repr, extra))} unexpected)"
+                return None
+            return check_additional
+        check = self.compile(additional)
+
+        def check_additional_schema(x):
+            if not isinstance(x, dict):
+                return None
+            for key, value in x.items():
+                if key not in known:
+                    err = check(value)
+                    if err is not None:
+                        return err
+            return None
+        return check_additional_schema
+
+    def _kw_allOf(self, subschemas, schema):
+        checks = [self.compile(sub) for sub in subschemas]
+
+        def check_all(x):
+            for check in checks:
+                err = check(x)
+                if err is not None:
+                    return err
+            return None
+        return check_all
+
+    def _kw_anyOf(self, subschemas, schema):
+        checks = [self.compile(sub) for sub in subschemas]
+        return lambda x: None if any(check(x) is None for check in checks) else f"{x!r} is not valid under any of the given schemas"
+
+    def _kw_oneOf(self, subschemas, schema):
+        checks = [self.compile(sub) for sub in subschemas]
+
+        def check_one(x):
+            matched = 0
+            for check in checks:
+                if check(x) is None:
+                    matched += 1
+                    if matched > 1:
+                        return f"{x!r} is valid under each of more than one given schemas"
+            return None if matched == 1 else f"{x!r} is not valid under any of the given schemas"
+        return check_one
+
+    def _kw_not(self, subschema, schema):
+        check = self.compile(subschema)
+        return lambda x: f"{x!r} should not be valid under {subschema}" if check(x) is None else None
+
+    def _kw_if(self, if_schema, schema):
+        check_if = self.compile(if_schema)
+        check_then = self.compile(schema["then"]) if "then" in schema else None
+        check_else = self.compile(schema["else"]) if "else" in schema else None
+
+        def check_condition(x):
+            if check_if(x) is None:
+                return None if check_then is None else check_then(x)
+            return None if check_else is None else check_else(x)
+        return check_condition
+
+    def _kw_then(self, then_schema, schema):
+        # handled together with `if`
+        return None
+
+    def _kw_else(self, else_schema, schema):
+        return None
+
+
+class CompiledValidator:
+    """A schema compiled into plain Python checks."""
+
+    def __init__(self, schema: dict):
+        self.schema = schema
+        self._check = _Compiler(schema).compile(schema)
+        properties = schema.get("properties", {})
+        self.defaults = {key: sub["default"] for key, sub in properties.items() if isinstance(sub, dict) and "default" in sub}
+
+    def error(self, instance) -> Optional[str]:
+        """Return the first validation error message, or `None` if the instance is valid."""
+        return self._check(instance)
+
+    def is_valid(self, instance) -> bool:
+        return self._check(instance) is None
+
+    def validate(self, instance):
+        err = self._check(instance)
+        if err is not None:
+            raise ValidationError(err)
+
+
+def compile_validator(schema: Union[dict, str]) -> CompiledValidator:
+    """Compile a schema dict, or the name of a file under `schema/`, into a `CompiledValidator`."""
+    if isinstance(schema, str):
+        with open(os.path.join(schema_dir, schema), encoding="utf-8") as f:
+            schema = json.load(f)
+    return CompiledValidator(schema)
+
+
+@dataclass(init=False)
+class Action:
+    """A single validated GUI action in the compact model output format.
+
+    Coordinates are kept as lists in the 0-1000 relative space; `duration` is `None` when the model did not
+    specify one (use `duration_or` to apply the schema default).
+    """
+    # explicit __slots__ instead of `dataclass(slots=True)` (Python 3.10+); slotted fields cannot have
+    # class-level defaults, so the defaults live in __init__
+    __slots__ = ("thought", "point", "to", "duration", "press", "text", "deep_link", "clear", "status")
+    thought: Optional[str]
+    point: Optional[list]
+    to: Optional[Union[str, list]]
+    duration: Optional[int]
+    press: Optional[str]
+    text: Optional[str]
+    deep_link: bool
+    clear: bool
+    status: str
+
+    def __init__(self, thought: Optional[str] = None, point: Optional[list] = None,
+                 to: Optional[Union[str, list]] = None, duration: Optional[int] = None, press: Optional[str] = None,
+                 text: Optional[str] = None, deep_link: bool = False, clear: bool = False, status: str = "continue"):
+        self.thought = thought
+        self.point = point
+        self.to = to
+        self.duration = duration
+        self.press = press
+        self.text = text
+        self.deep_link = deep_link
+        self.clear = clear
+        self.status = status
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Action":
+        return cls(
+            thought=data.get("thought"),
+            point=data.get("POINT"),
+            to=data.get("to"),
+            duration=data.get("duration"),
+            press=data.get("PRESS"),
+            text=data.get("TYPE"),
+            deep_link="DEEP_LINK" in data,
+            clear="CLEAR" in data,
+            status=data.get("STATUS", "continue"),
+        )
+
+    def to_dict(self) -> dict:
+        """Convert back to the model output format, keeping only the fields that are present."""
+        d = {}
+        if self.thought is not None:
+            d["thought"] = self.thought
+        if self.point is not None:
+            d["POINT"] = self.point
+        if self.to is not None:
+            d["to"] = self.to
+        if self.duration is not None:
+            d["duration"] = self.duration
+        if self.press is not None:
+            d["PRESS"] = self.press
+        if self.text is not None:
+            d["TYPE"] = self.text
+        if self.deep_link:
+            d["DEEP_LINK"] = None
+        if self.clear:
+            d["CLEAR"] = None
+        if self.status != "continue":
+            d["STATUS"] = self.status
+        return d
+
+    def duration_or(self, default: int = 200) -> int:
+        return default if self.duration is None else self.duration
+
+
+def _reject_duplicate_keys(pairs):
+    d = {}
+    for key, value in pairs:
+        if key in d:
+            raise ValueError(f"Duplicate key {key!r}")
+        d[key] = value
+    return d
+
+
+def loads_action_json(content: Union[str, bytes]) -> Any:
+    """`json.loads` that rejects duplicated keys, matching `json5.loads(..., allow_duplicate_keys=False)` on strict JSON."""
+    return json.loads(content, object_pairs_hook=_reject_duplicate_keys)
+
+
+def try_load_action(content: Union[str, bytes, dict], validator: CompiledValidator) -> tuple[Optional[Action], Optional[str]]:
+    """Parse and validate a model output without raising.
+
+    Returns `(action, None)` on success and `(None, error_message)` otherwise.
+    """
+    if isinstance(content, dict):
+        data = content
+    else:
+        try:
+            data = loads_action_json(content)
+        except ValueError as e:
+            return None, f"Invalid JSON: {e}"
+    err = validator.error(data)
+    if err is not None:
+        return None, err
+    return Action.from_dict(data), None
+
+
+def load_action(content: Union[str, bytes, dict], validator: CompiledValidator) -> Action:
+    """Parse and validate a model output, raising `ValueError`/`ValidationError` on failure."""
+    action, err = try_load_action(content, validator)
+    if action is None:
+        raise ValidationError(err)
+    return action
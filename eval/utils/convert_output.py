@@ -1,14 +1,15 @@
 import json
 import os
-import jsonschema
 from concurrent.futures import ProcessPoolExecutor, as_completed
 from tqdm import tqdm
+from utils.action_parser import Action, compile_validator
 
 
 # Get the absolute path of the current file
 current_file_path = os.path.abspath(__file__)
 schema_dir = os.path.dirname(os.path.dirname(current_file_path))
 EXTRACT_SCHEMA = json.load(open(os.path.join(schema_dir, 'utils/schema', 'schema_for_extraction.json'), encoding="utf-8"))
+EXTRACT_VALIDATOR = compile_validator(EXTRACT_SCHEMA)
 
 
 def load_json_data(file_path):
@@ -36,26 +37,29 @@ def load_json_data(file_path):
 
 def parse_action(data):
     try:
-        jsonschema.validate(data, EXTRACT_SCHEMA)
+        EXTRACT_VALIDATOR.validate(data)
+        action = Action.from_dict(data)
         
         actions = {}
         parameters = {}
-        status = data.get("STATUS", "continue")  # Default value
+        status = action.status
 
-        # Define actions
-        action_keys = ["POINT", "to", "PRESS", "TYPE"]
-        
         # Extract actions
-        for key in action_keys:
-            if key in data:
-                actions[key] = data[key]
+        if action.point is not None:
+            actions["POINT"] = action.point
+        if action.to is not None:
+            actions["to"] = action.to
+        if action.press is not None:
+            actions["PRESS"] = action.press
+        if action.text is not None:
+            actions["TYPE"] = action.text
         
         # Extract global parameters
-        parameters["duration"] = data.get("duration", EXTRACT_SCHEMA["properties"]["duration"]["default"])
+        parameters["duration"] = action.duration_or(EXTRACT_VALIDATOR.defaults["duration"])
 
         # Handle "to" parameter, if present
-        if "to" in data:
-            parameters["to"] = data["to"]
+        if action.to is not None:
+            parameters["to"] = action.to
             
         return actions, parameters, status
 
@@ -0,0 +1,175 @@
+"""Screenshot resize policies shared by the runtime, the evaluator and SFT.
+
+Every entry point used to carry its own copy of `__resize__`: scale the long edge down to 1120 px with LANCZOS.
+The MiniCPM-V image processor then slices the screenshot and resizes it a second time, so that each slice is
+close to `scale_resolution`^2 pixels and divisible by the 14 px vision patch.
+
+A `ResizePolicy` makes both choices configurable:
+
+- `resample`: the PIL resampler (`lanczos`, `bicubic`, `bilinear`, `box`, `hamming`, `nearest`); `reducing_gap`
+  enables PIL's two-step reduce for large downscales.
+- `align`:
+    - `None`: keep the legacy size (long edge clamped to `max_line_res`).
+    - `"patch"`: round both sides down to a multiple of `patch_size`.
+    - `"slice"`: output exactly the refine size that `slice_image` would compute for the legacy size, so the
+      processor's slice resize becomes a no-op.
+
+Presets are available through `ResizePolicy.from_name`; `"legacy"` reproduces the previous behaviour bit for bit.
+"""
+
+import math
+from dataclasses import dataclass, replace
+from typing import Optional
+
+from PIL import Image
+
+RESAMPLERS = {
+    "lanczos": Image.Resampling.LANCZOS,
+    "bicubic": Image.Resampling.BICUBIC,
+    "bilinear": Image.Resampling.BILINEAR,
+    "hamming": Image.Resampling.HAMMING,
+    "box": Image.Resampling.BOX,
+    "nearest": Image.Resampling.NEAREST,
+}
+
+
+# ---- size-only mirror of MiniCPM-V's `slice_image` (see sft/dataset.py) ----
+def ensure_divide(length, patch_size):
+    return max(round(length / patch_size) * patch_size, patch_size)
+
+
+def find_best_resize(original_size, scale_resolution, patch_size, allow_upscale=False):
+    width, height = original_size
+    if (width * height > scale_resolution * scale_resolution) or allow_upscale:
+        r = width / height
+        height = int(scale_resolution / math.sqrt(r))
+        width = int(height * r)
+    best_width = ensure_divide(width, patch_size)
+    best_height = ensure_divide(height, patch_size)
+    return (best_width, best_height)
+
+
+def get_refine_size(original_size, grid, scale_resolution, patch_size, allow_upscale=False):
+    width, height = original_size
+    grid_x, grid_y = grid
+
+    refine_width = ensure_divide(width, grid_x)
+    refine_height = ensure_divide(height, grid_y)
+
+    grid_width = refine_width / grid_x
+    grid_height = refine_height / grid_y
+
+    best_grid_size = find_best_resize(
+        (grid_width, grid_height),
+        scale_resolution,
+        patch_size,
+        allow_upscale=allow_upscale,
+    )
+    return (best_grid_size[0] * grid_x, best_grid_size[1] * grid_y)
+
+
+def slice_plan(size, max_slice_nums=9, scale_resolution=448, patch_size=14, never_split=False):
+    """Return `(source_size, grid, refine_size)` that `slice_image` would use for an image of `size`.
+
+    `grid` and `refine_size` are `None` when the image is not split.
+    """
+    width, height = size
+    log_ratio = math.log(width / height)
+    ratio = width * height / (scale_resolution * scale_resolution)
+    multiple = min(math.ceil(ratio), max_slice_nums)
+
+    if multiple <= 1 or never_split:
+        return find_best_resize(size, scale_resolution, patch_size, allow_upscale=True), None, None
+
+    candidate_split_grids_nums = [i for i in [multiple - 1, multiple, multiple + 1] if i != 1 and i <= max_slice_nums]
+    candidate_grids = []
+    for split_grids_nums in candidate_split_grids_nums:
+        m = 1
+        while m <= split_grids_nums:
+            if split_grids_nums % m == 0:
+                candidate_grids.append([m, split_grids_nums // m])
+            m += 1
+
+    best_grid = [1, 1]
+    min_error = float("inf")
+    for grid in candidate_grids:
+        error = abs(log_ratio - math.log(grid[0] / grid[1]))
+        if error < min_error:
+            best_grid = grid
+            min_error = error
+
+    refine_size = get_refine_size(size, best_grid, scale_resolution, patch_size, allow_upscale=True)
+    return find_best_resize(size, scale_resolution, patch_size), best_grid, refine_size
+
+
+def visual_token_count(size, query_num=64, max_slice_nums=9, scale_resolution=448, patch_size=14):
+    """Number of visual query tokens the resampler emits for one image of `size`."""
+    _, grid, _ = slice_plan(size, max_slice_nums, scale_resolution, patch_size)
+    num_slices = 0 if grid is None else grid[0] * grid[1]
+    return (1 + num_slices) * query_num
+
+
+@dataclass(frozen=True)
+class ResizePolicy:
+    max_line_res: Optional[int] = 1120
+    resample: str = "lanczos"
+    reducing_gap: Optional[float] = None
+    align: Optional[str] = None
+    patch_size: int = 14
+    scale_resolution: int = 448
+    max_slice_nums: int = 9
+
+    PRESETS = {}
+
+    @classmethod
+    def from_name(cls, name: str, **overrides) -> "ResizePolicy":
+        if name not in cls.PRESETS:
+            raise ValueError(f"Unknown resize policy {name}, choose from {sorted(cls.PRESETS)}")
+        return replace(cls.PRESETS[name], **overrides)
+
+    def _clamp(self, size):
+        w, h = size
+        if self.max_line_res is not None:
+            max_line = self.max_line_res
+            if h > max_line:
+                w = int(w * max_line / h)
+                h = max_line
+            if w > max_line:
+                h = int(h * max_line / w)
+                w = max_line
+        return w, h
+
+    def target_size(self, size):
+        """Compute the output size for an image of `size` without touching pixels."""
+        w, h = self._clamp(size)
+        if self.align is None:
+            return w, h
+        if self.align == "patch":
+            return max(w // self.patch_size, 1) * self.patch_size, max(h // self.patch_size, 1) * self.patch_size
+        if self.align == "slice":
+            _, grid, refine_size = slice_plan((w, h), self.max_slice_nums, self.scale_resolution, self.patch_size)
+            if grid is None:
+                # not split: the processor rescales the whole image anyway, only keep it patch aligned
+                return ensure_divide(w, self.patch_size), ensure_divide(h, self.patch_size)
+            # the refine size must be a fixed point, otherwise the processor would pick another grid
+            _, new_grid, new_refine = slice_plan(refine_size, self.max_slice_nums, self.scale_resolution, self.patch_size)
+            if new_grid == grid and tuple(new_refine) == tuple(refine_size):
+                return tuple(refine_size)
+            return max(w // self.patch_size, 1) * self.patch_size, max(h // self.patch_size, 1) * self.patch_size
+        raise ValueError(f"Unknown align mode {self.align}")
+
+    def __call__(self, origin_img: Image.Image) -> Image.Image:
+        w, h = self.target_size(origin_img.size)
+        return origin_img.resize((w, h), resample=RESAMPLERS[self.resample], reducing_gap=self.reducing_gap)
+
+
+ResizePolicy.PRESETS.update({
+    # previous behaviour: LANCZOS, long edge 1120
+    "legacy": ResizePolicy(),
+    # cheaper resampler and patch aligned output
+    "fast": ResizePolicy(resample="bilinear", reducing_gap=2.0, align="patch"),
+    # resize once to the processor's refine size with the processor's resampler
+    "slice": ResizePolicy(resample="bicubic", reducing_gap=2.0, align="slice"),
+})
+
+DEFAULT_RESIZE_POLICY = ResizePolicy.PRESETS["legacy"]
@@ -0,0 +1,127 @@
+"""
+Load test for GlobalSyncManager: N simulated nodes each submitting M completions/sec.
+
+Modes:
+    req     one blocking REQ round trip per TaskStatus (the previous LocalBalanceManager behaviour)
+    dealer  AsyncStatusSender, pipelined with asynchronous acks, `--batch` TaskStatus per message
+
+Reports the completions/sec accepted by the coordinator and the p50/p99 time to submit one message.
+
+Usage (from the rft directory):
+    python benchmarks/bench_global_sync.py --nodes 8 --rate 0 --seconds 10 --mode req
+    python benchmarks/bench_global_sync.py --nodes 8 --rate 0 --seconds 10 --mode dealer --batch 32
+"""
+
+import os
+import sys
+import time
+import uuid
+import argparse
+import multiprocessing
+
+RFT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RFT_DIR)
+# trainer.utils uses the action schemas / validator in eval.utils at the repository root
+sys.path.append(os.path.dirname(RFT_DIR))
+
+import numpy as np
+import zmq
+
+from trainer.zmq import GlobalSyncManager, AsyncStatusSender, TaskStatus
+
+
+def run_coordinator(sync_address, collect_address, num_generations, num_nodes):
+    manager = GlobalSyncManager(
+        sync_address=sync_address,
+        collect_address=collect_address,
+        num_generations=num_generations,
+        num_to_sync=1 << 30,
+        num_nodes=num_nodes,
+    )
+    manager.start()
+
+
+def run_node(node_id, collect_address, mode, batch, rate, seconds, num_generations, results):
+    ctx = zmq.Context()
+    if mode == "req":
+        sock = ctx.socket(zmq.REQ)
+        sock.connect(collect_address)
+    else:
+        sender = AsyncStatusSender(ctx, collect_address)
+
+    per_message = batch if mode == "dealer" else 1
+    interval = per_message / rate if rate > 0 else 0.0
+    latencies = []
+    sent = 0
+    start = time.perf_counter()
+    next_send = start
+    while time.perf_counter() - start < seconds:
+        statuses = [
+            TaskStatus(task_id=node_id * 10**9 + (sent + i) // num_generations, completion_id=uuid.uuid4(), score=float(np.random.rand()))
+            for i in range(per_message)
+        ]
+        t0 = time.perf_counter()
+        if mode == "req":
+            sock.send_pyobj(statuses[0])
+            sock.recv()
+        else:
+            sender.send(statuses)
+        latencies.append(time.perf_counter() - t0)
+        sent += per_message
+        if interval:
+            next_send += interval
+            delay = next_send - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    if mode == "dealer":
+        sender.flush()
+    elapsed = time.perf_counter() - start
+    results.put((sent, elapsed, latencies))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the global sync coordinator")
+    parser.add_argument("--nodes", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=0, help="Completions/sec per node, 0 for as fast as possible")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--mode", choices=["req", "dealer"], default="dealer")
+    parser.add_argument("--batch", type=int, default=32, help="TaskStatus per message in dealer mode")
+    parser.add_argument("--num-generations", type=int, default=8)
+    parser.add_argument("--port", type=int, default=16000)
+    args = parser.parse_args()
+
+    sync_address = f"tcp://127.0.0.1:{args.port}"
+    collect_address = f"tcp://127.0.0.1:{args.port + 1}"
+    coordinator = multiprocessing.Process(
+        target=run_coordinator,
+        args=(sync_address, collect_address, args.num_generations, args.nodes),
+        daemon=True,
+    )
+    coordinator.start()
+    time.sleep(1)
+
+    results = multiprocessing.Queue()
+    nodes = [
+        multiprocessing.Process(
+            target=run_node,
+            args=(i, collect_address, args.mode, args.batch, args.rate, args.seconds, args.num_generations, results),
+        )
+        for i in range(args.nodes)
+    ]
+    for p in nodes:
+        p.start()
+    collected = [results.get() for _ in nodes]
+    for p in nodes:
+        p.join()
+    coordinator.terminate()
+
+    total = sum(sent for sent, _, _ in collected)
+    elapsed = max(e for _, e, _ in collected)
+    latencies = np.concatenate([np.array(l) for _, _, l in collected]) * 1e3
+    print(f"mode={args.mode} nodes={args.nodes} rate={args.rate or 'max'}/s batch={args.batch if args.mode == 'dealer' else 1}")
+    print(f"accepted {total} completions in {elapsed:.1f}s: {total / elapsed:.0f} completions/s")
+    print(f"submit latency per message: p50 {np.percentile(latencies, 50):.3f} ms  p99 {np.percentile(latencies, 99):.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark chunk reprocessing (`_process_inputs`: chat template, image slicing, tokenization) on CPU.
+
+Compares the single reprocess thread of LocalBalanceManager with ReprocessPool at several worker
+counts, on synthetic screenshots shaped like the GUI RFT dataset. Reports chunks/s for each.
+
+Usage (from the rft directory):
+    python benchmarks/bench_reprocess.py --processor openbmb/MiniCPM-V-2_6 --workers 1 2 4 8
+"""
+
+import os
+import sys
+import time
+import argparse
+
+RFT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RFT_DIR)
+# trainer.utils uses the action schemas / validator in eval.utils at the repository root
+sys.path.append(os.path.dirname(RFT_DIR))
+
+import numpy as np
+import torch
+from PIL import Image
+from transformers import AutoProcessor
+
+from trainer.utils import _process_inputs, ReprocessPool
+
+
+def make_task(index, width, height, completion_len, rng):
+    img = Image.fromarray(rng.integers(0, 255, (height, width, 3), dtype=np.uint8))
+    return {
+        "id": index,
+        "step_id": 0,
+        "prompt": [
+            {"role": "system", "content": "You are a GUI agent."},
+            {"role": "user", "content": ["<Question>Open the settings page</Question>\n当前屏幕截图：", img]},
+        ],
+        "completion_ids": torch.randint(0, 150000, (completion_len,)),
+        "advantage": float(rng.normal()),
+        "reward": float(rng.random()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark reprocess throughput versus worker count")
+    parser.add_argument("--processor", type=str, required=True, help="Processor name or path of the policy model")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--chunks", type=int, default=32)
+    parser.add_argument("--chunk-size", type=int, default=4)
+    parser.add_argument("--width", type=int, default=504)
+    parser.add_argument("--height", type=int, default=1120)
+    parser.add_argument("--completion-len", type=int, default=256)
+    parser.add_argument("--max-prompt-length", type=int, default=8192)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    chunks = [
+        [make_task(i * args.chunk_size + j, args.width, args.height, args.completion_len, rng) for j in range(args.chunk_size)]
+        for i in range(args.chunks)
+    ]
+
+    processor = AutoProcessor.from_pretrained(args.processor, trust_remote_code=True)
+    _process_inputs(chunks[0], processor, args.max_prompt_length)
+    start = time.perf_counter()
+    for inputs in chunks:
+        _process_inputs(inputs, processor, args.max_prompt_length)
+    base = args.chunks / (time.perf_counter() - start)
+    print(f"{'thread':<10} {base:8.2f} chunks/s")
+
+    for num_workers in args.workers:
+        pool = ReprocessPool(args.processor, args.max_prompt_length, num_workers)
+        # warm up: every worker loads its processor
+        for seq in range(num_workers):
+            pool.submit(seq, chunks[0])
+        for _ in range(num_workers):
+            pool.get()
+
+        start = time.perf_counter()
+        pending = 0
+        for seq, inputs in enumerate(chunks):
+            pool.submit(seq, inputs)
+            pending += 1
+            # drain as we go, the input queue is bounded
+            while pending > 2 * num_workers:
+                pool.get()
+                pending -= 1
+        for _ in range(pending):
+            pool.get()
+        rate = args.chunks / (time.perf_counter() - start)
+        pool.close()
+        print(f"{f'{num_workers} procs':<10} {rate:8.2f} chunks/s  ({rate / base:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Benchmark the 0MQ transports of the global endpoints on a single node.
+
+Runs a REQ/REP ping-pong between two processes, like a LocalBalanceManager talking to the
+GlobalSyncManager, over
+    tcp         loopback TCP with the 0MQ default socket options (the previous setup)
+    tcp-tuned   loopback TCP with the buffers / HWMs of `transport.tune_socket`
+    ipc         Unix domain socket, what `zmq_transport=auto` picks on a single node
+and reports the round-trip latency (p50 / p99) and throughput for each message size.
+
+Usage (from the rft directory):
+    python benchmarks/bench_transport.py
+    python benchmarks/bench_transport.py --sizes 64,65536 --repeat 5000
+    ZMQ_TCP_BUFFER_MB=16 python benchmarks/bench_transport.py --transports tcp,tcp-tuned
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import multiprocessing
+
+RFT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RFT_DIR)
+# trainer.utils uses the action schemas / validator in eval.utils at the repository root
+sys.path.append(os.path.dirname(RFT_DIR))
+
+import zmq
+
+from trainer.utils import transport
+
+
+def endpoint(name, port):
+    if name == "ipc":
+        return "ipc://" + os.path.join(tempfile.gettempdir(), f"arl_bench_transport_{port}")
+    return f"tcp://127.0.0.1:{port}"
+
+
+def echo_server(address, tuned, total):
+    ctx = zmq.Context()
+    rep = ctx.socket(zmq.REP)
+    if tuned:
+        transport.bind(rep, address)
+    else:
+        rep.bind(address)
+    for _ in range(total):
+        rep.send(rep.recv(copy=False), copy=False)
+    rep.close()
+    ctx.term()
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def run(name, port, size, repeat, warmup):
+    address = endpoint(name, port)
+    tuned = name == "tcp-tuned"
+    server = multiprocessing.Process(target=echo_server, args=(address, tuned, warmup + repeat), daemon=True)
+    server.start()
+
+    ctx = zmq.Context()
+    req = ctx.socket(zmq.REQ)
+    if tuned:
+        transport.connect(req, address)
+    else:
+        req.connect(address)
+
+    payload = os.urandom(size)
+    for _ in range(warmup):
+        req.send(payload)
+        req.recv()
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        t = time.perf_counter()
+        req.send(payload, copy=size < 65536)
+        req.recv(copy=False)
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+
+    server.join()
+    req.close()
+    ctx.term()
+
+    latencies.sort()
+    p50, p99 = percentile(latencies, 0.5), percentile(latencies, 0.99)
+    mb_s = 2 * size * repeat / elapsed / 2**20
+    print(f"{name:<10} {size:>10d} B  p50 {p50 * 1e6:9.1f} us  p99 {p99 * 1e6:9.1f} us  {mb_s:10.1f} MB/s")
+    return p50
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tcp vs ipc round trips between two local processes")
+    parser.add_argument("--transports", type=str, default="tcp,tcp-tuned,ipc")
+    parser.add_argument("--sizes", type=str, default="64,4096,65536,1048576", help="Message sizes in bytes")
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--port", type=int, default=15998)
+    args = parser.parse_args()
+
+    names = args.transports.split(",")
+    for name in names:
+        assert name in ("tcp", "tcp-tuned", "ipc"), f"Unknown transport {name}"
+    sizes = [int(s) for s in args.sizes.split(",")]
+    print(f"ZMQ_TCP_BUFFER_MB={os.environ.get('ZMQ_TCP_BUFFER_MB', '4')} ZMQ_TCP_HWM={os.environ.get('ZMQ_TCP_HWM', '10000')}")
+
+    results = {}
+    for size in sizes:
+        for name in names:
+            results[name, size] = run(name, args.port, size, args.repeat, args.warmup)
+        print()
+
+    if "tcp" in names:
+        for name in names:
+            if name == "tcp":
+                continue
+            speedups = ", ".join(f"{size} B {results['tcp', size] / results[name, size]:.2f}x" for size in sizes)
+            print(f"p50 speedup of {name} over tcp: {speedups}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Benchmark the chunk wire format between LocalBalanceManager.provider and the trainer ranks.
+
+Compares the previous path (`pickle.dumps` on the provider, `recv_pyobj` on the rank) with
+`serialize_to_frames` + `send_multipart(copy=False)` / `recv_tensors`, over a REQ/REP pair
+like the real provider. Reports MB/s and CPU seconds per chunk for both.
+
+Usage (from the rft directory):
+    python benchmarks/bench_wire_format.py --batch-size 4 --slices 7 --seq-len 2048
+    python benchmarks/bench_wire_format.py --address ipc:///tmp/arl_bench_wire
+"""
+
+import os
+import sys
+import time
+import pickle
+import argparse
+import threading
+
+RFT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RFT_DIR)
+# trainer.utils uses the action schemas / validator in eval.utils at the repository root
+sys.path.append(os.path.dirname(RFT_DIR))
+
+import torch
+import zmq
+
+from trainer.utils.wire import serialize_to_frames, deserialize_from_frames, send_tensors, recv_tensors
+
+
+def make_chunk(batch_size, slices, seq_len, patch_size=14, scale_resolution=448):
+    """A chunk shaped like the output of `_process_inputs` for MiniCPM-V screenshots."""
+    patches = scale_resolution * scale_resolution // (patch_size * patch_size)
+    prompt_inputs = {
+        "input_ids": torch.randint(0, 150000, (batch_size, seq_len), dtype=torch.int64),
+        "attention_mask": torch.ones((batch_size, seq_len), dtype=torch.int64),
+        "pixel_values": [[torch.randn(3, patch_size, patch_size * patches) for _ in range(slices)] for _ in range(batch_size)],
+        "image_bound": [torch.randint(0, seq_len, (slices, 2)) for _ in range(batch_size)],
+        "tgt_sizes": [torch.full((slices, 2), scale_resolution // patch_size, dtype=torch.int32) for _ in range(batch_size)],
+        "rewards": torch.rand(batch_size),
+    }
+    return {
+        "prompt_inputs": prompt_inputs,
+        "completion_mask": torch.ones((batch_size, seq_len // 4), dtype=torch.int32),
+        "advantages": torch.randn(batch_size),
+        "prompt_len": seq_len - seq_len // 4,
+        "step_ids": torch.zeros(batch_size, dtype=torch.int64),
+    }
+
+
+def chunk_bytes(chunk):
+    total = 0
+    stack = [chunk]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, torch.Tensor):
+            total += obj.numel() * obj.element_size()
+        elif isinstance(obj, dict):
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+    return total
+
+
+def run(name, address, chunk, repeat, tp_size, send, recv):
+    ctx = zmq.Context()
+    rep = ctx.socket(zmq.REP)
+    rep.bind(address)
+
+    def server():
+        for _ in range(repeat):
+            payload = None
+            for _ in range(tp_size):
+                rep.recv()
+                if payload is None:
+                    payload = send(rep, chunk, None)
+                else:
+                    send(rep, chunk, payload)
+
+    thd = threading.Thread(target=server, daemon=True)
+    req = ctx.socket(zmq.REQ)
+    req.connect(address)
+    thd.start()
+
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    for _ in range(repeat * tp_size):
+        req.send(b"REQ")
+        data = recv(req)
+        assert data["prompt_len"] == chunk["prompt_len"]
+    elapsed = time.perf_counter() - start
+    thd.join()
+    # process_time covers both the provider thread and the receiving side
+    total_cpu = time.process_time() - cpu_start
+
+    req.close()
+    rep.close()
+    ctx.term()
+
+    mb = chunk_bytes(chunk) * repeat * tp_size / 2**20
+    print(f"{name:<28} {mb / elapsed:10.1f} MB/s  {elapsed / (repeat * tp_size) * 1e3:8.2f} ms/chunk  "
+          f"cpu {total_cpu / (repeat * tp_size) * 1e3:8.2f} ms/chunk")
+    return mb / elapsed
+
+
+def pickle_send(sock, chunk, payload):
+    if payload is None:
+        payload = pickle.dumps(chunk)
+    sock.send(payload)
+    return payload
+
+
+def pickle_recv(sock):
+    return sock.recv_pyobj()
+
+
+def frames_send(sock, chunk, frames):
+    if frames is None:
+        frames = serialize_to_frames(chunk)
+    send_tensors(sock, frames=frames)
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chunk serialization over zmq")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--slices", type=int, default=7, help="Image slices per sample (1 source + refined slices)")
+    parser.add_argument("--seq-len", type=int, default=2048)
+    parser.add_argument("--tp-size", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--address", type=str, default="tcp://127.0.0.1:15999")
+    args = parser.parse_args()
+
+    chunk = make_chunk(args.batch_size, args.slices, args.seq_len)
+    print(f"chunk size: {chunk_bytes(chunk) / 2**20:.1f} MB, tp_size={args.tp_size}, address={args.address}")
+
+    base = run("pickle", args.address, chunk, args.repeat, args.tp_size, pickle_send, pickle_recv)
+    fast = run("frames (copy=False)", args.address, chunk, args.repeat, args.tp_size, frames_send, recv_tensors)
+    print(f"speedup: {fast / base:.2f}x")
+
+    # the decoded chunk must be identical
+    decoded = deserialize_from_frames([bytes(f) for f in serialize_to_frames(chunk)])
+    for a, b in zip(decoded["prompt_inputs"]["pixel_values"][0], chunk["prompt_inputs"]["pixel_values"][0]):
+        assert torch.equal(a, b)
+    assert torch.equal(decoded["prompt_inputs"]["input_ids"], chunk["prompt_inputs"]["input_ids"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+"""
+CPU-only simulation of the async GRPO control plane.
+
+Spawns the real GlobalSyncManager, the task dispatcher of GlobalDistributed0MQDataLoader and one
+LocalBalanceManager per simulated node in local processes, plus fake trainer ranks that follow the
+protocol of AsyncRLGRPOTrainer:
+
+    - request tasks from the dispatcher, "generate" for a random latency and send TaskAndContent with
+      synthetic scores to their local balancer
+    - pull `--grad-accum` chunks from the provider per optimizer step (acking each to the global manager),
+      generating more completions while no chunk is available
+    - wait for SYNC_FOR_UPDATE and "train" for `--step-time` seconds
+
+Chunks are synthetic tensors of `--chunk-mb` MB (no processor or model is loaded). Reports completions
+and optimizer steps per second, how the ranks spent their time (training / generating / waiting) and the
+RSS growth of every manager process, to be used as a regression benchmark of the control plane, and the
+advantage sync messages the global manager handled per task group (compare with and without
+`--group-affinity`) and how long generation stalled on a full balancer (compare with and without
+`--flow-control`).
+
+Usage (from the rft directory):
+    python benchmarks/sim_control_plane.py --nodes 2 --ranks-per-node 4 --seconds 120
+    python benchmarks/sim_control_plane.py --nodes 4 --ranks-per-node 8 --gen-latency 0.5 --step-time 0.2
+    python benchmarks/sim_control_plane.py --nodes 8 --ranks-per-node 2 --group-affinity
+    python benchmarks/sim_control_plane.py --max-cache-factor 1 --flow-control
+"""
+
+import os
+import sys
+import time
+import uuid
+import pickle
+import argparse
+import multiprocessing
+from collections import Counter
+
+RFT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RFT_DIR)
+# trainer.utils uses the action schemas / validator in eval.utils at the repository root
+sys.path.append(os.path.dirname(RFT_DIR))
+
+import numpy as np
+import torch
+import zmq
+
+from trainer.zmq import global_sync_proc, LocalBalanceManager, TaskAndContent, TaskStatus
+from trainer.utils import GlobalDistributed0MQDataLoader, deserialize_from_frames
+
+
+class SimLocalBalanceManager(LocalBalanceManager):
+    """LocalBalanceManager building synthetic chunks instead of running the processor."""
+
+    chunk_bytes = 8 * 2**20
+    reprocess_latency = 0.0
+
+    def _load_processor(self):
+        return None
+
+    def _decode_completion(self, data):
+        return "simulated completion"
+
+    def _process_chunk(self, inputs):
+        if self.reprocess_latency:
+            time.sleep(self.reprocess_latency)
+        n = len(inputs)
+        seq_len, completion_len = 512, 128
+        return {
+            "prompt_inputs": {
+                "input_ids": torch.zeros((n, seq_len), dtype=torch.int64),
+                "attention_mask": torch.ones((n, seq_len), dtype=torch.int64),
+                "pixel_values": [torch.zeros(self.chunk_bytes // 4 // n, dtype=torch.float32) for _ in range(n)],
+                "rewards": torch.tensor([d["reward"] for d in inputs]),
+            },
+            "completion_mask": torch.ones((n, completion_len), dtype=torch.int32),
+            "advantages": torch.tensor([d["advantage"] for d in inputs]),
+            "prompt_len": seq_len - completion_len,
+            "step_ids": torch.zeros(n, dtype=torch.int64),
+        }
+
+
+def run_node(kwargs, chunk_mb, reprocess_latency):
+    SimLocalBalanceManager.chunk_bytes = int(chunk_mb * 2**20)
+    SimLocalBalanceManager.reprocess_latency = reprocess_latency
+    SimLocalBalanceManager(**kwargs).start()
+
+
+def task_score(task_id, rng, args):
+    """Tasks have a fixed pass rate drawn from Beta(a, b); each completion passes with that rate."""
+    pass_rate = np.random.default_rng(task_id).beta(args.difficulty_a, args.difficulty_b)
+    if args.score_dist == "bernoulli":
+        return float(rng.random() < pass_rate)
+    return float(np.clip(rng.normal(pass_rate, 0.1), 0, 1))
+
+
+def run_rank(rank, addrs, args, results):
+    ctx = zmq.Context()
+    dispatcher = ctx.socket(zmq.REQ)
+    dispatcher.connect(addrs["dispatch"])
+    balance_send = ctx.socket(zmq.REQ)
+    balance_send.connect(addrs["local_collect"])
+    balance_recv = ctx.socket(zmq.REQ)
+    balance_recv.connect(addrs["local_provider"])
+    ack = ctx.socket(zmq.REQ)
+    ack.connect(addrs["global_collect"])
+    sync_signal = ctx.socket(zmq.SUB)
+    sync_signal.setsockopt(zmq.SUBSCRIBE, b"SYNC_FOR_UPDATE")
+    sync_signal.connect(addrs["global_sync"])
+    poller = zmq.Poller()
+    for sock in (sync_signal, balance_recv, ack):
+        poller.register(sock, zmq.POLLIN)
+
+    rng = np.random.default_rng(rank)
+    stats = Counter()
+    recv_idx = 0
+    deadline = time.perf_counter() + args.seconds
+
+    def acquire_credit():
+        # mirrors AsyncRLGRPOTrainer._acquire_credit, without the forced grant after a long stall
+        balance_send.send_pyobj(("CREDIT", args.per_device_batch_size, False))
+        return balance_send.recv_pyobj() > 0
+
+    def sample_step():
+        dispatcher.send_pyobj(("REQ_TASK", rank // args.ranks_per_node) if args.group_affinity else "REQ_TASK")
+        tasks = pickle.loads(dispatcher.recv())
+        start = time.perf_counter()
+        time.sleep(rng.lognormal(np.log(args.gen_latency), 0.5))
+        now = time.time()
+        tacs = []
+        for task_id in tasks:
+            score = task_score(task_id, rng, args)
+            tacs.append(TaskAndContent(
+                data={
+                    "id": task_id,
+                    "step_id": 0,
+                    "next_id": None,
+                    "prompt": [{"role": "user", "content": "simulated prompt"}],
+                    "completion_ids": np.zeros(args.completion_len, dtype=np.uint16),
+                    "reward": score,
+                },
+                status=TaskStatus(task_id=task_id, completion_id=uuid.uuid4(), score=score,
+                                  stage_times={"generation_start": now, "generated": now}),
+            ))
+        t0 = time.perf_counter()
+        balance_send.send_pyobj(tacs)
+        balance_send.recv_string()
+        stats["send_blocked_s"] += time.perf_counter() - t0
+        stats["generate_s"] += time.perf_counter() - start
+        stats["completions"] += len(tacs)
+
+    def request_chunk():
+        balance_recv.send_pyobj((rank, rank, recv_idx, []))
+        return True
+
+    start_time = time.perf_counter()
+    requested = False
+    while time.perf_counter() < deadline:
+        # one optimizer step, mirrors AsyncRLGRPOTrainer._async_sampling
+        batch = 0
+        if not requested:
+            requested = request_chunk()
+        waiting_for_ack = False
+        wait_time_ms = 0
+        synced = False
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            socks = dict(poller.poll(timeout=wait_time_ms))
+            stats["wait_s"] += time.perf_counter() - t0
+
+            if waiting_for_ack and ack in socks:
+                ack.recv()
+                waiting_for_ack = False
+            if balance_recv in socks and not waiting_for_ack:
+                kind, *frames = balance_recv.recv_multipart(copy=False)
+                requested = False
+                deserialize_from_frames(frames)
+                recv_idx += 1
+                batch += 1
+                stats["chunks"] += 1
+                ack.send_pyobj(args.per_device_batch_size)
+                waiting_for_ack = True
+                wait_time_ms = args.greedy_wait_ms
+                if batch < args.grad_accum:
+                    requested = request_chunk()
+                else:
+                    wait_time_ms = 0
+                continue
+            if sync_signal in socks:
+                sync_signal.recv_multipart()
+                # other ranks acked enough chunks, a short batch is counted like a full one
+                synced = True
+                break
+            if wait_time_ms > 0:
+                wait_time_ms = int(wait_time_ms / 2)
+                continue
+            if args.flow_control:
+                if not acquire_credit():
+                    stats["denied"] += 1
+                    wait_time_ms = 200
+                    continue
+            sample_step()
+        if waiting_for_ack:
+            ack.recv()
+        if not synced:
+            break
+        t0 = time.perf_counter()
+        time.sleep(args.step_time)
+        stats["train_s"] += time.perf_counter() - t0
+        stats["steps"] += 1
+    stats["elapsed_s"] = time.perf_counter() - start_time
+    results.put(dict(stats))
+
+
+def rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except FileNotFoundError:
+        pass
+    return float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate the async GRPO control plane on CPU")
+    parser.add_argument("--nodes", type=int, default=2)
+    parser.add_argument("--ranks-per-node", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=120)
+    parser.add_argument("--num-generations", type=int, default=8)
+    parser.add_argument("--per-device-batch-size", type=int, default=2)
+    parser.add_argument("--grad-accum", type=int, default=4)
+    parser.add_argument("--gen-latency", type=float, default=1.0, help="Median seconds to generate one batch")
+    parser.add_argument("--step-time", type=float, default=0.5, help="Seconds of one optimizer step")
+    parser.add_argument("--greedy-wait-ms", type=int, default=500)
+    parser.add_argument("--chunk-mb", type=float, default=8)
+    parser.add_argument("--reprocess-latency", type=float, default=0.0)
+    parser.add_argument("--completion-len", type=int, default=256)
+    parser.add_argument("--score-dist", choices=["bernoulli", "normal"], default="bernoulli")
+    parser.add_argument("--difficulty-a", type=float, default=1.0, help="Beta(a, b) of task pass rates")
+    parser.add_argument("--difficulty-b", type=float, default=1.0)
+    parser.add_argument("--dataset-size", type=int, default=100000)
+    parser.add_argument("--difficulty-filter", choices=["off", "skip", "downweight"], default="off",
+                        help="Filter of the dispatcher, use a small --dataset-size so tasks repeat within the run")
+    parser.add_argument("--group-affinity", action="store_true", help="Hand each task group to the ranks of one node")
+    parser.add_argument("--flow-control", action="store_true", help="Ask the balancers for credit before every generation batch")
+    parser.add_argument("--max-cache-factor", type=int, default=8, help="max_cache_size of the balancers in node batches")
+    parser.add_argument("--port", type=int, default=17000)
+    args = parser.parse_args()
+
+    host = "tcp://127.0.0.1"
+    world_size = args.nodes * args.ranks_per_node
+    addrs = {
+        "global_sync": f"{host}:{args.port}",
+        "global_collect": f"{host}:{args.port + 1}",
+        "dispatch": f"{host}:{args.port + 2}",
+    }
+    os.environ.setdefault("MASTER_ADDR", "127.0.0.1")
+
+    procs = {}
+    procs["global"] = multiprocessing.Process(target=global_sync_proc, kwargs={
+        "sync_address": addrs["global_sync"],
+        "collect_address": addrs["global_collect"],
+        "num_generations": args.num_generations,
+        "num_to_sync": args.grad_accum * world_size * args.per_device_batch_size,
+        "num_nodes": args.nodes,
+        "data_dispatch_address": addrs["dispatch"],
+        "report_outcomes": args.difficulty_filter != "off",
+    }, daemon=True)
+
+    perm = np.random.default_rng(0).permutation(args.dataset_size)
+    sampler = [int(i) for i in perm for _ in range(args.num_generations)]
+    procs["dispatcher"] = multiprocessing.Process(
+        target=GlobalDistributed0MQDataLoader._master_loop,
+        args=(addrs["dispatch"], args.per_device_batch_size, sampler, args.dataset_size, {},
+              {"mode": args.difficulty_filter, "num_generations": args.num_generations},
+              {"num_nodes": args.nodes} if args.group_affinity else None),
+        daemon=True,
+    )
+
+    node_addrs = []
+    for i in range(args.nodes):
+        base = args.port + 10 + 4 * i
+        node = {"local_collect": f"{host}:{base}", "local_provider": f"{host}:{base + 1}"}
+        node_addrs.append(node)
+        procs[f"node{i}"] = multiprocessing.Process(target=run_node, args=({
+            "local_collect_address": node["local_collect"],
+            "local_provider_address": node["local_provider"],
+            "local_steal_port": base + 2,
+            "global_sync_address": addrs["global_sync"],
+            "global_result_collect_address": addrs["global_collect"],
+            "global_data_dispatch_address": addrs["dispatch"],
+            "chunk_size": args.per_device_batch_size,
+            "mt_max_beam_width": 3,
+            "max_cache_size": args.grad_accum * args.per_device_batch_size * args.ranks_per_node * args.max_cache_factor,
+            "processing_class_name_or_path": None,
+            "max_prompt_length": 8192,
+            "node_rank": i,
+        }, args.chunk_mb, args.reprocess_latency), daemon=True)
+
+    for p in procs.values():
+        p.start()
+    time.sleep(2)
+
+    # the dataloader of rank 0 restarts the sampler before the first epoch
+    ctx = zmq.Context()
+    with ctx.socket(zmq.REQ) as sock:
+        sock.connect(addrs["dispatch"])
+        sock.send_pyobj("RESTART")
+        sock.recv()
+
+    rss_start = {name: rss_mb(p.pid) for name, p in procs.items()}
+    results = multiprocessing.Queue()
+    ranks = [
+        multiprocessing.Process(target=run_rank, args=(r, {**addrs, **node_addrs[r // args.ranks_per_node]}, args, results))
+        for r in range(world_size)
+    ]
+    start = time.perf_counter()
+    for p in ranks:
+        p.start()
+    collected = [results.get() for _ in ranks]
+    elapsed = time.perf_counter() - start
+    rss_end = {name: rss_mb(p.pid) for name, p in procs.items()}
+    with ctx.socket(zmq.REQ) as sock:
+        sock.connect(addrs["global_collect"])
+        sock.send_pyobj(("STATS",))
+        sync_stats = sock.recv_pyobj()["sync"]
+    for p in ranks:
+        p.join()
+    for p in procs.values():
+        p.terminate()
+
+    total = Counter()
+    for stats in collected:
+        total.update(stats)
+    busy = total["elapsed_s"]
+    print(f"{args.nodes} nodes x {args.ranks_per_node} ranks, {elapsed:.0f}s, gen {args.gen_latency}s/batch, "
+          f"step {args.step_time}s, chunk {args.chunk_mb} MB")
+    print(f"throughput: {total['completions'] / elapsed:.1f} completions/s generated, "
+          f"{total['chunks'] / elapsed:.2f} chunks/s trained, {total['steps'] / world_size / elapsed:.3f} steps/s")
+    print(f"rank time: train {total['train_s'] / busy * 100:.1f}%, generate {total['generate_s'] / busy * 100:.1f}%, "
+          f"idle {total['wait_s'] / busy * 100:.1f}%")
+    print(f"generation stalls ({'credits' if args.flow_control else 'no flow control'}): "
+          f"blocked sending to the balancer {total['send_blocked_s'] / busy * 100:.1f}%, "
+          f"{total['denied']} credit denials")
+    published = max(sync_stats.get("published", 0), 1)
+    print(f"advantage sync ({'affinity' if args.group_affinity else 'no affinity'}): {published} groups, per group "
+          f"{sync_stats.get('signals', 0) / published:.2f} signals, {sync_stats.get('requests', 0) / published:.2f} requests, "
+          f"{sync_stats.get('payloads', 0) / published:.2f} group payloads sent to nodes")
+    minutes = elapsed / 60
+    for name in procs:
+        growth = rss_end[name] - rss_start[name]
+        print(f"rss {name:<10} {rss_start[name]:8.1f} -> {rss_end[name]:8.1f} MB ({growth / minutes:+.1f} MB/min)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Replay node queue-length traces to compare work-stealing policies on trainer idle time.
+
+A trace is the JSON lines file GlobalSyncManager writes when NODE_QUEUE_TRACE is set:
+    {"time": <unix time>, "queues": {<steal address>: <ready queue length>, ...}}
+
+The simulator recovers how many chunks every node produced between two samples
+(queue growth + chunks its trainers consumed), then replays that production against each policy:
+trainers consume `--consume-rate` chunks/s per node, queue lengths are broadcast every interval and are
+one interval stale when a node decides to steal, and stolen chunks arrive after
+`latency + chunks * chunk_bytes / bandwidth`. Without `--trace`, a synthetic trace with heterogeneous
+and bursty nodes is generated.
+
+Reports the fraction of time trainers waited for data, the number of steals and the data moved.
+
+Usage (from the rft directory):
+    python benchmarks/sim_work_stealing.py --nodes 16 --seconds 1800
+    NODE_QUEUE_TRACE=/tmp/queues.jsonl python grpo.py ...   # record a trace
+    python benchmarks/sim_work_stealing.py --trace /tmp/queues.jsonl --consume-rate 2
+"""
+
+import os
+import sys
+import json
+import heapq
+import random
+import argparse
+
+RFT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RFT_DIR)
+# trainer.utils uses the action schemas / validator in eval.utils at the repository root
+sys.path.append(os.path.dirname(RFT_DIR))
+
+import numpy as np
+
+from trainer.utils.steal_policy import STEAL_POLICIES, build_steal_policy
+
+
+def load_trace(path, consume_rate):
+    """Production per node and interval, shape (nodes, intervals), from a recorded queue-length trace."""
+    samples = [json.loads(line) for line in open(path) if line.strip()]
+    addrs = sorted({addr for s in samples for addr in s["queues"]})
+    queues = np.array([[s["queues"].get(addr, 0) for s in samples] for addr in addrs], dtype=np.float64)
+    times = np.array([s["time"] for s in samples])
+    interval = float(np.median(np.diff(times)))
+    consumed = np.where(queues[:, :-1] > 0, consume_rate * interval, 0.0)
+    production = np.maximum(0.0, np.diff(queues, axis=1) + consumed)
+    return production, interval
+
+
+def synthetic_trace(nodes, seconds, interval, consume_rate, seed):
+    """Nodes generate at 0.5x ~ 1.5x the consumption rate, with random stalls (long rollouts, evaluation)."""
+    rng = np.random.default_rng(seed)
+    steps = int(seconds / interval)
+    rates = consume_rate * rng.uniform(0.5, 1.5, size=(nodes, 1))
+    production = rng.poisson(rates * interval, size=(nodes, steps)).astype(np.float64)
+    stalls = rng.random((nodes, steps)) < 0.02
+    for i, k in zip(*np.nonzero(stalls)):
+        production[i, k:k + int(rng.integers(5, 20))] = 0
+    return production, interval
+
+
+def simulate(production, interval, policy_name, use_cost_model, args, dt=0.1):
+    nodes, steps = production.shape
+    addrs = [f"tcp://node{i}:16001" for i in range(nodes)]
+    rng = random.Random(args.seed)
+    policies = None
+    if policy_name != "none":
+        policies = [
+            build_steal_policy(policy_name, args.steal_threshold, use_cost_model, rng=random.Random(args.seed + i))
+            for i in range(nodes)
+        ]
+        if use_cost_model:
+            for policy in policies:
+                policy.cost_model.consume_rate = args.consume_rate
+
+    queue = np.zeros(nodes)
+    in_flight = []  # (arrival time, seq, node, chunks, transfer seconds)
+    idle = 0.0
+    steals = moved = 0
+    stale_lengths = {addr: 0 for addr in addrs}
+    ticks_per_interval = max(1, int(round(interval / dt)))
+    need = args.consume_rate * dt
+    t = 0.0
+    seq = 0
+    consumed_in_interval = np.zeros(nodes)
+
+    for k in range(steps):
+        for _ in range(ticks_per_interval):
+            t += dt
+            queue += production[:, k] / ticks_per_interval
+            while in_flight and in_flight[0][0] <= t:
+                _, _, node, chunks, seconds = heapq.heappop(in_flight)
+                queue[node] += chunks
+                if policies is not None and policies[node].cost_model is not None:
+                    policies[node].cost_model.observe_transfer(chunks, chunks * args.chunk_mb * 2**20, seconds)
+            served = np.minimum(queue, need)
+            idle += float(np.sum(1 - served / need)) * dt
+            queue -= served
+            consumed_in_interval += served
+
+        if policies is not None:
+            # the lengths broadcast now were reported one interval ago
+            lengths = stale_lengths
+            mean_queue_length = sum(lengths.values()) / len(lengths)
+            for i in rng.sample(range(nodes), nodes):
+                policy = policies[i]
+                if policy.cost_model is not None:
+                    policy.cost_model.observe_consumption(int(consumed_in_interval[i]), interval)
+                plan = policy.plan(addrs[i], lengths, int(queue[i]))
+                if plan is None:
+                    continue
+                donor = addrs.index(plan[0])
+                # same rule as LocalBalanceManager.serve_stealing
+                offer = max(int(min((queue[donor] - mean_queue_length) / 2, plan[1])), 0)
+                if offer <= 0:
+                    continue
+                queue[donor] -= offer
+                seconds = args.latency + offer * args.chunk_mb * 2**20 / args.bandwidth
+                heapq.heappush(in_flight, (t + seconds, seq, i, offer, seconds))
+                seq += 1
+                steals += 1
+                moved += offer
+        stale_lengths = {addr: int(q) for addr, q in zip(addrs, queue)}
+        consumed_in_interval[:] = 0
+
+    return idle / (nodes * t), steals, moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare work-stealing policies on a queue-length trace")
+    parser.add_argument("--trace", type=str, default=None, help="JSON lines trace written with NODE_QUEUE_TRACE")
+    parser.add_argument("--nodes", type=int, default=16, help="Nodes of the synthetic trace")
+    parser.add_argument("--seconds", type=float, default=1800, help="Length of the synthetic trace")
+    parser.add_argument("--interval", type=float, default=3.0, help="Queue length broadcast interval of the synthetic trace")
+    parser.add_argument("--consume-rate", type=float, default=1.0, help="Chunks/s consumed by the trainers of one node")
+    parser.add_argument("--chunk-mb", type=float, default=64.0)
+    parser.add_argument("--bandwidth", type=float, default=1.25e9, help="Bytes/s between two nodes")
+    parser.add_argument("--latency", type=float, default=2e-3)
+    parser.add_argument("--steal-threshold", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.trace:
+        production, interval = load_trace(args.trace, args.consume_rate)
+    else:
+        production, interval = synthetic_trace(args.nodes, args.seconds, args.interval, args.consume_rate, args.seed)
+    print(f"{production.shape[0]} nodes, {production.shape[1]} intervals of {interval:.1f}s, "
+          f"{production.sum() / production.shape[0] / (production.shape[1] * interval):.2f} chunks/s produced per node, "
+          f"{args.consume_rate:.2f} consumed")
+
+    configs = [("none", False)]
+    for name in STEAL_POLICIES:
+        configs += [(name, False), (name, True)]
+    print(f"{'policy':<16} {'idle':>8} {'steals':>8} {'chunks':>8} {'GB moved':>9}")
+    for name, use_cost_model in configs:
+        idle, steals, moved = simulate(production, interval, name, use_cost_model, args)
+        label = name + ("+cost" if use_cost_model else "")
+        print(f"{label:<16} {idle * 100:7.2f}% {steals:8d} {moved:8d} {moved * args.chunk_mb / 1024:9.1f}")
+
+
+if __name__ == "__main__":
+    main()
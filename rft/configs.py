@@ -170,6 +170,74 @@ class GRPOTrainingConfig(TrainingArguments):
         default=15003,
         metadata={"help": "Port number for node queue balance"},
     )
+    zmq_transport: Optional[str] = field(
+        default="auto",
+        metadata={"help": "Transport of the global sync / collect / dispatch endpoints: `tcp`, `ipc`, or `auto` to use ipc when all ranks run on one host (WORLD_SIZE == LOCAL_WORLD_SIZE). TCP sockets are tuned with ZMQ_TCP_BUFFER_MB and ZMQ_TCP_HWM"},
+    )
+    shm_ring_slots: Optional[int] = field(
+        default=0,
+        metadata={"help": "Number of node-local shared-memory slots used to hand chunks to trainer ranks, 0 to send them over 0MQ"},
+    )
+    shm_slot_mb: Optional[int] = field(
+        default=256,
+        metadata={"help": "Size of each shared-memory slot in MB, larger chunks fall back to 0MQ"},
+    )
+    report_batch_size: Optional[int] = field(
+        default=256,
+        metadata={"help": "Number of task status the local balancer batches into one report to the global sync manager"},
+    )
+    report_flush_interval: Optional[float] = field(
+        default=0.05,
+        metadata={"help": "Max seconds the local balancer holds a partial batch of task status before reporting"},
+    )
+    steal_policy: Optional[str] = field(
+        default="p2c",
+        metadata={"help": "Work-stealing policy of the local balancer: p2c (power of two choices) or random"},
+    )
+    straggler_timeout: Optional[int] = field(
+        default=3600,
+        metadata={"help": "Seconds a cached completion may wait for its group before the local balancer reports it as a straggler"},
+    )
+    straggler_policy: Optional[str] = field(
+        default="drop",
+        metadata={"help": "How the global sync manager resolves a timed out group: pad, regenerate or drop"},
+    )
+    reprocess_workers: Optional[int] = field(
+        default=0,
+        metadata={"help": "Worker processes building training chunks in each local balancer, 0 to build them in a thread"},
+    )
+    stage_trace_file: Optional[str] = field(
+        default=None,
+        metadata={"help": "JSON lines file the local balancers append per-stage latency histograms to, suffixed with the node name"},
+    )
+    stage_metrics_port: Optional[int] = field(
+        default=0,
+        metadata={"help": "Port of the Prometheus /metrics endpoint of each local balancer, 0 to disable"},
+    )
+    compact_rollouts: Optional[bool] = field(
+        default=True,
+        metadata={"help": "Send completions to the local balancer as token ids with images referenced by hash in a node-local image cache, instead of full items with decoded text"},
+    )
+    image_cache_dir: Optional[str] = field(
+        default=None,
+        metadata={"help": "Directory of the node-local image cache of compact rollouts, defaults to /dev/shm/arl_images<local collect address>. Must be on persistent storage with rollout_log_dir, logged rollouts reference their images in it"},
+    )
+    cache_memory_mb: Optional[int] = field(
+        default=0,
+        metadata={"help": "RAM budget (MB) of the completions each local balancer caches until their group is synced, older ones spill to cache_spill_dir. 0 for no budget"},
+    )
+    cache_disk_mb: Optional[int] = field(
+        default=0,
+        metadata={"help": "Cap (MB) of the spilled completions of each local balancer, the oldest are dropped beyond it. 0 for no cap"},
+    )
+    cache_spill_dir: Optional[str] = field(
+        default=None,
+        metadata={"help": "Local scratch directory for spilled completions, defaults to a directory in the system temp dir"},
+    )
+    rollout_log_dir: Optional[str] = field(
+        default=None,
+        metadata={"help": "Directory of the append-only rollout logs. When set, the sync managers snapshot their state into every checkpoint and replay the logs on resume"},
+    )
     max_items_to_cache: Optional[str] = field(
         default=256,
         metadata={"help": "The maxium items to cached each process when doing async generation."}
@@ -182,10 +250,70 @@ class GRPOTrainingConfig(TrainingArguments):
         default=3,
         metadata={"help": "Max concurrent multiturn sampling beam width"}
     )
+    mt_step_weights: Optional[str] = field(
+        default="1",
+        metadata={"help": "Comma separated share of the continuation slots of each step, the last weight applies to deeper steps"}
+    )
+    mt_aging: Optional[float] = field(
+        default=0.05,
+        metadata={"help": "Priority a queued continuation step gains per second its head item waits"}
+    )
+    mt_max_outstanding_per_root: Optional[int] = field(
+        default=0,
+        metadata={"help": "Max dispatched continuation groups of one root task that have not come back, 0 for no cap. All copies of an admitted group are dispatched"}
+    )
+    mt_max_continuation_fraction: Optional[float] = field(
+        default=1.0,
+        metadata={"help": "Max fraction of each task batch filled with continuations, the rest are fresh tasks"}
+    )
+    difficulty_filter: Optional[str] = field(
+        default="off",
+        metadata={"help": "Filter fresh tasks by their learned rate of saturated or uniform groups before generation: off, skip or downweight"}
+    )
+    difficulty_skip_threshold: Optional[float] = field(
+        default=0.9,
+        metadata={"help": "Wasted group rate above which the skip filter skips a task"}
+    )
+    difficulty_explore: Optional[float] = field(
+        default=0.1,
+        metadata={"help": "Min probability a filtered task is still generated, so the tracker notices when it becomes learnable"}
+    )
+    difficulty_decay: Optional[float] = field(
+        default=0.9,
+        metadata={"help": "Decay of the per task group outcome counts of the difficulty tracker"}
+    )
+    group_affinity: Optional[bool] = field(
+        default=False,
+        metadata={"help": "Hand all generations of a task (and its continuations) to the ranks of one node picked by consistent hashing, so only that node is notified of the group"}
+    )
+    affinity_max_backlog: Optional[int] = field(
+        default=64,
+        metadata={"help": "Queued tasks of a node beyond which idle nodes take over its newest groups"}
+    )
     greedy_gather_wait_time: Optional[int] = field(
         default=31,
         metadata={"help": "Wait time for greedy gather for model updating data"}
     )
+    weight_sync_bucket_mb: Optional[int] = field(
+        default=512,
+        metadata={"help": "Bucket size (MB) of the all-gathers copying the training weights into the bf16 inference model before sampling, frozen parameters are copied once. 0 to load a full state dict every time"}
+    )
+    max_staleness: Optional[int] = field(
+        default=0,
+        metadata={"help": "Drop completions generated by weights more than this many optimizer steps older than the trainer's, in the local balancers before processing and before serving. 0 to keep all"}
+    )
+    generation_flow_control: Optional[bool] = field(
+        default=True,
+        metadata={"help": "Ask the local balancer for cache credit before each generation batch and pause sampling while it is full, instead of blocking on the balancer"}
+    )
+    generation_credit_retry_ms: Optional[int] = field(
+        default=200,
+        metadata={"help": "Wait time (ms) before asking for credit again after the local balancer denied it"}
+    )
+    generation_max_stall: Optional[float] = field(
+        default=120,
+        metadata={"help": "Seconds a rank waits for credit before generating anyway, so partially generated groups can never deadlock the balancers"}
+    )
     
     # Parameters that control the model and reference model
     model_init_kwargs: Optional[dict] = field(
@@ -1,10 +1,13 @@
 import os
+import sys
+# trainer.utils uses the action schemas / validator in eval.utils at the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import torch
 from transformers import AutoModelForCausalLM, AutoProcessor
 from trainer.arl import AsyncRLGRPOTrainer
 from configs import GRPOTrainingConfig,GRPOScriptArguments
 from trl import ModelConfig, TrlParser
-from trainer.utils import action_schema_check, action_args_check, GUIRFTDataset,action_type_check,GUIMTRFTDataset,react_check,fsdp2_prepare_model
+from trainer.utils import action_schema_check, action_args_check, GUIRFTDataset,action_type_check,GUIMTRFTDataset,react_check,fsdp2_prepare_model,global_endpoint
 import torch.distributed as dist
 
 reward_funcs_registry = {
@@ -157,7 +160,7 @@ def main(script_args, training_args, model_args):
             mesh=dp_mesh
         )
     
-    global_task_dispatch_addr =  f"tcp://{os.environ.get('MASTER_ADDR')}:{training_args.global_data_dispatch_port}"
+    global_task_dispatch_addr = global_endpoint("dispatch", os.environ.get('MASTER_ADDR'), training_args.global_data_dispatch_port, training_args.zmq_transport)
 
     dataset_cls = GUIMTRFTDataset if training_args.hist_length > 1 else GUIRFTDataset
     
@@ -189,7 +192,7 @@ def main(script_args, training_args, model_args):
     )
 
     # Train and push the model to the Hub
-    trainer.train()
+    trainer.train(resume_from_checkpoint=training_args.resume_from_checkpoint)
 
     # Save and push to hub
     trainer.save_model(training_args.output_dir)
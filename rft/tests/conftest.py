@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Like the entrypoints (grpo.py, benchmarks/): `trainer` and `configs` from the rft directory, `eval.utils`
+# from the repository root.
+RFT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RFT_DIR)
+sys.path.append(os.path.dirname(RFT_DIR))
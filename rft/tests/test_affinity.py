@@ -0,0 +1,27 @@
+from collections import Counter
+
+from trainer.utils.affinity import HashRing
+
+
+def test_owner_is_deterministic_and_balanced():
+    ring = HashRing(4)
+    owners = [ring.owner(root) for root in range(20000)]
+    other = HashRing(4)
+    assert owners == [other.owner(root) for root in range(20000)]
+    counts = Counter(owners)
+    assert set(counts) == {0, 1, 2, 3}
+    # 160 virtual points per node keep every node within ~20% of its share
+    assert all(0.8 * 5000 < c < 1.2 * 5000 for c in counts.values())
+
+
+def test_adding_a_node_only_moves_tasks_to_it():
+    before, after = HashRing(4), HashRing(5)
+    moved = [(before.owner(root), after.owner(root)) for root in range(20000)]
+    changed = [(a, b) for a, b in moved if a != b]
+    assert all(b == 4 for _, b in changed)
+    assert 0.1 < len(changed) / len(moved) < 0.3
+
+
+def test_single_node_owns_everything():
+    ring = HashRing(1)
+    assert {ring.owner(root) for root in range(100)} == {0}
@@ -0,0 +1,82 @@
+import numpy as np
+import torch
+from PIL import Image
+
+from trainer.utils.compact import (
+    ImageCache,
+    ImageRef,
+    compact_prompt,
+    compact_token_ids,
+    materialize_inputs,
+)
+from trainer.utils.process import _create_inputs
+
+IM_END, EOS, PAD = 7, 8, 0
+
+
+class _Tokenizer:
+    pad_token_id = PAD
+
+    def convert_tokens_to_ids(self, token):
+        return {"<|im_end|>": IM_END, "</s>": EOS}[token]
+
+
+class _Processor:
+    tokenizer = _Tokenizer()
+    pad_token_id = PAD
+
+
+def _prompt_inputs(batch):
+    return {
+        "input_ids": torch.ones((batch, 3), dtype=torch.int64),
+        "attention_mask": torch.ones((batch, 3), dtype=torch.int64),
+    }
+
+
+def test_token_ids_round_trip_matches_full_ids():
+    full = [
+        torch.tensor([11, 12, IM_END, 13, 14]),
+        torch.tensor([21, 22, 23, 24, 25]),
+        torch.tensor([70000, EOS, 31, 32, 33]),
+    ]
+    compact = [compact_token_ids(ids, (IM_END, EOS)) for ids in full]
+    assert [c.dtype for c in compact] == [np.uint16, np.uint16, np.int32]
+    assert [len(c) for c in compact] == [3, 5, 2]
+
+    items = materialize_inputs([{"prompt": [], "completion_ids": c} for c in compact], cache=None)
+    restored = [item["completion_ids"] for item in items]
+    assert all(ids.dtype == torch.int64 for ids in restored)
+
+    expected_inputs, expected_mask = _create_inputs(_Processor(), _prompt_inputs(3), full)
+    inputs, mask = _create_inputs(_Processor(), _prompt_inputs(3), restored)
+    # only the masked-out tail after EOS differs
+    assert torch.equal(mask, expected_mask[:, :mask.size(1)])
+    assert not expected_mask[:, mask.size(1):].any()
+    width = inputs["input_ids"].size(1)
+    keep = inputs["attention_mask"].bool()
+    assert torch.equal(inputs["input_ids"][keep], expected_inputs["input_ids"][:, :width][keep])
+
+
+def test_prompt_images_round_trip(tmp_path):
+    cache = ImageCache(str(tmp_path))
+    img = Image.fromarray(np.arange(2 * 3 * 3, dtype=np.uint8).reshape(2, 3, 3))
+    prompt = [
+        {"role": "system", "content": "text only"},
+        {"role": "user", "content": [img, "question", img]},
+    ]
+    compacted = compact_prompt(prompt, cache)
+    refs = [c for c in compacted[1]["content"] if isinstance(c, ImageRef)]
+    assert len(refs) == 2 and refs[0] == refs[1]
+    assert len(list(tmp_path.iterdir())) == 1
+
+    item = {"prompt": compacted, "completion_ids": np.array([1, 2], dtype=np.uint16)}
+    (restored,) = materialize_inputs([item], ImageCache(str(tmp_path)))
+    assert restored["prompt"][0] == prompt[0]
+    content = restored["prompt"][1]["content"]
+    assert content[1] == "question"
+    assert content[0].tobytes() == img.tobytes() and content[0].size == img.size
+
+
+def test_full_items_pass_through():
+    item = {"prompt": [], "completion_ids": torch.tensor([1, 2])}
+    assert materialize_inputs([item], cache=None)[0] is item
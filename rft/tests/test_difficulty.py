@@ -0,0 +1,54 @@
+import pytest
+
+from trainer.utils.difficulty import DifficultyTracker
+
+
+def test_wasted_rate_needs_two_groups_and_decays():
+    tracker = DifficultyTracker(mode="skip", decay=0.5)
+    tracker.update([(1, 0.95, True)])
+    assert tracker.wasted_rate(1) == 0.0
+    tracker.update([(1, 0.95, True)])
+    assert tracker.wasted_rate(1) == 1.0
+    # the task becomes learnable again, recent groups weigh more
+    tracker.update([(1, 0.4, False), (1, 0.5, False)])
+    seen, wasted = tracker.history[1]
+    assert seen == pytest.approx(1.875) and wasted == pytest.approx(0.375)
+    assert tracker.wasted_rate(1) == pytest.approx(0.2)
+    assert tracker.stats() == {"groups_observed": 4, "groups_wasted": 2, "tasks_kept": 0,
+                               "tasks_skipped": 0, "tracked_ids": 1}
+
+
+def test_keep_probability_per_mode():
+    outcomes = [(1, 1.0, True)] * 3 + [(2, 0.5, True), (2, 0.5, False), (2, 0.5, False)]
+    skip = DifficultyTracker(mode="skip", decay=1.0, explore=0.1)
+    down = DifficultyTracker(mode="downweight", decay=1.0, explore=0.1)
+    off = DifficultyTracker(mode="off", decay=1.0)
+    for tracker in (skip, down, off):
+        tracker.update(outcomes)
+    assert skip.keep_probability(1) == 0.1
+    assert skip.keep_probability(2) == 1.0
+    assert down.keep_probability(1) == 0.1
+    assert down.keep_probability(2) == pytest.approx(2 / 3)
+    assert off.keep_probability(1) == 1.0
+    # unknown ids are always kept
+    assert skip.keep_probability(3) == 1.0
+
+
+def test_all_copies_of_a_group_share_the_decision():
+    tracker = DifficultyTracker(mode="downweight", num_generations=4, decay=1.0, explore=0.5, seed=1)
+    tracker.update([(7, 1.0, True)] * 2)
+    decisions = [[tracker.keep(7) for _ in range(4)] for _ in range(50)]
+    assert all(len(set(group)) == 1 for group in decisions)
+    kept = sum(group[0] for group in decisions)
+    assert 10 < kept < 40
+    assert not tracker.pending
+    assert tracker.counters["tasks_kept"] + tracker.counters["tasks_skipped"] == 200
+
+    tracker.keep(7)
+    tracker.reset()
+    assert not tracker.pending
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(AssertionError):
+        DifficultyTracker(mode="hard")
@@ -0,0 +1,61 @@
+from collections import Counter
+
+from trainer.utils.task_store import SpillingTaskStore
+from trainer.utils.tracing import StageTracer
+from trainer.zmq import LocalBalanceManager
+
+
+def _manager(max_cache_size):
+    manager = object.__new__(LocalBalanceManager)
+    manager.max_cache_size = max_cache_size
+    manager.cached_tasks = SpillingTaskStore()
+    manager.credit_outstanding = 0
+    manager.credit_flow = False
+    manager.credit_counts = Counter()
+    manager.tracer = StageTracer("test")
+    return manager
+
+
+def _receive(manager, n):
+    for _ in range(n):
+        manager.cached_tasks[len(manager.cached_tasks)] = None
+    manager._consume_credit(n)
+
+
+def test_grants_reserve_cache_room():
+    manager = _manager(10)
+    assert manager._grant_credit(4) == 4
+    assert manager.credit_flow
+    assert manager._grant_credit(4) == 4
+    # 8 reserved, 2 free
+    assert manager._grant_credit(4) == 0
+    assert manager.credit_outstanding == 8
+    assert manager.credit_counts == Counter(granted=2, denied=1)
+    assert manager.tracer.counters == {"credit_denied": 1}
+
+
+def test_received_completions_return_their_credit():
+    manager = _manager(10)
+    manager._grant_credit(4)
+    manager._grant_credit(4)
+    _receive(manager, 4)
+    assert manager.credit_outstanding == 4
+    # the cached completions now hold the room the credit reserved
+    assert manager._grant_credit(4) == 0
+    manager.cached_tasks.pop(0)
+    manager.cached_tasks.pop(1)
+    assert manager._grant_credit(4) == 4
+    _receive(manager, 8)
+    assert manager.credit_outstanding == 0
+
+
+def test_forced_grants_overcommit_and_never_go_negative():
+    manager = _manager(4)
+    _receive(manager, 4)
+    assert manager._grant_credit(3) == 0
+    assert manager._grant_credit(3, force=True) == 3
+    assert manager.credit_counts["forced"] == 1
+    assert manager.credit_outstanding == 3
+    # completions pushed without credit (e.g. before flow control started) do not drive it negative
+    _receive(manager, 5)
+    assert manager.credit_outstanding == 0
@@ -0,0 +1,57 @@
+import uuid
+
+import numpy as np
+
+from trainer.zmq import GroupStore, TaskStatus
+
+
+def _status(task_id, score, node=0):
+    return TaskStatus(task_id=task_id, completion_id=uuid.uuid4(), score=score, node=node)
+
+
+def test_completed_groups_are_popped_as_columns():
+    store = GroupStore(group_size=3, capacity=2)
+    statuses = [_status(1, 0.1, node=0), _status(2, 1.0, node=2), _status(1, 0.2, node=1), _status(1, 0.3, node=0)]
+    for status in statuses:
+        store.add(status)
+    assert len(store) == 2
+    assert store.completed
+
+    task_ids, scores, completion_ids, first_arrival, nodes = store.pop_completed()
+    assert task_ids == [1]
+    np.testing.assert_array_equal(scores, [[0.1, 0.2, 0.3]])
+    assert [uuid.UUID(bytes=cid.tobytes()) for cid in completion_ids[0]] == \
+        [s.completion_id for s in statuses if s.task_id == 1]
+    assert first_arrival.shape == (1,)
+    # nodes 0 and 1 hold the group
+    assert nodes == [0b11]
+    assert len(store) == 1 and not store.completed
+
+
+def test_slots_are_reused_and_grow_on_demand():
+    store = GroupStore(group_size=2, capacity=2)
+    for task_id in range(5):
+        store.add(_status(task_id, task_id))
+    assert len(store.task_ids) == 8
+    for task_id in range(5):
+        store.add(_status(task_id, -task_id))
+    task_ids, scores, *_ = store.pop_completed()
+    assert task_ids == list(range(5))
+    np.testing.assert_array_equal(scores[:, 1], -np.arange(5))
+
+    # a freed slot starts empty
+    store.add(_status(9, 0.5))
+    assert store.counts[store.slots[9]] == 1
+    assert len(store.free) == 7
+
+
+def test_unknown_node_notifies_all_and_pop_returns_partial_groups():
+    store = GroupStore(group_size=4)
+    store.add(_status(3, 0.5, node=1))
+    store.add(_status(3, 0.7, node=-1))
+    scores, completion_ids, nodes = store.pop(3)
+    np.testing.assert_array_equal(scores, [0.5, 0.7])
+    assert completion_ids.shape == (2, 16)
+    assert nodes == -1
+    assert store.pop(3) is None
+    assert len(store) == 0
@@ -0,0 +1,66 @@
+import os
+import queue
+
+from trainer.utils import process
+from trainer.utils.process import ReprocessPool, _reprocess_worker
+
+
+class _DummyProcessor:
+    pass
+
+
+def test_worker_reports_exceptions(monkeypatch):
+    import transformers
+
+    def fake_process_inputs(inputs, processor, max_prompt_length):
+        if inputs[0]["completion_ids"] == "bad":
+            raise ValueError("cannot decode image")
+        return {"n": len(inputs)}
+
+    monkeypatch.setattr(transformers.AutoProcessor, "from_pretrained", lambda *args, **kwargs: _DummyProcessor())
+    monkeypatch.setattr(process, "_process_inputs", fake_process_inputs)
+    in_queue, out_queue = queue.Queue(), queue.Queue()
+    for item in [(0, [{"completion_ids": "bad"}]), (1, [{"completion_ids": [1]}, {"completion_ids": [2]}]), None]:
+        in_queue.put(item)
+    _reprocess_worker("dummy", 16, in_queue, out_queue)
+
+    seq, payload, _, _, error = out_queue.get_nowait()
+    assert (seq, payload) == (0, None)
+    assert error == "ValueError: cannot decode image"
+    seq, payload, _, _, error = out_queue.get_nowait()
+    assert seq == 1 and payload is not None and error is None
+
+
+def _crashing_worker(name, max_prompt_length, in_queue, out_queue, image_cache_dir=None, current=None):
+    import pickle
+    import time
+    while True:
+        item = in_queue.get()
+        if item is None:
+            break
+        seq, inputs = item
+        current.value = seq
+        if inputs == "crash":
+            os._exit(3)
+        out_queue.put((seq, pickle.dumps(inputs), time.time(), time.time(), None))
+        current.value = -1
+
+
+class _CrashingPool(ReprocessPool):
+    worker = staticmethod(_crashing_worker)
+
+
+def test_pool_reports_chunks_of_dead_workers_and_respawns():
+    pool = _CrashingPool("dummy", 16, num_workers=1, check_interval=0.2)
+    try:
+        pool.submit(0, "crash")
+        seq, chunk_data, _, _, error = pool.get()
+        assert (seq, chunk_data) == (0, None)
+        assert "exited with code 3" in error
+        assert pool.respawned == 1
+
+        # the respawned worker keeps serving
+        pool.submit(1, "ok")
+        assert pool.get()[:2] == (1, "ok")
+    finally:
+        pool.close()
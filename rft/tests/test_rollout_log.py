@@ -0,0 +1,64 @@
+import os
+import shutil
+
+from trainer.utils.rollout_log import (
+    ROLLOUT_SNAPSHOT_DIR,
+    RolloutLog,
+    load_snapshot,
+    load_snapshot_entries,
+    resolve_rollout_resume_dir,
+)
+
+
+def _snapshot_path(output_dir, step, name="global"):
+    return os.path.join(output_dir, f"checkpoint-{step}", ROLLOUT_SNAPSHOT_DIR, f"{name}.pkl")
+
+
+def test_replay_after_snapshot_and_torn_tail(tmp_path):
+    log = RolloutLog(str(tmp_path / "log"), "global")
+    log.append("status", 1)
+    segment = log.snapshot(_snapshot_path(tmp_path, 10), {"gid": 3}, entries=iter(["a", "b"]))
+    log.append("status", 2)
+    log.append("status", 3)
+    log.close()
+    with open(log.segments()[-1][1], "ab") as f:
+        f.write(b"\x80\x05torn")
+
+    snapshot = load_snapshot(_snapshot_path(tmp_path, 10))
+    assert snapshot == {"segment": segment, "state": {"gid": 3}}
+    assert list(load_snapshot_entries(_snapshot_path(tmp_path, 10))) == ["a", "b"]
+    assert list(log.replay(segment)) == [("status", 2), ("status", 3)]
+    # a restarted process never appends to an existing segment
+    assert RolloutLog(str(tmp_path / "log"), "global").segment == segment + 1
+
+
+def test_prune_keeps_segments_of_every_kept_checkpoint(tmp_path):
+    log = RolloutLog(str(tmp_path / "log"), "global")
+    other = RolloutLog(str(tmp_path / "log"), "node0")
+    segments = {}
+    for step in (10, 20, 30):
+        log.append("status", step)
+        other.append("status", step)
+        segments[step] = log.snapshot(_snapshot_path(tmp_path, step), {})
+    # every checkpoint kept, only the segment before the first snapshot goes
+    assert [seq for seq, _ in log.segments()] == [segments[10], segments[20]]
+
+    # the trainer rotates checkpoint-10 and checkpoint-20 away
+    shutil.rmtree(tmp_path / "checkpoint-10")
+    shutil.rmtree(tmp_path / "checkpoint-20")
+    log.append("status", 40)
+    segments[40] = log.snapshot(_snapshot_path(tmp_path, 40), {})
+    # segment files are created by the first append
+    assert [seq for seq, _ in log.segments()] == [segments[30]]
+    assert list(log.replay(segments[30])) == [("status", 40)]
+    # the logs of other managers are pruned by their own snapshots only
+    assert len(other.segments()) == 1
+
+
+def test_resolve_rollout_resume_dir(tmp_path):
+    assert resolve_rollout_resume_dir(None, str(tmp_path)) is None
+    assert resolve_rollout_resume_dir(True, str(tmp_path)) is None
+    os.makedirs(tmp_path / "checkpoint-5")
+    os.makedirs(tmp_path / "checkpoint-12")
+    assert resolve_rollout_resume_dir(True, str(tmp_path)) == str(tmp_path / "checkpoint-12" / ROLLOUT_SNAPSHOT_DIR)
+    assert resolve_rollout_resume_dir("ckpt", str(tmp_path)) == os.path.join("ckpt", ROLLOUT_SNAPSHOT_DIR)
@@ -0,0 +1,71 @@
+from collections import Counter
+
+from trainer.utils import scheduler
+from trainer.utils.scheduler import ContinuationScheduler
+
+N = 10
+
+
+def _put_group(sched, gid, step, root, copies=2):
+    for _ in range(copies):
+        sched.put(gid, step * N + root)
+
+
+def test_per_root_cap_counts_groups_not_copies():
+    sched = ContinuationScheduler(N, max_outstanding_per_root=1)
+    _put_group(sched, gid=1, step=1, root=3)
+    _put_group(sched, gid=2, step=1, root=3)
+    _put_group(sched, gid=3, step=1, root=4)
+
+    # both copies of the first group of root 3 and of root 4, the second group of root 3 waits
+    assert sorted(sched.take(8)) == [13, 13, 14, 14]
+    assert len(sched) == 2
+    assert sched.take(8) == []
+
+    # the next step of root 3 arrives: its step 1 group came back
+    _put_group(sched, gid=5, step=2, root=3)
+    assert sorted(sched.take(8)) == [13, 13]
+
+
+def test_cap_expires_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(scheduler.time, "monotonic", lambda: now[0])
+    sched = ContinuationScheduler(N, max_outstanding_per_root=1, outstanding_ttl=60)
+    _put_group(sched, gid=1, step=1, root=3, copies=1)
+    _put_group(sched, gid=2, step=1, root=3, copies=1)
+    assert sched.take(4) == [13]
+    assert sched.take(4) == []
+    now[0] += 61
+    assert sched.take(4) == [13]
+
+
+def test_steps_share_slots_by_weight():
+    sched = ContinuationScheduler(N, depth_weights=[1.0, 1.0, 3.0], aging=0.0)
+    for gid in range(20):
+        sched.put(gid, 1 * N + gid % N)
+        sched.put(gid, 2 * N + gid % N)
+    steps = Counter(index // N for index in sched.take(8))
+    assert steps == {1: 2, 2: 6}
+
+
+def test_max_fraction_and_accept():
+    sched = ContinuationScheduler(N, max_fraction=0.5)
+    for root in range(6):
+        sched.put(root, N + root)
+    assert len(sched.take(4)) == 2
+    # only even roots are owned by the requesting node
+    assert sorted(sched.take(8, accept=lambda index: index % 2 == 0)) == [12, 14]
+    stats = sched.stats()
+    assert stats[1]["received"] == 6 and stats[1]["dispatched"] == 4 and stats[1]["queued"] == 2
+
+
+def test_aging_lets_a_waiting_step_win(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(scheduler.time, "monotonic", lambda: now[0])
+    sched = ContinuationScheduler(N, depth_weights=[1.0, 1.0, 100.0], aging=1.0)
+    sched.put(0, 1 * N + 1)
+    now[0] = 50.0
+    for gid in range(5):
+        sched.put(gid, 2 * N + gid)
+    # step 1 waited 50s, more than step 2's weight advantage for a single slot
+    assert sched.take(1) == [11]
@@ -0,0 +1,56 @@
+import gc
+import os
+
+import pytest
+import torch
+
+from trainer.utils.shm_ring import ShmRing, ShmRingReader
+from trainer.utils.wire import serialize_to_frames
+
+
+@pytest.fixture
+def ring():
+    ring = ShmRing(f"arl_test_ring_{os.getpid()}", num_slots=2, slot_bytes=4096, create=True)
+    yield ring
+    gc.collect()
+    ring.close()
+
+
+def test_slot_is_reused_after_all_ranks_release(ring):
+    first = ring.acquire(refs=2)
+    second = ring.acquire(refs=2)
+    assert {first, second} == {0, 1}
+    assert ring.acquire(refs=2) is None
+    assert ring.in_use == 2
+
+    ring.release(first)
+    # one of the two ranks still reads the slot
+    assert ring.acquire(refs=2) is None
+    ring.release(first)
+    assert ring.in_use == 1
+    assert ring.acquire(refs=2) == first
+
+
+def test_readers_rebuild_chunks_written_into_a_reused_slot(ring):
+    reader = ShmRingReader()
+    for step in range(3):
+        chunk = {"input_ids": torch.full((4, 8), step, dtype=torch.int64), "step": step}
+        frames = serialize_to_frames(chunk)
+        assert ring.fits(frames)
+        slot = ring.acquire(refs=1)
+        ring.write(slot, frames)
+
+        read_slot, received = reader.read(ring.control_message(slot))
+        assert read_slot == slot and received["step"] == step
+        assert torch.equal(received["input_ids"], chunk["input_ids"])
+        del received
+        ring.release(slot)
+    assert ring.in_use == 0
+    del reader
+    gc.collect()
+
+
+def test_fits_accounts_for_the_header_and_alignment(ring):
+    assert ring.fits([b"x" * (4096 - 64)])
+    assert not ring.fits([b"x" * (4096 - 64), b"y"])
+    assert not ring.fits([b"x" * 4096])
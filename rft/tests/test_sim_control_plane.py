@@ -0,0 +1,25 @@
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+RFT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("extra", [[], ["--flow-control", "--group-affinity", "--max-cache-factor", "1"]],
+                         ids=["default", "credits-affinity"])
+def test_control_plane_trains(extra):
+    # end to end: the real managers and dispatcher in local processes with fake trainer ranks
+    port = 18000 + 100 * len(extra) + os.getpid() % 50
+    result = subprocess.run(
+        [sys.executable, "benchmarks/sim_control_plane.py", "--nodes", "2", "--ranks-per-node", "2",
+         "--seconds", "8", "--gen-latency", "0.1", "--step-time", "0.05", "--chunk-mb", "0.1",
+         "--port", str(port), *extra],
+        cwd=RFT_DIR, capture_output=True, text=True, timeout=240,
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    steps = re.search(r"([\d.]+) steps/s", result.stdout)
+    assert steps is not None, result.stdout[-2000:]
+    assert float(steps.group(1)) > 0
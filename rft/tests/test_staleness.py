@@ -0,0 +1,58 @@
+import queue
+import uuid
+from collections import Counter
+
+import torch
+
+from trainer.utils.tracing import StageTracer
+from trainer.zmq import LocalBalanceManager, TaskAndContent, TaskStatus
+
+
+def _manager(max_staleness, policy_version=10, chunk_size=3):
+    manager = object.__new__(LocalBalanceManager)
+    manager.max_staleness = max_staleness
+    manager.policy_version = policy_version
+    manager.chunk_size = chunk_size
+    manager.valid_tasks = queue.Queue()
+    manager.straggler_counts = Counter()
+    manager.tracer = StageTracer("test")
+    return manager
+
+
+def _tac(version):
+    status = TaskStatus(task_id=0, completion_id=uuid.uuid4(), score=1.0, policy_version=version)
+    return TaskAndContent(data={"policy_version": version}, status=status)
+
+
+def test_staleness_is_zero_for_unknown_versions():
+    manager = _manager(max_staleness=2)
+    assert manager._staleness(7) == 3
+    assert manager._staleness(-1) == 0
+    manager.policy_version = -1
+    assert manager._staleness(7) == 0
+
+
+def test_collect_tasks_drops_stale_completions():
+    manager = _manager(max_staleness=2)
+    for version in [10, 5, 8, 7, -1, 9]:
+        manager.valid_tasks.put(_tac(version))
+    collected = manager._collect_tasks()
+    assert [tac.status.policy_version for tac in collected] == [10, 8, -1]
+    assert manager.straggler_counts["stale"] == 2
+    assert manager.tracer.counters["stale_completions"] == 2
+    assert manager.valid_tasks.qsize() == 1
+
+
+def test_collect_tasks_keeps_everything_without_a_limit():
+    manager = _manager(max_staleness=0)
+    for version in [0, 1, 2]:
+        manager.valid_tasks.put(_tac(version))
+    assert len(manager._collect_tasks()) == 3
+    assert not manager.straggler_counts
+
+
+def test_chunk_staleness_uses_the_oldest_completion():
+    manager = _manager(max_staleness=2)
+    assert manager._chunk_staleness({"policy_versions": torch.tensor([9, 6, 10])}) == 4
+    assert manager._chunk_staleness({"policy_versions": torch.tensor([], dtype=torch.int64)}) == 0
+    assert manager._chunk_staleness({}) == 0
@@ -0,0 +1,52 @@
+import pickle
+import uuid
+
+import zmq
+
+from trainer.zmq import AsyncStatusSender, TaskStatus
+
+
+def _status(i):
+    return TaskStatus(task_id=i, completion_id=uuid.uuid4(), score=0.5)
+
+
+def test_pipelined_batches_are_acknowledged_asynchronously():
+    context = zmq.Context()
+    router = context.socket(zmq.ROUTER)
+    router.bind("inproc://status-sender-test")
+    sender = AsyncStatusSender(context, "inproc://status-sender-test", max_inflight=2)
+    try:
+        batch = [_status(i) for i in range(3)]
+        sender.send(batch)
+        sender.send(_status(3))
+        assert sender.inflight == 2
+
+        # the coordinator sees [identity, empty delimiter, payload], like from a REQ socket
+        envelopes = []
+        for expected in (batch, _status(3)):
+            identity, delimiter, payload = router.recv_multipart()
+            envelopes.append((identity, delimiter))
+            received = pickle.loads(payload)
+            if isinstance(expected, list):
+                assert [s.completion_id for s in received] == [s.completion_id for s in batch]
+            else:
+                assert received.task_id == 3
+        assert all(delimiter == b"" for _, delimiter in envelopes)
+
+        router.send_multipart([envelopes[0][0], b"", b"Recived"])
+        while sender.inflight == 2:
+            sender.socket.poll(1000)
+            sender.poll_acks()
+        assert sender.inflight == 1
+
+        # a third message fits in the window again, flush waits for the rest
+        sender.send(_status(4))
+        identity, _, _ = router.recv_multipart()
+        for _ in range(2):
+            router.send_multipart([identity, b"", b"Recived"])
+        sender.flush()
+        assert sender.inflight == 0
+    finally:
+        sender.socket.close(linger=0)
+        router.close(linger=0)
+        context.term()
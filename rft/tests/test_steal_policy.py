@@ -0,0 +1,57 @@
+import random
+
+import pytest
+
+from trainer.utils.steal_policy import (
+    PowerOfTwoChoicesPolicy,
+    RandomDonorPolicy,
+    StealCostModel,
+    build_steal_policy,
+)
+
+
+def test_cost_model_learns_from_observations():
+    model = StealCostModel(bandwidth=1e9, latency=0.0, chunk_bytes=1e6, consume_rate=1.0, alpha=1.0)
+    assert model.transfer_time(10) == pytest.approx(0.01)
+    model.observe_transfer(num_chunks=2, nbytes=4e8, seconds=2.0)
+    assert model.chunk_bytes == 2e8 and model.bandwidth == 2e8
+    model.observe_consumption(num_chunks=8, seconds=2.0)
+    assert model.idle_time(8) == pytest.approx(2.0)
+    # empty or instant observations are ignored
+    model.observe_transfer(0, 0, 1.0)
+    model.observe_consumption(0, 1.0)
+    assert model.bandwidth == 2e8 and model.consume_rate == 4.0
+
+
+def test_worthwhile_only_when_chunks_arrive_before_the_queue_runs_dry():
+    model = StealCostModel(bandwidth=1e8, latency=0.0, chunk_bytes=1e8, consume_rate=1.0)
+    # 2 chunks take 2s to arrive
+    assert model.worthwhile(2, local_queue=3)
+    assert not model.worthwhile(2, local_queue=1)
+    assert not model.worthwhile(2, local_queue=0)
+
+
+def test_plan_steals_half_the_gap_from_a_donor_above_the_mean():
+    policy = RandomDonorPolicy(steal_threshold=4, rng=random.Random(0))
+    queues = {"a": 0, "b": 30, "c": 30}
+    addr, n = policy.plan("a", queues, local_queue=0)
+    assert addr in ("b", "c") and n == 5
+    # not starving enough, or nobody to steal from
+    assert policy.plan("a", {"a": 18, "b": 22, "c": 20}, local_queue=18) is None
+    assert policy.plan("a", {"a": 0}, local_queue=0) is None
+
+
+def test_p2c_prefers_the_longer_of_two_donors():
+    policy = PowerOfTwoChoicesPolicy(steal_threshold=1, rng=random.Random(0))
+    assert policy.choose([("b", 10), ("c", 40)]) == ("c", 40)
+    assert policy.choose([("b", 10)]) == ("b", 10)
+
+
+def test_cost_model_vetoes_slow_steals():
+    policy = build_steal_policy("p2c", steal_threshold=4, rng=random.Random(0))
+    policy.cost_model = StealCostModel(bandwidth=1e6, latency=0.0, chunk_bytes=1e8, consume_rate=1.0)
+    assert policy.plan("a", {"a": 10, "b": 50, "c": 50}, local_queue=10) is None
+    policy.cost_model.bandwidth = 1e10
+    assert policy.plan("a", {"a": 10, "b": 50, "c": 50}, local_queue=10) is not None
+    with pytest.raises(ValueError):
+        build_steal_policy("greedy")
@@ -0,0 +1,79 @@
+import uuid
+from collections import Counter, defaultdict
+
+import numpy as np
+import pytest
+
+from trainer.zmq import GlobalSyncManager, GroupStore, TaskStatus
+
+
+class _Dispatch:
+    def __init__(self):
+        self.sent = []
+
+    def send_pyobj(self, obj):
+        self.sent.append(obj)
+
+    def recv(self):
+        return b"ok"
+
+
+def _manager(policy, num_generations=4, dispatch=True):
+    manager = object.__new__(GlobalSyncManager)
+    manager.num_generations = num_generations
+    manager.straggler_policy = policy
+    manager.task_collection = GroupStore(num_generations)
+    manager.straggler_missing = defaultdict(int)
+    manager.straggler_groups = []
+    manager.straggler_counts = Counter()
+    manager.task_dispatch = _Dispatch() if dispatch else None
+    manager.current_gid = 7
+    return manager
+
+
+def _arrive(manager, task_id, scores):
+    for score in scores:
+        manager.task_collection.add(TaskStatus(task_id=task_id, completion_id=uuid.uuid4(), score=score, node=0))
+
+
+def test_pad_fills_missing_scores_with_the_mean():
+    manager = _manager("pad")
+    _arrive(manager, 1, [0.0, 1.0])
+    assert manager._resolve_straggler(1, step_id=0) == "pad"
+
+    task_id, completion_ids, scores, advantages, nodes = manager.straggler_groups[0]
+    padded = np.array([0.0, 1.0, 0.5, 0.5])
+    np.testing.assert_allclose(advantages, (scores - padded.mean()) / (padded.std() + 1e-2))
+    assert len(completion_ids) == 2 and nodes == 1
+    assert manager.straggler_missing[1] == 2
+    assert manager.straggler_counts == Counter(pad_groups=1, missing_completions=2)
+    # resolved groups are gone, a second report is unknown
+    assert manager._resolve_straggler(1, step_id=0) == "unknown"
+
+
+def test_pad_needs_two_scores():
+    manager = _manager("pad")
+    _arrive(manager, 1, [0.3])
+    assert manager._resolve_straggler(1, step_id=0) == "drop"
+    assert manager.straggler_groups[0][3] is None
+
+
+def test_regenerate_requeues_first_steps_only():
+    manager = _manager("regenerate")
+    _arrive(manager, 1, [0.1, 0.9])
+    _arrive(manager, 2, [0.1, 0.9])
+    assert manager._resolve_straggler(1, step_id=0) == "regenerate"
+    assert manager.task_dispatch.sent == [{"requeue": [1] * 4, "priority": 7}]
+    # later steps of a multi-turn task fall back to pad
+    assert manager._resolve_straggler(2, step_id=1) == "pad"
+
+
+@pytest.mark.parametrize("dispatch", [False, True])
+def test_regenerate_without_dispatch_or_on_replay(dispatch):
+    manager = _manager("regenerate", dispatch=dispatch)
+    _arrive(manager, 1, [0.1, 0.9])
+    policy = manager._resolve_straggler(1, step_id=0, dispatch=False)
+    assert policy == ("regenerate" if dispatch else "pad")
+    if dispatch:
+        # replayed from the rollout log: already requeued before the restart
+        assert manager.task_dispatch.sent == []
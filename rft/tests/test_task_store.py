@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+
+from trainer.utils.task_store import SpillingTaskStore
+from trainer.zmq import TaskAndContent, TaskStatus
+
+
+def _tac(task_id, nbytes=1024):
+    return TaskAndContent(
+        data={"id": task_id, "completion_ids": np.full(nbytes, task_id, dtype=np.uint8)},
+        status=TaskStatus(task_id=task_id, completion_id=f"c{task_id}", score=0.5),
+    )
+
+
+def test_spill_and_restore_share_status(tmp_path):
+    store = SpillingTaskStore(max_bytes=3000, directory=str(tmp_path), segment_bytes=4096)
+    entries = [_tac(i) for i in range(6)]
+    for tac in entries:
+        store[tac.status.completion_id] = tac
+
+    assert len(store) == 6
+    assert store.counters["spilled"] > 0
+    assert any(name.endswith(".spill") for name in os.listdir(tmp_path))
+
+    # status of a spilled entry is read without loading and is the object the loaded copy carries
+    statuses = dict(store.statuses())
+    statuses["c0"].advantage = 1.5
+    loaded = store["c0"]
+    assert loaded.status is entries[0].status
+    assert loaded.status.advantage == 1.5
+    np.testing.assert_array_equal(loaded.data["completion_ids"], entries[0].data["completion_ids"])
+    assert store.counters["loaded"] == 1
+
+    for tac in entries:
+        restored = store.pop(tac.status.completion_id)
+        assert restored.data["id"] == tac.data["id"]
+    assert len(store) == 0
+    # sealed segments are removed once empty, only the one still being appended to remains
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".spill")]) == 1
+
+
+def test_discard_does_not_load(tmp_path):
+    store = SpillingTaskStore(max_bytes=3000, directory=str(tmp_path))
+    for i in range(6):
+        store[f"c{i}"] = _tac(i)
+
+    assert store.discard("c0") is True
+    assert store.discard("c5") is True
+    assert store.discard("c0") is False
+    assert store.counters["loaded"] == 0
+    assert sorted(store.keys()) == ["c1", "c2", "c3", "c4"]
+
+
+def test_disk_budget_evicts_oldest(tmp_path):
+    store = SpillingTaskStore(max_bytes=2000, directory=str(tmp_path), max_disk_bytes=3000)
+    for i in range(8):
+        store[f"c{i}"] = _tac(i)
+
+    assert store.counters["evicted"] > 0
+    assert "c0" not in store
+    assert "c7" in store
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from trainer.utils.tracing import BUCKETS, STAGES, StageHistogram, StageTracer, mark
+
+
+def test_quantile_returns_the_bucket_upper_bound():
+    h = StageHistogram()
+    assert h.quantile(0.5) == 0.0
+    for seconds in [0.02, 0.05, 0.3, 0.3, 4.0, 7.0, 7.0, 20.0, 100.0, 5000.0]:
+        h.observe(seconds)
+    # bounds are inclusive, like Prometheus `le`
+    assert h.counts[BUCKETS.index(0.05)] == 2
+    assert h.quantile(0.0) == 0.05
+    assert h.quantile(0.2) == 0.05
+    assert h.quantile(0.5) == 5
+    assert h.quantile(0.8) == 30
+    assert h.quantile(0.9) == 120
+    assert h.quantile(0.99) == float("inf")
+    assert h.count == 10 and h.sum == pytest.approx(5138.67)
+
+
+def test_tracer_records_complete_stages_only():
+    tracer = StageTracer("node0")
+    times = {}
+    mark(times, "generation_start", 100.0)
+    mark(times, "generated", 103.0)
+    mark(times, "cached", 103.2)
+    mark(times, "served", 160.0)
+    tracer.record_many([times, {}])
+    tracer.count("dropped_completions", 3)
+
+    snapshot = tracer.snapshot()
+    assert set(snapshot["stages"]) == set(STAGES)
+    assert snapshot["stages"]["generation"]["count"] == 1
+    assert snapshot["stages"]["generation"]["p50"] == 5
+    assert snapshot["stages"]["end_to_end"]["p50"] == 60
+    assert snapshot["stages"]["reprocess"]["count"] == 0
+    assert snapshot["counters"] == {"dropped_completions": 3}
+    json.dumps(snapshot)
+
+
+def test_prometheus_buckets_are_cumulative():
+    tracer = StageTracer("node0")
+    tracer.record({"generation_start": 0.0, "generated": 0.2})
+    tracer.record({"generation_start": 0.0, "generated": 3.0})
+    text = tracer.prometheus({"ready": 4})
+    lines = text.splitlines()
+    assert 'arl_stage_seconds_bucket{node="node0",stage="generation",le="0.25"} 1' in lines
+    assert 'arl_stage_seconds_bucket{node="node0",stage="generation",le="5"} 2' in lines
+    assert 'arl_stage_seconds_bucket{node="node0",stage="generation",le="+Inf"} 2' in lines
+    assert 'arl_stage_seconds_count{node="node0",stage="generation"} 2' in lines
+    assert 'arl_queue_length{node="node0",queue="ready"} 4' in lines
@@ -0,0 +1,54 @@
+import pytest
+import zmq
+
+from trainer.utils.transport import global_endpoint, local_ip, single_node, tune_socket
+
+
+@pytest.mark.parametrize("env, expected", [
+    ({}, True),
+    ({"WORLD_SIZE": "8"}, False),
+    ({"WORLD_SIZE": "8", "LOCAL_WORLD_SIZE": "8"}, True),
+    # fewer ranks than GPUs on each of two hosts
+    ({"WORLD_SIZE": "8", "LOCAL_WORLD_SIZE": "4"}, False),
+])
+def test_single_node(monkeypatch, env, expected):
+    monkeypatch.delenv("WORLD_SIZE", raising=False)
+    monkeypatch.delenv("LOCAL_WORLD_SIZE", raising=False)
+    for key, value in env.items():
+        monkeypatch.setenv(key, value)
+    assert single_node() is expected
+
+
+def test_global_endpoint(monkeypatch):
+    monkeypatch.setenv("WORLD_SIZE", "16")
+    monkeypatch.setenv("LOCAL_WORLD_SIZE", "8")
+    assert global_endpoint("sync", "10.0.0.1", 5555) == "tcp://10.0.0.1:5555"
+    assert global_endpoint("sync", "10.0.0.1", 5555, transport="ipc").startswith("ipc://")
+    monkeypatch.setenv("WORLD_SIZE", "8")
+    assert global_endpoint("sync", "10.0.0.1", 5555).endswith("arl_sync_5555")
+    assert global_endpoint("sync", "10.0.0.1", 5555, transport="tcp") == "tcp://10.0.0.1:5555"
+    with pytest.raises(AssertionError):
+        global_endpoint("sync", "10.0.0.1", 5555, transport="udp")
+
+
+def test_tune_socket_only_touches_tcp_and_default_hwms(monkeypatch):
+    monkeypatch.setenv("ZMQ_TCP_HWM", "123")
+    context = zmq.Context()
+    try:
+        tcp, ipc, unbounded = context.socket(zmq.PUSH), context.socket(zmq.PUSH), context.socket(zmq.PUSH)
+        unbounded.setsockopt(zmq.SNDHWM, 0)
+        tune_socket(tcp, "tcp://127.0.0.1:1")
+        tune_socket(ipc, "ipc:///tmp/x")
+        tune_socket(unbounded, "tcp://127.0.0.1:1")
+        assert tcp.getsockopt(zmq.SNDHWM) == 123 and tcp.getsockopt(zmq.SNDBUF) == 4 * 2**20
+        assert ipc.getsockopt(zmq.SNDHWM) == 1000
+        assert unbounded.getsockopt(zmq.SNDHWM) == 0 and unbounded.getsockopt(zmq.RCVHWM) == 123
+        for sock in (tcp, ipc, unbounded):
+            sock.close(linger=0)
+    finally:
+        context.term()
+
+
+def test_local_ip():
+    assert local_ip("ipc:///tmp/x") == "127.0.0.1"
+    assert local_ip("tcp://127.0.0.1:5555") == "127.0.0.1"
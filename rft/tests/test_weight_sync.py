@@ -0,0 +1,74 @@
+import threading
+
+import torch
+
+from trainer.utils import weight_sync
+from trainer.utils.weight_sync import WeightSyncEngine
+
+WORLD = 3
+
+
+class _Group:
+    """Process group of one simulated rank, all ranks share `sends` and `barrier`."""
+
+    def __init__(self, rank, sends, barrier):
+        self.rank = rank
+        self.sends = sends
+        self.barrier = barrier
+
+
+class _Mesh:
+    def __init__(self, group):
+        self.group = group
+
+    def get_group(self):
+        return self.group
+
+
+class _Shard:
+    """The local Shard(0) of a DTensor: rank r holds rows [r * ceil(n / world), ...), the last ranks hold fewer or none."""
+
+    def __init__(self, full, mesh, rank):
+        self.shape = full.shape
+        self.device_mesh = mesh
+        shards = torch.chunk(full, WORLD, dim=0)
+        self.local = shards[rank] if rank < len(shards) else full[:0]
+
+    def to_local(self):
+        return self.local
+
+
+def _fake_all_gather(recv, send, group):
+    group.sends[group.rank] = send.clone()
+    group.barrier.wait()
+    torch.cat(group.sends, out=recv)
+
+
+def test_gather_bucket_unpacks_uneven_shards(monkeypatch):
+    monkeypatch.setattr(weight_sync.dist, "get_world_size", lambda group: WORLD)
+    monkeypatch.setattr(weight_sync.dist, "all_gather_into_tensor", _fake_all_gather)
+
+    # rows not divisible by the world size, fewer rows than ranks, 1-D and 3-D parameters
+    fulls = [torch.arange(n, dtype=torch.float32).reshape(shape)
+             for n, shape in [(21, (7, 3)), (8, (2, 4)), (5, (5,)), (40, (10, 2, 2))]]
+    sends, barrier = [None] * WORLD, threading.Barrier(WORLD)
+    engine = WeightSyncEngine(torch.nn.Linear(1, 1))
+    targets = [[torch.zeros(full.shape, dtype=torch.bfloat16) for full in fulls] for _ in range(WORLD)]
+    gathered = [None] * WORLD
+
+    def run(rank):
+        mesh = _Mesh(_Group(rank, sends, barrier))
+        bucket = [(_Shard(full, mesh, rank), tgt) for full, tgt in zip(fulls, targets[rank])]
+        gathered[rank] = engine._gather_bucket(bucket, "cpu")
+
+    threads = [threading.Thread(target=run, args=(rank,)) for rank in range(WORLD)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=30)
+
+    # per rank: 3 + 1 + 2 + 4 padded rows of (3, 4, 1, 4) values
+    assert gathered == [WORLD * (9 + 4 + 2 + 16) * 2] * WORLD
+    for rank in range(WORLD):
+        for full, tgt in zip(fulls, targets[rank]):
+            assert torch.equal(tgt, full.to(torch.bfloat16))
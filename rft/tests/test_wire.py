@@ -0,0 +1,61 @@
+import torch
+import zmq
+
+from trainer.utils.wire import deserialize_from_frames, recv_tensors, send_tensors, serialize_to_frames
+
+
+def _chunk():
+    return {
+        "prompt_inputs": {
+            "input_ids": torch.arange(12, dtype=torch.int64).reshape(3, 4),
+            "pixel_values": [torch.randn(3, 2, 2, dtype=torch.bfloat16), torch.randn(1, 5)],
+        },
+        # non-contiguous and empty tensors
+        "completion_mask": torch.ones(4, 3, dtype=torch.bool).t(),
+        "advantages": torch.empty(0),
+        "ids": [7, 8, 9],
+        "name": "chunk",
+    }
+
+
+def _assert_equal(a, b):
+    assert type(a) is type(b)
+    if isinstance(a, torch.Tensor):
+        assert a.dtype == b.dtype and a.shape == b.shape and torch.equal(a, b)
+    elif isinstance(a, dict):
+        assert a.keys() == b.keys()
+        for key in a:
+            _assert_equal(a[key], b[key])
+    elif isinstance(a, list):
+        assert len(a) == len(b)
+        for x, y in zip(a, b):
+            _assert_equal(x, y)
+    else:
+        assert a == b
+
+
+def test_round_trip_bytes():
+    chunk = _chunk()
+    frames = serialize_to_frames(chunk)
+    # header plus one frame per tensor
+    assert len(frames) == 1 + 5
+    _assert_equal(deserialize_from_frames([bytes(f) for f in frames]), chunk)
+
+
+def test_round_trip_over_zmq_without_copies():
+    context = zmq.Context()
+    sender, receiver = context.socket(zmq.PAIR), context.socket(zmq.PAIR)
+    try:
+        receiver.bind("inproc://wire-test")
+        sender.connect("inproc://wire-test")
+        chunk = _chunk()
+        send_tensors(sender, chunk)
+        _assert_equal(recv_tensors(receiver), chunk)
+
+        # frames built ahead of time, as the provider does
+        send_tensors(sender, frames=serialize_to_frames(chunk))
+        _assert_equal(recv_tensors(receiver), chunk)
+    finally:
+        sender.close(linger=0)
+        receiver.close(linger=0)
+        context.term()
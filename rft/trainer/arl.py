@@ -4,6 +4,7 @@ import torch.distributed.tensor
 import zmq
 import torch
 import datetime
+import time
 import pickle
 import uuid
 import transformers
@@ -54,6 +55,7 @@ from transformers.trainer import (
     remove_dummy_checkpoint,
     WEIGHTS_NAME,SAFE_WEIGHTS_NAME
 )
+from transformers.trainer_utils import PREFIX_CHECKPOINT_DIR
 
 
 if is_vllm_available():
@@ -62,10 +64,12 @@ if is_vllm_available():
 
 
 from configs import GRPOTrainingConfig
-from .utils import logger, Timer, _prepare_messages,_process_inputs,_create_inputs, no_sync, GlobalDistributed0MQDataLoader
+from .utils import logger, Timer, _prepare_messages,_process_inputs,_create_inputs, no_sync, GlobalDistributed0MQDataLoader, deserialize_from_frames, ShmRingReader, resolve_rollout_resume_dir, ImageCache, default_image_cache_dir, is_volatile_dir, compact_prompt, compact_token_ids, global_endpoint, transport, WeightSyncEngine
 from .zmq import global_sync_proc, local_balance_proc, TaskAndContent, TaskStatus
 
 RewardFunc = Union[str, PreTrainedModel, Callable[[list, list], list[float]]]
+# (name, low, high) buckets of the logged staleness histogram, in optimizer steps
+STALENESS_BUCKETS = [("0", 0, 1), ("1", 1, 2), ("2-3", 2, 4), ("4-7", 4, 8), ("8+", 8, float("inf"))]
 
 class AsyncRLGRPOTrainer(Trainer):
     """
@@ -245,10 +249,14 @@ class AsyncRLGRPOTrainer(Trainer):
         # it's safer to set it in all cases.
         set_seed(args.seed, device_specific=True)
         self.inference_model = None
+        self.weight_sync = None
         if self.accelerator.distributed_type == DistributedType.FSDP:
             # register_fsdp_forward_method(self.model_wrapped, "generate")
             # cache a model in cpu
             self.inference_model = create_reference_model(model).cpu()
+            # bucketed copy of the training weights into the bf16 inference model, None for the full state dict path
+            if args.weight_sync_bucket_mb > 0:
+                self.weight_sync = WeightSyncEngine(self.inference_model, args.weight_sync_bucket_mb)
             if self.accelerator.is_fsdp2:
                 self.accelerator.no_sync = MethodType(no_sync,self.accelerator)
 
@@ -294,10 +302,30 @@ class AsyncRLGRPOTrainer(Trainer):
             
         # Setup 0MQ
         self.greedy_gather_wait_time = args.greedy_gather_wait_time
+        # credit-based flow control of generation: the next batch waits in `pending_inputs` until the local balancer has room for it
+        self.generation_flow_control = args.generation_flow_control
+        self.generation_credit_retry_ms = args.generation_credit_retry_ms
+        self.generation_max_stall = args.generation_max_stall
+        self.pending_inputs = None
+        self.stall_start = None
+        self.stall_time = 0.0
+        # version of the weights loaded into the inference model (the global step), tagged on every completion
+        self.policy_version = 0
         self.main_process_ip = os.environ.get("MASTER_ADDR")
-        self.global_sync_address = f"tcp://{self.main_process_ip}:{args.global_task_sync_port}"
-        self.global_result_collect_address = f"tcp://{self.main_process_ip}:{args.global_result_collect_port}"
-        self.global_data_dispatch_address =  f"tcp://{self.main_process_ip}:{args.global_data_dispatch_port}"
+        # single-node jobs (all ranks local) reach the global endpoints over ipc unless `zmq_transport` forces tcp
+        self.global_sync_address = global_endpoint("sync", self.main_process_ip, args.global_task_sync_port, args.zmq_transport)
+        self.global_result_collect_address = global_endpoint("collect", self.main_process_ip, args.global_result_collect_port, args.zmq_transport)
+        self.global_data_dispatch_address = global_endpoint("dispatch", self.main_process_ip, args.global_data_dispatch_port, args.zmq_transport)
+        # rollout snapshot of the checkpoint we resume from, replayed by the sync managers together with the rollout logs
+        rollout_resume_dir = resolve_rollout_resume_dir(args.resume_from_checkpoint, args.output_dir) if args.rollout_log_dir else None
+        # node-local image cache shared by the ranks and the local balancer, rollouts reference their images by hash
+        self.image_cache_dir = (args.image_cache_dir or default_image_cache_dir(args.local_collect_address)) if args.compact_rollouts else None
+        if args.rollout_log_dir and self.image_cache_dir and is_volatile_dir(self.image_cache_dir):
+            # logged and snapshotted records reference their images by hash, a cache in memory is gone after a reboot
+            raise ValueError(
+                f"`compact_rollouts` with `rollout_log_dir` needs `image_cache_dir` on persistent storage, "
+                f"{self.image_cache_dir} is in memory. Set `image_cache_dir` to a local disk or disable `compact_rollouts`."
+            )
         
         if self.accelerator.is_main_process:
             # setup global sync thread
@@ -309,7 +337,12 @@ class AsyncRLGRPOTrainer(Trainer):
                     "num_generations": args.num_generations,
                     "num_to_sync": args.gradient_accumulation_steps * self.accelerator.num_processes * args.per_device_train_batch_size,
                     "num_nodes": self.accelerator.num_processes // torch.cuda.device_count(),
-                    "tp_size": self.tp_size
+                    "tp_size": self.tp_size,
+                    "rollout_log_dir": args.rollout_log_dir,
+                    "resume_dir": rollout_resume_dir,
+                    "straggler_policy": args.straggler_policy,
+                    "data_dispatch_address": self.global_data_dispatch_address,
+                    "report_outcomes": args.difficulty_filter != "off"
                 },
                 daemon=True
             )
@@ -332,7 +365,24 @@ class AsyncRLGRPOTrainer(Trainer):
                     "max_cache_size": args.gradient_accumulation_steps * args.per_device_train_batch_size * torch.cuda.device_count() * 8,
                     "processing_class_name_or_path": model.name_or_path,
                     "max_prompt_length": args.max_prompt_length,
-                    "tp_size": self.tp_size
+                    "tp_size": self.tp_size,
+                    "timeout": args.straggler_timeout,
+                    "steal_policy": args.steal_policy,
+                    "stage_trace_file": args.stage_trace_file,
+                    "stage_metrics_port": args.stage_metrics_port,
+                    "reprocess_workers": args.reprocess_workers,
+                    "image_cache_dir": self.image_cache_dir,
+                    "cache_memory_mb": args.cache_memory_mb,
+                    "cache_disk_mb": args.cache_disk_mb,
+                    "cache_spill_dir": args.cache_spill_dir,
+                    "node_rank": self.accelerator.process_index // torch.cuda.device_count(),
+                    "max_staleness": args.max_staleness,
+                    "shm_ring_slots": args.shm_ring_slots,
+                    "shm_slot_mb": args.shm_slot_mb,
+                    "report_batch_size": args.report_batch_size,
+                    "report_flush_interval": args.report_flush_interval,
+                    "rollout_log_dir": args.rollout_log_dir,
+                    "resume_dir": rollout_resume_dir
                 }
             )
             self.local_balance_proc.start()
@@ -348,16 +398,17 @@ class AsyncRLGRPOTrainer(Trainer):
         self.sync_signal.setsockopt(zmq.TCP_KEEPALIVE_CNT, 5)
         self.sync_signal.setsockopt(zmq.TCP_KEEPALIVE_INTVL, 10)
         self.sync_signal.setsockopt(zmq.SUBSCRIBE,b"SYNC_FOR_UPDATE")
-        self.sync_signal.connect(self.global_sync_address)
+        transport.connect(self.sync_signal, self.global_sync_address)
 
         self.balance_send = self.zmqctx.socket(zmq.REQ)
-        self.balance_send.connect(args.local_collect_address)
+        transport.connect(self.balance_send, args.local_collect_address)
+        self.image_cache = ImageCache(self.image_cache_dir) if self.image_cache_dir else None
 
         self.balance_recv = self.zmqctx.socket(zmq.REQ)
-        self.balance_recv.connect(args.local_provider_address)
+        transport.connect(self.balance_recv, args.local_provider_address)
         
         self.ack = self.zmqctx.socket(zmq.REQ)
-        self.ack.connect(self.global_result_collect_address)
+        transport.connect(self.ack, self.global_result_collect_address)
         
         self.poller = zmq.Poller()
         self.poller.register(self.sync_signal,zmq.POLLIN)
@@ -365,6 +416,10 @@ class AsyncRLGRPOTrainer(Trainer):
         self.poller.register(self.ack, zmq.POLLIN)
         
         self.recv_idx = 0
+        # chunks received through the shared-memory ring: (slot, data) still referenced by this rank
+        self.shm_reader = ShmRingReader()
+        self.shm_held_slots = []
+        self.shm_released_slots = []
         
         if self.device_mesh is not None:
             tp_group = dist.get_process_group_ranks(self.device_mesh.get_group("tp"))
@@ -380,12 +435,56 @@ class AsyncRLGRPOTrainer(Trainer):
         if self._signature_columns is None:
             self._signature_columns = ["prompt"]
 
+    def _request_chunk(self):
+        # release the shared-memory slots of chunks that are neither cached nor about to be trained on
+        # the policy version lets the balancer drop chunks that became too stale while queued
+        self.balance_recv.send_pyobj((self.tp_group_id,self.rank,self.recv_idx,self.shm_released_slots,self.policy_version))
+        self.shm_released_slots = []
+
+    def _recv_chunk(self):
+        kind, *frames = self.balance_recv.recv_multipart(copy=False)
+        if kind.bytes == b"SHM":
+            slot, data = self.shm_reader.read(frames[0].bytes)
+            self.shm_held_slots.append((slot, data))
+            return data
+        return deserialize_from_frames(frames)
+
+    def _release_consumed_chunks(self):
+        # called before a new batch is assembled: the previous batch has been trained on, so every
+        # shared-memory chunk that is no longer in `cached_data` can be reused by the balancer
+        held = []
+        for slot, data in self.shm_held_slots:
+            if any(d is data for d in self.cached_data):
+                held.append((slot, data))
+            else:
+                self.shm_released_slots.append(slot)
+        self.shm_held_slots = held
+
+    def _acquire_credit(self, n: int) -> bool:
+        # reserve room for `n` completions in the local balancer, returns False while it is full
+        if not self.generation_flow_control:
+            return True
+        now = time.perf_counter()
+        force = self.stall_start is not None and now - self.stall_start > self.generation_max_stall
+        if force:
+            logger.warning(f"Worker {self.rank} stalled {now - self.stall_start:.0f}s waiting for credit, generate anyway.")
+        self.balance_send.send_pyobj(("CREDIT", n, force))
+        if not self.balance_send.recv_pyobj():
+            if self.stall_start is None:
+                self.stall_start = now
+            return False
+        if self.stall_start is not None:
+            self.stall_time += time.perf_counter() - self.stall_start
+            self.stall_start = None
+        return True
+
     def _async_sampling(self, unwrapped_model, epoch_iterator, num_batches):
+        self._release_consumed_chunks()
         # initial batch fill
         current_batch = [self.cached_data.pop() for _ in range(min(num_batches, len(self.cached_data)))]
         if len(current_batch) < num_batches:
             # first send sync request
-            self.balance_recv.send_pyobj((self.tp_group_id,self.rank,self.recv_idx))
+            self._request_chunk()
 
         waiting_for_ack = False
         # `wait_time_ms` will hold our dynamic timeout (in milliseconds)
@@ -402,7 +501,7 @@ class AsyncRLGRPOTrainer(Trainer):
 
             # 2) if we successfully received backward data, reset wait_time and refill cache
             if self.balance_recv in socks and not waiting_for_ack:
-                data: dict = self.balance_recv.recv_pyobj()                
+                data: dict = self._recv_chunk()
                 batch_samples = [data] * self.num_iterations
                 self.recv_idx += 1
                 self.ack.send_pyobj(self.chunk_size)
@@ -417,7 +516,7 @@ class AsyncRLGRPOTrainer(Trainer):
                     self.cached_data.extend(batch_samples[needed:])
                     # if still short, ask for more
                     if len(current_batch) < num_batches and len(self.cached_data) < self.max_items_to_cache:
-                        self.balance_recv.send_pyobj((self.tp_group_id,self.rank,self.recv_idx))
+                        self._request_chunk()
                     else:
                         wait_time_ms = 0 # reset wait_time_ms to 0 to avoid waiting for more data
                 else:
@@ -456,16 +555,31 @@ class AsyncRLGRPOTrainer(Trainer):
                 continue
 
             # 5) wait_time_ms has decayed to zero → do a sample step
-            try:
-                inputs = next(epoch_iterator)
-                self.sample_step(inputs, unwrapped_model)
-            except StopIteration:
-                # iterator is exhausted
+            if self.pending_inputs is None:
+                try:
+                    self.pending_inputs = next(epoch_iterator)
+                except StopIteration:
+                    # iterator is exhausted
+                    continue
+            if not self._acquire_credit(len(self.pending_inputs[1])):
+                # the local balancer is full: keep serving backward data and sync signals, retry once the wait decays
+                wait_time_ms = self.generation_credit_retry_ms
                 continue
+            inputs, self.pending_inputs = self.pending_inputs, None
+            self.sample_step(inputs, unwrapped_model)
                 
         if waiting_for_ack:
             self.ack.recv()
 
+        # export the time this step's sampling waited for credit, an ongoing stall is counted up to now
+        if self.stall_start is not None:
+            now = time.perf_counter()
+            self.stall_time += now - self.stall_start
+            self.stall_start = now
+        if self.generation_flow_control:
+            self._metrics["train"]["generation/stall_time"].append(self.stall_time)
+        self.stall_time = 0.0
+
         return current_batch
 
     def _iter_data_sampling(self, epoch_iterator, num_batches):
@@ -489,6 +603,7 @@ class AsyncRLGRPOTrainer(Trainer):
         # 2. keep sampling until signal received.
         # 3. return the batch_samples and num_items_in_batch when the global batch all ready 
 
+        self.policy_version = self.state.global_step
         with torch.no_grad():
             with self.prepare_generation(self.model_wrapped) as unwrapped_model:
                 batch_samples = self._async_sampling(
@@ -515,6 +630,23 @@ class AsyncRLGRPOTrainer(Trainer):
         yield len(batch_samples)
         yield from batch_samples
 
+    def _sync_inference_model(self, model_wrapped, device) -> bool:
+        # returns False when the weight sync engine cannot map the model, the caller then loads a full state dict
+        if self.weight_sync is None:
+            return False
+        try:
+            stats = self.weight_sync.sync(model_wrapped, device)
+        except ValueError as e:
+            # raised by every rank before any collective, the names are the same everywhere
+            logger.warning(f"Bucketed weight sync disabled, fall back to the full state dict: {e}")
+            self.weight_sync = None
+            return False
+        for k, v in stats.items():
+            self._metrics["train"][f"weight_sync/{k}"].append(v)
+        logger.debug(f"Worker {self.rank} synced inference weights in {stats['seconds']:.2f}s, "
+                     f"peak memory {stats['peak_memory_gb']:.2f} GB, skipped {stats['skipped_gb']:.2f} GB frozen")
+        return True
+
     @contextlib.contextmanager
     def prepare_generation(self, model_wrapped, clear_device: bool = None, update_inference_model: bool = True):
         clear_device = clear_device if clear_device is not None else self.clear_device
@@ -538,7 +670,11 @@ class AsyncRLGRPOTrainer(Trainer):
         elif self.accelerator.distributed_type == DistributedType.FSDP:
             if self.accelerator.is_fsdp2:
                 
-                if update_inference_model:
+                if update_inference_model and self._sync_inference_model(model_wrapped, device):
+                    if self.update_ref_model:
+                        self.ref_model.load_state_dict(self.inference_model.state_dict(),strict=True)
+                        self.update_ref_model = False
+                elif update_inference_model:
                     state_dict = model_wrapped.state_dict()
                     class wrappeddict(dict):
                         def __getitem__(self, key):
@@ -560,7 +696,12 @@ class AsyncRLGRPOTrainer(Trainer):
                 
                 
             else:
-                if update_inference_model:
+                synced = False
+                if update_inference_model and self.weight_sync is not None:
+                    # unsharded parameters are visible in place, no full state dict is cloned
+                    with FSDP.summon_full_params(model_wrapped, writeback=False):
+                        synced = self._sync_inference_model(model_wrapped, device)
+                if update_inference_model and not synced:
                     cfg = FullStateDictConfig(offload_to_cpu=False, rank0_only=False)
                     with FSDP.state_dict_type(model_wrapped, StateDictType.FULL_STATE_DICT, cfg):
                         full_state = model_wrapped.state_dict()
@@ -600,6 +741,7 @@ class AsyncRLGRPOTrainer(Trainer):
         # TODO: this function should be rewrite for async sampling
 
         s_time = datetime.datetime.now()
+        generation_start = time.time()
         device = self.accelerator.device
         
         prompt_inputs,inputs = tasks
@@ -665,25 +807,45 @@ class AsyncRLGRPOTrainer(Trainer):
             }
         
         rewards = rewards.cpu()
-        # process and send them to local balance
+        generated = time.time()
+        # process and send them to local balance, the whole generation batch in one message
+        if self.image_cache is not None:
+            eos_token_ids = [self.processing_class.tokenizer.convert_tokens_to_ids(t) for t in ('<|im_end|>', '</s>')]
+        tacs = []
         for idx,item in enumerate(inputs):
-            tac = TaskAndContent(
-                data={
+            if self.image_cache is not None:
+                # compact record: images stay in the node image cache, reward kwargs are not needed any more
+                data = {
+                    "id": item["id"],
+                    "step_id": item.get("step_id",0),
+                    "next_id": item.get("next_id",None),
+                    "prompt": compact_prompt(item["prompt"], self.image_cache),
+                    "completion_ids": compact_token_ids(completion_ids[idx], eos_token_ids),
+                    "reward": rewards[idx].item(),
+                    "policy_version": self.policy_version,
+                }
+            else:
+                data = {
                     **item,
                     "completion": completions[idx][0]['content'],
                     "completion_ids": completion_ids[idx].cpu(),
                     "reward": rewards[idx].item(),
-                },
+                    "policy_version": self.policy_version,
+                }
+            tacs.append(TaskAndContent(
+                data=data,
                 status=TaskStatus(
                     task_id=item["id"],
                     completion_id=uuid.uuid4(),
-                    score=rewards[idx].item()
+                    score=rewards[idx].item(),
+                    stage_times={"generation_start": generation_start, "generated": generated},
+                    policy_version=self.policy_version,
+                    step_id=item.get("step_id", 0),
                 )
-            )
-            # with Timer("Sending Completions"):
-            # send it
-            self.balance_send.send_pyobj(tac)
-            _ = self.balance_send.recv_string()
+            ))
+        # with Timer("Sending Completions"):
+        self.balance_send.send_pyobj(tacs)
+        _ = self.balance_send.recv_string()
         del prompt_inputs,inputs
 
     def _get_per_token_logps(self, model, inputs):
@@ -771,12 +933,23 @@ class AsyncRLGRPOTrainer(Trainer):
         is_clipped = (per_token_loss1 < per_token_loss2).float()
         clip_ratio = (is_clipped * completion_mask).sum() / completion_mask.sum()
         log_dict["clip_ratio"] = clip_ratio
+        if mode == "train":
+            # optimizer steps between the weights that generated each completion and the weights trained now,
+            # logged on every rank (gather_for_metrics needs the same keys), unknown versions count as fresh
+            policy_versions = inputs.get("policy_versions", torch.full(advantages.shape, -1)).to(self.accelerator.device)
+            staleness = torch.where(policy_versions >= 0, self.state.global_step - policy_versions, 0)
+            log_dict["staleness"] = staleness.to(torch.float)
         log_dict = self.accelerator.gather_for_metrics(log_dict)
         for k in log_dict.keys():
             self._metrics[mode][k].append(log_dict[k].mean().item())
             self._metrics[mode][k+'/max'].append(log_dict[k].max().item())
             self._metrics[mode][k+'/min'].append(log_dict[k].min().item())
             self._metrics[mode][k+'/std'].append(log_dict[k].std().item())
+        if "staleness" in log_dict:
+            # histogram as the fraction of completions per bucket of staleness
+            staleness = log_dict["staleness"]
+            for name, low, high in STALENESS_BUCKETS:
+                self._metrics[mode][f"staleness/hist_{name}"].append(((staleness >= low) & (staleness < high)).float().mean().item())
 
         return loss
 
@@ -858,6 +1031,25 @@ class AsyncRLGRPOTrainer(Trainer):
             dataset=train_dataset,
             global_sync_address=self.global_data_dispatch_address,
             world_size=self.accelerator.num_processes,
+            scheduler_kwargs={
+                "depth_weights": [float(w) for w in self.args.mt_step_weights.split(",")],
+                "aging": self.args.mt_aging,
+                "max_outstanding_per_root": self.args.mt_max_outstanding_per_root,
+                "max_fraction": self.args.mt_max_continuation_fraction,
+            },
+            difficulty_kwargs={
+                "mode": self.args.difficulty_filter,
+                "num_generations": self.args.num_generations,
+                "decay": self.args.difficulty_decay,
+                "skip_threshold": self.args.difficulty_skip_threshold,
+                "explore": self.args.difficulty_explore,
+                "seed": self.args.seed,
+            },
+            affinity_kwargs={
+                "num_nodes": self.accelerator.num_processes // torch.cuda.device_count(),
+                "max_backlog": self.args.affinity_max_backlog,
+            } if self.args.group_affinity else None,
+            node_rank=self.accelerator.process_index // torch.cuda.device_count(),
             **dataloader_params
         )
         
@@ -927,6 +1119,23 @@ class AsyncRLGRPOTrainer(Trainer):
         return model
 
 
+    def _save_checkpoint(self, model, trial):
+        super()._save_checkpoint(model, trial)
+        if not self.args.rollout_log_dir:
+            return
+        # snapshot the rollout state next to the model checkpoint: global first, then every node, so that
+        # groups released by the global manager are always covered by the node snapshots
+        checkpoint_folder = f"{PREFIX_CHECKPOINT_DIR}-{self.state.global_step}"
+        rollout_dir = os.path.join(self._get_output_dir(trial=trial), checkpoint_folder, "rollout")
+        if self.accelerator.is_main_process:
+            self.ack.send_pyobj(("SNAPSHOT", rollout_dir))
+            logger.info(f"Global rollout snapshot: {self.ack.recv_string()}")
+        self.accelerator.wait_for_everyone()
+        if self.accelerator.is_local_main_process:
+            self.balance_send.send_pyobj(("SNAPSHOT", rollout_dir))
+            logger.info(f"Node rollout snapshot: {self.balance_send.recv_string()}")
+        self.accelerator.wait_for_everyone()
+
     def save_model(self, output_dir: Optional[str] = None, _internal_call: bool = False):
         """
         Will save the model, so you can reload it using `from_pretrained()`.
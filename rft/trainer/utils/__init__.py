@@ -1,14 +1,31 @@
 from .gui_eval import action_schema_check, action_args_check, action_type_check,react_check
-from .process import _prepare_messages,_process_inputs,_create_inputs
+from .process import _prepare_messages,_process_inputs,_create_inputs,ReprocessPool
 from .dataloader import GlobalDistributed0MQDataLoader
 from .dataset import GUIRFTDataset,GUIMTRFTDataset
+from .wire import serialize_to_frames,deserialize_from_frames,send_tensors,recv_tensors
+from .shm_ring import ShmRing,ShmRingReader
+from .rollout_log import RolloutLog,save_snapshot,load_snapshot,load_snapshot_entries,resolve_rollout_resume_dir
+from .steal_policy import StealCostModel,StealPolicy,build_steal_policy
+from .tracing import StageTracer,mark,serve_prometheus,export_jsonl
+from .compact import ImageRef,ImageCache,default_image_cache_dir,is_volatile_dir,compact_prompt,compact_token_ids,materialize_inputs
+from .task_store import SpillingTaskStore
+from .weight_sync import WeightSyncEngine
+from .transport import TRANSPORTS,single_node,global_endpoint,tune_socket,bind,connect,local_ip
 from .dataloader import GlobalDistributed0MQDataLoader
 
 __all__ = [
     "GUIRFTDataset","GUIMTRFTDataset",
     "action_schema_check","action_args_check","action_type_check","react_check",
-    "_prepare_messages","_process_inputs","_create_inputs",
+    "_prepare_messages","_process_inputs","_create_inputs","ReprocessPool",
     "GlobalDistributed0MQDataLoader",
+    "serialize_to_frames","deserialize_from_frames","send_tensors","recv_tensors",
+    "ShmRing","ShmRingReader",
+    "RolloutLog","save_snapshot","load_snapshot","load_snapshot_entries","resolve_rollout_resume_dir",
+    "StealCostModel","StealPolicy","build_steal_policy",
+    "StageTracer","mark","serve_prometheus","export_jsonl",
+    "ImageRef","ImageCache","default_image_cache_dir","is_volatile_dir","compact_prompt","compact_token_ids","materialize_inputs",
+    "SpillingTaskStore","WeightSyncEngine",
+    "TRANSPORTS","single_node","global_endpoint","tune_socket","bind","connect","local_ip",
     "no_sync","Timer","logger"
     ]
 
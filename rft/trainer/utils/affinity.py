@@ -0,0 +1,26 @@
+import bisect
+import hashlib
+
+# Group-to-node affinity of the task dispatcher.
+#
+# Every root task (dataset index % len(dataset)) is owned by one node, picked on a consistent hash ring
+# with `replicas` virtual points per node. With affinity the dispatcher hands the `num_generations` copies
+# of a task (and its multi-turn continuations) only to the ranks of its owner, so every group is cached on
+# a single node and the GlobalSyncManager notifies that node alone. Adding or removing a node only moves
+# the tasks of its neighbours on the ring.
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    def __init__(self, num_nodes: int, replicas: int = 160):
+        self.num_nodes = num_nodes
+        points = sorted((_hash(f"node-{node}-{r}"), node) for node in range(num_nodes) for r in range(replicas))
+        self.points = [p for p, _ in points]
+        self.nodes = [n for _, n in points]
+
+    def owner(self, root: int) -> int:
+        i = bisect.bisect(self.points, _hash(f"task-{root}")) % len(self.points)
+        return self.nodes[i]
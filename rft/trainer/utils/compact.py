@@ -0,0 +1,158 @@
+import os
+import re
+import time
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import torch
+from PIL import Image
+
+# Compact rollout records sent from the trainer ranks to the LocalBalanceManager of their node.
+#
+# `sample_step` used to send every dataset item as is: the prompt with its PIL images, the decoded
+# completion and the completion ids as a padded int64 tensor. Now a record only holds
+#     id, step_id, next_id, reward   as before
+#     prompt                         text as is, every image replaced by an `ImageRef` (content hash)
+#     completion_ids                 numpy array cut after the first EOS, uint16 when the ids fit, else int32
+# The images are written once into a node-local, content-addressed `ImageCache` (`/dev/shm` by default),
+# shared by the ranks and the balancer. The balancer keeps only the records in its cache and turns them
+# back into full items (`materialize_inputs`) when it builds a training chunk; the decoded completion is
+# recomputed from the ids when it is needed (multi-turn continuations, logging).
+#
+# Images are stored as raw pixels (`Image.tobytes`), so materializing costs a file read and no decoding.
+#
+# Records written to the rollout log and to checkpoint snapshots keep only the `ImageRef`s, so resuming them
+# needs the image cache to outlive the job: with a rollout log the cache must be on persistent storage
+# (`is_volatile_dir` rejects tmpfs such as `/dev/shm`) and images are not pruned.
+
+
+@dataclass(frozen=True)
+class ImageRef:
+    digest: str
+    mode: str
+    size: tuple
+
+
+def default_image_cache_dir(local_collect_address: str) -> str:
+    return "/dev/shm/arl_images" + re.sub(r"[^0-9A-Za-z]+", "_", local_collect_address)
+
+
+def is_volatile_dir(path: str) -> bool:
+    """Whether `path` is on a memory-backed filesystem (tmpfs, ramfs) that does not survive a reboot."""
+    path = os.path.realpath(path)
+    fstype, longest = None, -1
+    try:
+        with open("/proc/mounts") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount_point = fields[1].replace("\\040", " ")
+                if (path == mount_point or path.startswith(mount_point.rstrip("/") + "/")) and len(mount_point) > longest:
+                    fstype, longest = fields[2], len(mount_point)
+    except OSError:
+        # no mount table, only the default location is known to be in memory
+        return path.startswith("/dev/shm")
+    return fstype in ("tmpfs", "ramfs")
+
+
+class ImageCache:
+    """Content-addressed image files in `directory`, with an in-process LRU of materialized images."""
+
+    def __init__(self, directory: str, lru_size: int = 64):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.lru_size = lru_size
+        self._lru = OrderedDict()
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest)
+
+    def put(self, img: Image.Image) -> ImageRef:
+        data = img.tobytes()
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        ref = ImageRef(digest, img.mode, img.size)
+        path = self._path(digest)
+        if os.path.exists(path):
+            # keep images still referenced by new records out of `prune`
+            os.utime(path)
+            return ref
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        return ref
+
+    def get(self, ref: ImageRef) -> Image.Image:
+        img = self._lru.get(ref.digest)
+        if img is not None:
+            self._lru.move_to_end(ref.digest)
+            return img
+        with open(self._path(ref.digest), "rb") as f:
+            img = Image.frombytes(ref.mode, tuple(ref.size), f.read())
+        self._lru[ref.digest] = img
+        if len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+        return img
+
+    def prune(self, ttl: float) -> int:
+        """Remove images not written or reused for `ttl` seconds, returns the number removed."""
+        removed = 0
+        deadline = time.time() - ttl
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.stat().st_mtime < deadline:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+
+def compact_prompt(prompt: list, cache: ImageCache) -> list:
+    """Copy of the chat messages with every PIL image replaced by its `ImageRef`."""
+    messages = []
+    for msg in prompt:
+        content = msg["content"]
+        if isinstance(content, list):
+            content = [cache.put(c) if isinstance(c, Image.Image) else c for c in content]
+        messages.append({**msg, "content": content})
+    return messages
+
+
+def materialize_prompt(prompt: list, cache: ImageCache) -> list:
+    messages = []
+    for msg in prompt:
+        content = msg["content"]
+        if isinstance(content, list):
+            content = [cache.get(c) if isinstance(c, ImageRef) else c for c in content]
+        messages.append({**msg, "content": content})
+    return messages
+
+
+def compact_token_ids(ids: torch.Tensor, eos_token_ids) -> np.ndarray:
+    """Completion ids cut after the first EOS (the rest is masked out anyway) in the smallest dtype."""
+    ids = ids.cpu()
+    is_eos = torch.isin(ids, torch.tensor(list(eos_token_ids), dtype=ids.dtype))
+    if is_eos.any():
+        ids = ids[: int(is_eos.int().argmax()) + 1]
+    dtype = np.uint16 if ids.numel() == 0 or int(ids.max()) < 2**16 else np.int32
+    return ids.numpy().astype(dtype)
+
+
+def materialize_inputs(inputs: list, cache: Optional[ImageCache]) -> list:
+    """Turn compact records back into the items `_process_inputs` expects, full items pass through."""
+    items = []
+    for inp in inputs:
+        completion_ids = inp["completion_ids"]
+        if isinstance(completion_ids, np.ndarray):
+            inp = {
+                **inp,
+                "prompt": materialize_prompt(inp["prompt"], cache),
+                "completion_ids": torch.from_numpy(completion_ids.astype(np.int64)),
+            }
+        items.append(inp)
+    return items
@@ -1,13 +1,22 @@
+import os
 import zmq
+import time
+import logging
 import threading
 import multiprocessing
-import queue
 from typing import Iterator, Any, Callable, Optional, List
 import pickle
 from torch.utils.data import Sampler
-from collections import defaultdict
+from collections import Counter, defaultdict, deque
 import torch.distributed as dist
 
+from .scheduler import ContinuationScheduler
+from .difficulty import DifficultyTracker
+from .affinity import HashRing
+from . import transport
+
+logger = logging.getLogger("ARL")
+
 class GlobalDistributed0MQDataLoader:
     def __init__(
         self,
@@ -20,6 +29,10 @@ class GlobalDistributed0MQDataLoader:
         worker_init_fn: Callable,
         prefetch_factor: int,
         world_size:int,
+        scheduler_kwargs: Optional[dict] = None,
+        difficulty_kwargs: Optional[dict] = None,
+        affinity_kwargs: Optional[dict] = None,
+        node_rank: int = 0,
         **kwargs: Any
     ):
         self.dataset = dataset
@@ -33,6 +46,11 @@ class GlobalDistributed0MQDataLoader:
         self.kwargs = kwargs
         self._init_kwargs = kwargs
         self.world_size = world_size
+        self.scheduler_kwargs = scheduler_kwargs or {}
+        self.difficulty_kwargs = difficulty_kwargs or {}
+        # {"num_nodes", "max_backlog"} to hand each task group to the ranks of its owner node only
+        self.affinity_kwargs = affinity_kwargs
+        self.node_rank = node_rank
         self.rank = dist.get_rank()
 
         self.index_queue = multiprocessing.Queue(self.num_workers)
@@ -56,7 +74,7 @@ class GlobalDistributed0MQDataLoader:
         if self.rank == 0:
             self.master_proc = multiprocessing.Process(
                 target=GlobalDistributed0MQDataLoader._master_loop,
-                args=(self.global_sync_address, self.batch_size,self.sampler),
+                args=(self.global_sync_address, self.batch_size,self.sampler,len(self.dataset),self.scheduler_kwargs,self.difficulty_kwargs,self.affinity_kwargs),
                 daemon=True
             )
             self.master_proc.start()
@@ -69,36 +87,105 @@ class GlobalDistributed0MQDataLoader:
         global_sync_address: str,
         batch_size: int,
         sampler: Sampler,
+        dataset_size: int,
+        scheduler_kwargs: dict,
+        difficulty_kwargs: dict,
+        affinity_kwargs: Optional[dict] = None,
     ):
         '''Master loop to dispatch tasks to workers'''
         zctx = zmq.Context()
         task_dispatcher = zctx.socket(zmq.REP)
-        task_dispatcher.bind(global_sync_address)
+        transport.bind(task_dispatcher, global_sync_address)
         
         it = None
         
-        multiturn_cache = queue.PriorityQueue()
+        multiturn_cache = ContinuationScheduler(dataset_size, **scheduler_kwargs)
+        difficulty = DifficultyTracker(**difficulty_kwargs)
+        # group affinity: fresh tasks wait in the queue of their owner node until one of its ranks asks.
+        # A node whose queue runs dry takes whole groups from the longest queue beyond `max_backlog`
+        # instead of letting it grow, so a slow node does not hold back the others.
+        ring = HashRing(affinity_kwargs["num_nodes"]) if affinity_kwargs else None
+        max_backlog = affinity_kwargs.get("max_backlog", 64) if affinity_kwargs else 0
+        node_queues = defaultdict(deque)
+        affinity_counts = Counter()
         cached_completions = defaultdict(list)
+        stats_interval = float(os.environ.get("SCHEDULER_STATS_INTERVAL", "60"))
+        last_stats = time.monotonic()
+        
+        def next_fresh():
+            nonlocal it
+            while True:
+                try:
+                    index = next(it)
+                except StopIteration:
+                    it = iter(sampler)
+                    difficulty.reset()
+                    print("Restart Sampler During Epoch")
+                    continue
+                # skip the whole group of tasks that are almost always saturated or failing
+                if difficulty.keep(index):
+                    return index
+        
+        def take_for_node(node):
+            owned = lambda index: ring.owner(index % dataset_size) == node
+            tasks = multiturn_cache.take(batch_size, accept=owned)
+            queue = node_queues[node]
+            while len(tasks) < batch_size:
+                if queue:
+                    tasks.append(queue.popleft())
+                    continue
+                backlog_node = max(node_queues, key=lambda n: len(node_queues[n]))
+                backlog = node_queues[backlog_node]
+                if len(backlog) > max_backlog:
+                    # the newest group at the tail has not been handed out yet, move all its copies
+                    index = backlog.pop()
+                    queue.append(index)
+                    while backlog and backlog[-1] == index:
+                        queue.append(backlog.pop())
+                    affinity_counts["reassigned_groups"] += 1
+                    continue
+                index = next_fresh()
+                node_queues[ring.owner(index % dataset_size)].append(index)
+            affinity_counts[f"node{node}_tasks"] += len(tasks)
+            return tasks
+        
+        def log_stats():
+            nonlocal last_stats
+            if time.monotonic() - last_stats <= stats_interval:
+                return
+            last_stats = time.monotonic()
+            logger.info("[ Continuations ] " + " | ".join(
+                f"step {step}: {s['queued']} queued, oldest {s['oldest_wait']:.0f}s, "
+                f"{s['dispatched']}/{s['received']} dispatched, mean wait {s['mean_wait']:.1f}s"
+                for step, s in multiturn_cache.stats().items()
+            ))
+            if difficulty.mode != "off":
+                logger.info("[ Difficulty ] " + ", ".join(f"{k}: {v}" for k, v in difficulty.stats().items()))
+            if ring is not None:
+                logger.info("[ Affinity ] " + ", ".join(
+                    [f"node{n} backlog: {len(q)}" for n, q in sorted(node_queues.items())] +
+                    [f"{k}: {v}" for k, v in sorted(affinity_counts.items())]
+                ))
         
         while True:
-            req: str | list[dict] | dict = task_dispatcher.recv_pyobj()
-            if isinstance(req,str):
+            req: str | tuple | list[dict] | dict = task_dispatcher.recv_pyobj()
+            if isinstance(req,tuple) and req[0] == "REQ_TASK":
+                # ("REQ_TASK", node) with group affinity
+                task_dispatcher.send(pickle.dumps(take_for_node(req[1])))
+                log_stats()
+            elif isinstance(req,str):
                 if req == "REQ_TASK":
-                    tasks = []
-                    for _ in range(min(multiturn_cache.qsize(),batch_size)):
-                        tasks.append(multiturn_cache.get()[1])
-
+                    tasks = multiturn_cache.take(batch_size)
                     while len(tasks) < batch_size:
-                        try:
-                            tasks.append(next(it))
-                        except StopIteration:
-                            it = iter(sampler)
-                            print("Restart Sampler During Epoch")
+                        tasks.append(next_fresh())
                 
                     task_dispatcher.send(pickle.dumps(tasks))
+                    log_stats()
                 
                 elif req == "RESTART":
                     it = iter(sampler)
+                    difficulty.reset()
+                    node_queues.clear()
                     task_dispatcher.send_string("RESTARTED")
                 
                 else:
@@ -115,12 +202,27 @@ class GlobalDistributed0MQDataLoader:
                         d = ""
                         print(f"Error: Illegal access of cache completions at index {index}.")
                     task_dispatcher.send_string(d)
+                elif "requeue" in req:
+                    # tasks of timed out groups, generated again before new tasks
+                    for index in req["requeue"]:
+                        multiturn_cache.put(req["priority"], index)
+                    task_dispatcher.send_string("Received")
+                elif "outcomes" in req:
+                    # (task_id, mean score, wasted) of completed groups, only fresh tasks are filtered
+                    difficulty.update(o for o in req["outcomes"] if o[0] < dataset_size)
+                    task_dispatcher.send_string("Received")
+                elif "stats" in req:
+                    task_dispatcher.send_pyobj({
+                        "continuations": multiturn_cache.stats(),
+                        "difficulty": difficulty.stats(),
+                        "affinity": {**affinity_counts, **{f"node{n}_backlog": len(q) for n, q in node_queues.items()}},
+                    })
                 else:
                     raise NotImplementedError(f"Receive Unknown Request Type {type(req)}")
 
             elif isinstance(req,list):
                 for d in req:
-                    multiturn_cache.put((d["gid"],d["next_id"]))
+                    multiturn_cache.put(d["gid"],d["next_id"])
                     cached_completions[d["id"]].append(d["completion"])
                 task_dispatcher.send_string("Received")
                 
@@ -154,7 +256,7 @@ class GlobalDistributed0MQDataLoader:
         '''Get tasks from the master and load the data into the queue'''
         zctx = zmq.Context()
         task_receiver = zctx.socket(zmq.REQ)
-        task_receiver.connect(self.global_sync_address)
+        transport.connect(task_receiver, self.global_sync_address)
         
         
         if self.rank == 0:
@@ -164,7 +266,7 @@ class GlobalDistributed0MQDataLoader:
         
         def get_task():
             while True:
-                task_receiver.send_pyobj("REQ_TASK")
+                task_receiver.send_pyobj(("REQ_TASK", self.node_rank) if self.affinity_kwargs else "REQ_TASK")
                 tasks = pickle.loads(task_receiver.recv(copy=False))
                 if tasks is None:
                     self.result_queue.put(None)
@@ -20,6 +20,7 @@ from torch.utils.data import Dataset
 from PIL import Image
 from typing import Optional
 import zmq
+from . import transport
 
 def load_resized_image(img_file:str|io.BytesIO, max_line_res: Optional[int] = None):
     origin_img = Image.open(img_file).convert("RGB")
@@ -144,7 +145,7 @@ class GUIMTRFTDataset(GUIRFTDataset):
         if self.zmqctx is None:
             self.zmqctx = zmq.Context()
             self.step_response_receiver = self.zmqctx.socket(zmq.REQ)
-            self.step_response_receiver.connect(self.global_task_dispatch_addr)
+            transport.connect(self.step_response_receiver, self.global_task_dispatch_addr)
     
     def __len__(self):
         return len(self.data)
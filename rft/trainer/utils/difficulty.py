@@ -0,0 +1,95 @@
+import random
+from typing import Iterable, Tuple
+
+# Online difficulty of dataset ids, used by GlobalDistributed0MQDataLoader._master_loop to avoid
+# generating groups that will be dropped anyway.
+#
+# GlobalSyncManager reports the outcome of every completed group (task id, mean score, wasted), a group
+# being wasted when nodes drop it: mean score above DEFAULT_THRESHOLD (saturated) or all advantages equal
+# (every completion passed or failed alike). The tracker keeps exponentially decayed counts per id, so a
+# task that becomes learnable again as the policy changes is picked up within a few groups.
+#
+# When the sampler hands out a fresh task whose wasted rate is known, it is kept with probability
+#     skip       : `explore` if wasted rate >= `skip_threshold`, else 1
+#     downweight : max(`explore`, 1 - wasted rate)
+# The decision is made once per group: the `num_generations` copies of an index yielded by the sampler
+# are all kept or all skipped.
+
+
+class DifficultyTracker:
+    def __init__(
+        self,
+        mode: str = "off",
+        num_generations: int = 1,
+        decay: float = 0.9,
+        min_observations: float = 1.5,
+        skip_threshold: float = 0.9,
+        explore: float = 0.1,
+        seed: int = 0,
+    ):
+        assert mode in ("off", "skip", "downweight"), f"Unknown difficulty filter {mode}"
+        self.mode = mode
+        self.num_generations = num_generations
+        self.decay = decay
+        self.min_observations = min_observations
+        self.skip_threshold = skip_threshold
+        self.explore = explore
+        self.rng = random.Random(seed)
+
+        # id -> (decayed groups seen, decayed groups wasted), filtered once seen >= `min_observations`
+        # (the default 1.5 takes two groups)
+        self.history = {}
+        # id -> (keep, copies of the index still to come from the sampler)
+        self.pending = {}
+        self.counters = {
+            "groups_observed": 0,
+            "groups_wasted": 0,
+            "tasks_kept": 0,
+            "tasks_skipped": 0,
+        }
+
+    def update(self, outcomes: Iterable[Tuple[int, float, bool]]):
+        for task_id, mean_score, wasted in outcomes:
+            seen, wasted_count = self.history.get(task_id, (0.0, 0.0))
+            self.history[task_id] = (seen * self.decay + 1, wasted_count * self.decay + float(wasted))
+            self.counters["groups_observed"] += 1
+            self.counters["groups_wasted"] += int(wasted)
+
+    def wasted_rate(self, task_id: int) -> float:
+        seen, wasted = self.history.get(task_id, (0.0, 0.0))
+        if seen < self.min_observations:
+            return 0.0
+        return wasted / seen
+
+    def keep_probability(self, task_id: int) -> float:
+        rate = self.wasted_rate(task_id)
+        if self.mode == "skip":
+            return self.explore if rate >= self.skip_threshold else 1.0
+        if self.mode == "downweight":
+            return max(self.explore, 1.0 - rate)
+        return 1.0
+
+    def keep(self, index: int) -> bool:
+        """Whether to generate this copy of `index`, the same answer for every copy of one group."""
+        if self.mode == "off":
+            return True
+        if index in self.pending:
+            keep, remaining = self.pending[index]
+            if remaining <= 1:
+                del self.pending[index]
+            else:
+                self.pending[index] = (keep, remaining - 1)
+        else:
+            keep = self.rng.random() < self.keep_probability(index)
+            if self.num_generations > 1:
+                self.pending[index] = (keep, self.num_generations - 1)
+        self.counters["tasks_kept" if keep else "tasks_skipped"] += 1
+        return keep
+
+    def reset(self):
+        """Forget partially handed out groups, the sampler restarts from a fresh permutation."""
+        self.pending.clear()
+
+    def stats(self) -> dict:
+        # every skipped task is one completion not generated
+        return {**self.counters, "tracked_ids": len(self.history)}
@@ -1,19 +1,28 @@
 import re
 import json
 import json5
-import jsonschema
 import difflib
 import math
 from concurrent.futures import ProcessPoolExecutor
 from .dataset import SCHEMA
 
+# the compiled action validator lives with the action schemas under `eval/utils`, the entrypoints
+# (grpo.py, benchmarks) put the repository root on the import path
+from eval.utils.action_parser import ValidationError, compile_validator, loads_action_json
+
+SCHEMA_VALIDATOR = compile_validator(SCHEMA)
+
 def load_and_validate_action(res:str,):
     action_str = re.search(r'```json(.*?)```', res, re.DOTALL)
     if action_str:
         action_str = action_str.group(1).strip()
     else:
         action_str = res
-    action = json5.loads(action_str,allow_duplicate_keys=False)
+    try:
+        # fast path for strict JSON, fall back to json5 for comments, trailing commas, etc.
+        action = loads_action_json(action_str)
+    except json.JSONDecodeError:
+        action = json5.loads(action_str,allow_duplicate_keys=False)
     # if isinstance(res, str):
     #     action_str = res
     #     action = json5.loads(action_str,allow_duplicate_keys=False)
@@ -21,7 +30,7 @@ def load_and_validate_action(res:str,):
     #     action = res
     
     # action = json5.loads(res,allow_duplicate_keys=False)
-    jsonschema.validate(action, SCHEMA)
+    SCHEMA_VALIDATOR.validate(action)
     return action
 
 global_executor = ProcessPoolExecutor(max_workers=8)
@@ -32,7 +41,7 @@ def _action_schema_check(res:str,solution: dict):
         if "```json" in res:
             return 0.5
         return 1.0
-    except jsonschema.ValidationError as e:
+    except ValidationError as e:
         return 0.3
     except Exception as e:
         return 0.0
@@ -1,7 +1,13 @@
+import time
+import queue
 import torch
 import copy
+import pickle
+import multiprocessing
 from PIL import Image
 
+from .compact import ImageCache, materialize_inputs
+
 def _prepare_messages(
     prompts,
     processing_class,
@@ -85,6 +91,7 @@ def _process_inputs(
     rewards = []
     ids = []
     step_ids = []
+    policy_versions = []
     for inp in inputs:
         ids.append(inp["id"])
         prompts.append(inp["prompt"])
@@ -92,10 +99,12 @@ def _process_inputs(
         advantages.append(inp["advantage"])
         rewards.append(inp["reward"])
         step_ids.append(inp.get("step_id",0))
+        policy_versions.append(inp.get("policy_version",-1))
         
     ids = torch.tensor(ids)
     advantages = torch.tensor(advantages)
     step_ids = torch.tensor(step_ids)
+    policy_versions = torch.tensor(policy_versions)
 
     prompt_inputs = _prepare_messages(prompts,processing_class,max_prompt_length)
     prompt_len = prompt_inputs["input_ids"].size(1)
@@ -107,5 +116,103 @@ def _process_inputs(
         "completion_mask": completion_mask,
         "advantages": advantages,
         "prompt_len": prompt_len,
-        "step_ids": step_ids
-    }
\ No newline at end of file
+        "step_ids": step_ids,
+        "policy_versions": policy_versions
+    }
+
+def _reprocess_worker(
+    processing_class_name_or_path,
+    max_prompt_length,
+    in_queue,
+    out_queue,
+    image_cache_dir=None,
+    current=None
+):
+    from transformers import AutoProcessor
+    processor = AutoProcessor.from_pretrained(processing_class_name_or_path, trust_remote_code=True)
+    image_cache = ImageCache(image_cache_dir) if image_cache_dir else None
+    # one process per core, avoid oversubscribing with intra-op threads
+    torch.set_num_threads(1)
+    while True:
+        item = in_queue.get()
+        if item is None:
+            break
+        seq, inputs = item
+        if current is not None:
+            # the chunk this worker holds, reported lost by the pool if the process dies
+            current.value = seq
+        start = time.time()
+        try:
+            chunk_data = _process_inputs(materialize_inputs(inputs, image_cache), processor, max_prompt_length)
+            # plain pickle: tensors are copied instead of passed as shared-memory file descriptors
+            result = (seq, pickle.dumps(chunk_data, protocol=pickle.HIGHEST_PROTOCOL), start, time.time(), None)
+        except Exception as e:
+            result = (seq, None, start, time.time(), f"{type(e).__name__}: {e}")
+        out_queue.put(result)
+        if current is not None:
+            current.value = -1
+
+
+class ReprocessPool:
+    """Run `_process_inputs` in `num_workers` spawned processes, outside the GIL of the balancer.
+
+    `submit` takes the inputs of one chunk, `get` returns (seq, chunk_data, start, end, error) of any finished
+    chunk. A chunk whose processing raised, or whose worker died (OOM kill, crash in a native decoder), comes
+    back with `chunk_data=None` and the reason in `error`; dead workers are replaced, checked every
+    `check_interval` seconds. At most `max_inflight` chunks are queued for the workers, `submit` blocks beyond
+    that. Compact records are materialized by the workers from the node image cache in `image_cache_dir`.
+    """
+
+    worker = staticmethod(_reprocess_worker)
+
+    def __init__(self, processing_class_name_or_path, max_prompt_length, num_workers, max_inflight=None, image_cache_dir=None,
+                 check_interval=1.0):
+        self.ctx = multiprocessing.get_context("spawn")
+        self.in_queue = self.ctx.Queue(max_inflight or 2 * num_workers)
+        self.out_queue = self.ctx.Queue()
+        self.worker_args = (processing_class_name_or_path, max_prompt_length, self.in_queue, self.out_queue, image_cache_dir)
+        self.check_interval = check_interval
+        self.last_check = time.monotonic()
+        self.lost = []
+        self.respawned = 0
+        # (process, shared seq of the chunk it is processing, -1 while idle)
+        self.workers = [self._spawn() for _ in range(num_workers)]
+
+    def _spawn(self):
+        current = self.ctx.Value("q", -1, lock=False)
+        p = self.ctx.Process(target=self.worker, args=(*self.worker_args, current), daemon=True)
+        p.start()
+        return p, current
+
+    def _replace_dead_workers(self):
+        """Respawn dead workers, the chunks they held are reported lost by `get`."""
+        for i, (p, current) in enumerate(self.workers):
+            if p.is_alive():
+                continue
+            if current.value >= 0:
+                now = time.time()
+                self.lost.append((current.value, None, now, now, f"worker {p.pid} exited with code {p.exitcode}"))
+            self.workers[i] = self._spawn()
+            self.respawned += 1
+
+    def submit(self, seq, inputs):
+        self.in_queue.put((seq, inputs))
+
+    def get(self):
+        while True:
+            if time.monotonic() - self.last_check >= self.check_interval:
+                self.last_check = time.monotonic()
+                self._replace_dead_workers()
+            if self.lost:
+                return self.lost.pop(0)
+            try:
+                seq, payload, start, end, error = self.out_queue.get(timeout=self.check_interval)
+            except queue.Empty:
+                continue
+            return seq, None if payload is None else pickle.loads(payload), start, end, error
+
+    def close(self):
+        for _ in self.workers:
+            self.in_queue.put(None)
+        for p, _ in self.workers:
+            p.join()
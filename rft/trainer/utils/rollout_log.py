@@ -0,0 +1,155 @@
+import os
+import glob
+import pickle
+import threading
+from typing import Any, Iterable, Iterator, Optional
+
+from transformers.trainer_utils import get_last_checkpoint
+
+# Durable rollout state for GlobalSyncManager / LocalBalanceManager.
+#
+# Every manager appends the completions it receives to an append-only log split into segments
+# (`<name>.<seq>.log`, pickled records). When the trainer saves `checkpoint-N`, each manager writes a
+# snapshot of its in-memory state to `checkpoint-N/rollout/<name>.pkl` and starts a new log segment.
+# On restart from `checkpoint-N` the manager loads that snapshot and replays the segments written after
+# it, so completions generated since the checkpoint are not lost.
+#
+# After every snapshot the segments older than the oldest snapshot still on disk are deleted. Snapshots live
+# inside the checkpoints, so the log follows the checkpoint rotation of `save_total_limit`: every checkpoint
+# the trainer keeps can still be resumed with all of its completions.
+#
+# Large collections (the completions cached by a balancer, possibly spilled to disk) are passed as
+# `entries` and pickled one record at a time after the state, so writing or loading a snapshot never
+# holds all of them in memory (`load_snapshot_entries`).
+#
+# A torn record at the end of a segment (crash while appending) is ignored.
+
+ROLLOUT_SNAPSHOT_DIR = "rollout"
+
+
+class RolloutLog:
+    def __init__(self, directory: str, name: str):
+        self.directory = directory
+        self.name = name
+        os.makedirs(directory, exist_ok=True)
+        segments = self.segments()
+        # never append to a segment that existed before this process started
+        self.segment = segments[-1][0] + 1 if segments else 0
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"{self.name}.{seq:08d}.log")
+
+    def segments(self) -> list:
+        result = []
+        for path in glob.glob(os.path.join(self.directory, f"{self.name}.*.log")):
+            try:
+                result.append((int(path.rsplit(".", 2)[-2]), path))
+            except ValueError:
+                continue
+        return sorted(result)
+
+    def append(self, kind: str, payload: Any):
+        with self._lock:
+            if self._file is None:
+                self._file = open(self._path(self.segment), "ab")
+            pickle.dump((kind, payload), self._file, protocol=pickle.HIGHEST_PROTOCOL)
+            self._file.flush()
+
+    def rotate(self) -> int:
+        """Close the current segment; records appended afterwards go to the returned segment."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self.segment += 1
+            return self.segment
+
+    def prune(self, snapshot_path: str):
+        """Delete segments older than every snapshot of this log kept in the sibling checkpoints of `snapshot_path`."""
+        checkpoint_root = os.path.dirname(os.path.dirname(os.path.dirname(snapshot_path)))
+        pattern = os.path.join(checkpoint_root, "*", ROLLOUT_SNAPSHOT_DIR, os.path.basename(snapshot_path))
+        kept = []
+        for path in glob.glob(pattern):
+            try:
+                kept.append(load_snapshot(path)["segment"])
+            except (OSError, EOFError, pickle.UnpicklingError, KeyError, TypeError):
+                # checkpoint removed while listing or snapshot unreadable, it cannot be resumed anyway
+                continue
+        if not kept:
+            return
+        oldest = min(kept)
+        for seq, path in self.segments():
+            if seq < oldest:
+                os.remove(path)
+
+    def replay(self, from_segment: int = 0) -> Iterator[tuple]:
+        for seq, path in self.segments():
+            if seq < from_segment:
+                continue
+            with open(path, "rb") as f:
+                while True:
+                    try:
+                        yield pickle.load(f)
+                    except EOFError:
+                        break
+                    except (pickle.UnpicklingError, ValueError, AttributeError, IndexError):
+                        # torn tail of a segment
+                        break
+
+    def snapshot(self, path: str, state: dict, entries: Optional[Iterable] = None):
+        """Rotate the log and atomically write `state` and `entries` to `path`, tagged with the new segment."""
+        segment = self.rotate()
+        save_snapshot(path, {"segment": segment, "state": state}, entries)
+        self.prune(path)
+        return segment
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def save_snapshot(path: str, obj: Any, entries: Optional[Iterable] = None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        for entry in entries if entries is not None else ():
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path: str) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def load_snapshot_entries(path: str) -> Iterator[Any]:
+    """The entries written after the object of the snapshot at `path`, loaded one at a time."""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        pickle.load(f)
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def resolve_rollout_resume_dir(resume_from_checkpoint, output_dir: str) -> Optional[str]:
+    """The `rollout` directory of the checkpoint training resumes from, following `Trainer.train` semantics."""
+    if resume_from_checkpoint is None or resume_from_checkpoint is False:
+        return None
+    if resume_from_checkpoint is True:
+        resume_from_checkpoint = get_last_checkpoint(output_dir) if os.path.isdir(output_dir) else None
+        if resume_from_checkpoint is None:
+            return None
+    return os.path.join(resume_from_checkpoint, ROLLOUT_SNAPSHOT_DIR)
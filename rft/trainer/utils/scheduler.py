@@ -0,0 +1,134 @@
+import heapq
+import time
+from collections import defaultdict
+from typing import Callable, List, Optional, Sequence
+
+# Scheduling of multi-turn continuations in GlobalDistributed0MQDataLoader._master_loop.
+#
+# A continuation is the dataset index `next_id` of the next step of a trajectory. The dataset encodes
+# the step in the index: step = index // len(dataset), root task = index % len(dataset).
+#
+# Every REQ_TASK batch is filled with continuations first (at most `max_fraction` of the batch), the
+# rest with fresh tasks from the sampler. Continuations are queued per step; each slot of the batch
+# goes to the step with the lowest
+#     taken in this batch / weight - aging * seconds its head item has waited
+# so steps share the continuation slots by weight and a step that waited long enough wins regardless.
+# Within a step items are served by group id. A root task may have at most `max_outstanding_per_root`
+# continuation groups dispatched that have not come back yet (its next step arrives, or `outstanding_ttl`
+# expires for last steps and dropped groups); items of further groups of that root wait in the queue.
+# The cap counts groups, not copies: the remaining copies of a group already dispatched are never held
+# back, otherwise a cap below `num_generations` would leave the group unfinished forever.
+# With group affinity `take` only serves the roots owned by the requesting node (`accept`).
+
+
+class ContinuationScheduler:
+    def __init__(
+        self,
+        dataset_size: int,
+        depth_weights: Optional[Sequence[float]] = None,
+        aging: float = 0.05,
+        max_outstanding_per_root: int = 0,
+        max_fraction: float = 1.0,
+        outstanding_ttl: float = 600,
+    ):
+        self.dataset_size = max(dataset_size, 1)
+        self.depth_weights = list(depth_weights) if depth_weights else [1.0]
+        self.aging = aging
+        self.max_outstanding_per_root = max_outstanding_per_root
+        self.max_fraction = max_fraction
+        self.outstanding_ttl = outstanding_ttl
+
+        # step -> heap of (gid, seq, enqueue time, index)
+        self.queues = defaultdict(list)
+        self._seq = 0
+        # root -> list of (step, gid, dispatch time) of dispatched continuations
+        self.outstanding = defaultdict(list)
+        self.dispatched = defaultdict(int)
+        self.received = defaultdict(int)
+        self.wait_time = defaultdict(float)
+
+    def __len__(self):
+        return sum(len(q) for q in self.queues.values())
+
+    def qsize(self) -> int:
+        return len(self)
+
+    def _weight(self, step: int) -> float:
+        return self.depth_weights[min(step, len(self.depth_weights) - 1)]
+
+    def put(self, gid: int, index: int):
+        step, root = divmod(index, self.dataset_size)
+        heapq.heappush(self.queues[step], (gid, self._seq, time.monotonic(), index))
+        self._seq += 1
+        self.received[step] += 1
+        # the group of the previous steps came back
+        if self.outstanding.get(root):
+            self.outstanding[root] = [(s, g, t) for s, g, t in self.outstanding[root] if s >= step]
+
+    def _blocked(self, root: int, gid: int, now: float) -> bool:
+        if self.max_outstanding_per_root <= 0:
+            return False
+        outstanding = [(s, g, t) for s, g, t in self.outstanding.get(root, []) if now - t < self.outstanding_ttl]
+        self.outstanding[root] = outstanding
+        groups = {(s, g) for s, g, _ in outstanding}
+        if any(g == gid for _, g in groups):
+            # more copies of a group that is already out
+            return False
+        return len(groups) >= self.max_outstanding_per_root
+
+    def _pop_eligible(self, step: int, now: float, accept: Optional[Callable[[int], bool]] = None):
+        """Pop the first item of `step` whose root is accepted and under its cap, or None."""
+        queue = self.queues[step]
+        skipped = []
+        item = None
+        while queue:
+            candidate = heapq.heappop(queue)
+            if (accept is not None and not accept(candidate[3])) or self._blocked(candidate[3] % self.dataset_size, candidate[0], now):
+                skipped.append(candidate)
+            else:
+                item = candidate
+                break
+        for candidate in skipped:
+            heapq.heappush(queue, candidate)
+        return item
+
+    def take(self, batch_size: int, accept: Optional[Callable[[int], bool]] = None) -> List[int]:
+        """Continuations for one batch of `batch_size` tasks, only indices for which `accept` is true if given."""
+        now = time.monotonic()
+        limit = min(len(self), int(batch_size * self.max_fraction))
+        taken = defaultdict(int)
+        exhausted = set()
+        tasks = []
+        while len(tasks) < limit:
+            steps = [s for s, q in self.queues.items() if q and s not in exhausted]
+            if not steps:
+                break
+            step = min(steps, key=lambda s: taken[s] / self._weight(s) - self.aging * (now - self.queues[s][0][2]))
+            item = self._pop_eligible(step, now, accept)
+            if item is None:
+                # every queued root of this step is at its cap or owned by another node
+                exhausted.add(step)
+                continue
+            gid, _, enqueue_time, index = item
+            tasks.append(index)
+            taken[step] += 1
+            self.dispatched[step] += 1
+            self.wait_time[step] += now - enqueue_time
+            if self.max_outstanding_per_root > 0:
+                self.outstanding[index % self.dataset_size].append((step, gid, now))
+        return tasks
+
+    def stats(self) -> dict:
+        """Queue depth, dispatched count and mean wait per step."""
+        now = time.monotonic()
+        steps = sorted(set(self.queues) | set(self.dispatched))
+        return {
+            step: {
+                "queued": len(self.queues[step]),
+                "oldest_wait": now - self.queues[step][0][2] if self.queues[step] else 0.0,
+                "received": self.received[step],
+                "dispatched": self.dispatched[step],
+                "mean_wait": self.wait_time[step] / self.dispatched[step] if self.dispatched[step] else 0.0,
+            }
+            for step in steps
+        }
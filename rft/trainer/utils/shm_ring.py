@@ -0,0 +1,136 @@
+import pickle
+import struct
+from multiprocessing import shared_memory
+from typing import Any, List, Optional, Sequence
+
+from .wire import deserialize_from_frames
+
+# Node-local shared-memory ring used by LocalBalanceManager.provider to hand chunks to the trainer ranks
+# of the same node.
+#
+# The balancer writes the frames produced by `serialize_to_frames` into a free slot once, and replies to
+# every rank of the tp group with a small control message ("SHM", ring name, slot). Ranks map the segment
+# and rebuild the tensors in place with `torch.frombuffer`, then report the slot as released with their
+# next provider request. A slot is reused only after all `tp_size` ranks released it.
+#
+# Slot layout: [u32 number of frames][u64 length of each frame][frames, each aligned to 64 bytes]
+
+_ALIGN = 64
+
+
+def _align(n: int) -> int:
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        # the segment is owned by the balancer, do not let the resource tracker of a rank unlink it on exit
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+class ShmRing:
+    """Fixed size slots in one POSIX shared-memory segment (`/dev/shm/<name>`)."""
+
+    def __init__(self, name: str, num_slots: int, slot_bytes: int, create: bool = False):
+        self.name = name
+        self.num_slots = num_slots
+        self.slot_bytes = _align(slot_bytes)
+        if create:
+            try:
+                # stale segment from a previous run
+                old = shared_memory.SharedMemory(name=name)
+                old.close()
+                old.unlink()
+            except FileNotFoundError:
+                pass
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=self.num_slots * self.slot_bytes)
+        else:
+            self.shm = _attach(name)
+        self.owner = create
+        # only tracked by the owner
+        self.refs = [0] * num_slots
+        self.free = list(range(num_slots))
+
+    # ---- writer side ----
+    def fits(self, frames: Sequence) -> bool:
+        header = 4 + 8 * len(frames)
+        return _align(header) + sum(_align(memoryview(f).nbytes) for f in frames) <= self.slot_bytes
+
+    def acquire(self, refs: int) -> Optional[int]:
+        """Take a free slot that will be released after `refs` calls to `release`, or `None` if the ring is full."""
+        if not self.free:
+            return None
+        slot = self.free.pop()
+        self.refs[slot] = refs
+        return slot
+
+    def release(self, slot: int):
+        self.refs[slot] -= 1
+        if self.refs[slot] <= 0:
+            self.refs[slot] = 0
+            self.free.append(slot)
+
+    def write(self, slot: int, frames: Sequence):
+        base = slot * self.slot_bytes
+        buf = self.shm.buf
+        views = [memoryview(f).cast("B") for f in frames]
+        header = struct.pack(f"<I{len(views)}Q", len(views), *(v.nbytes for v in views))
+        buf[base:base + len(header)] = header
+        offset = base + _align(len(header))
+        for v in views:
+            buf[offset:offset + v.nbytes] = v
+            offset += _align(v.nbytes)
+
+    def control_message(self, slot: int) -> bytes:
+        return pickle.dumps((self.name, self.num_slots, self.slot_bytes, slot))
+
+    # ---- reader side ----
+    def read_frames(self, slot: int) -> List[memoryview]:
+        base = slot * self.slot_bytes
+        buf = self.shm.buf
+        (n,) = struct.unpack_from("<I", buf, base)
+        lengths = struct.unpack_from(f"<{n}Q", buf, base + 4)
+        offset = base + _align(4 + 8 * n)
+        frames = []
+        for length in lengths:
+            frames.append(buf[offset:offset + length])
+            offset += _align(length)
+        return frames
+
+    def read(self, slot: int) -> Any:
+        """Rebuild the chunk stored in `slot`; tensors share memory with the segment until the slot is released."""
+        return deserialize_from_frames(self.read_frames(slot))
+
+    @property
+    def in_use(self) -> int:
+        return self.num_slots - len(self.free)
+
+    def close(self):
+        try:
+            self.shm.close()
+        except BufferError:
+            # tensors still reference the segment, the mapping goes away with the process
+            pass
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class ShmRingReader:
+    """Attach lazily to the ring announced in a control message."""
+
+    def __init__(self):
+        self.ring = None
+
+    def read(self, control: bytes):
+        name, num_slots, slot_bytes, slot = pickle.loads(control)
+        if self.ring is None or self.ring.name != name:
+            self.ring = ShmRing(name, num_slots, slot_bytes)
+        return slot, self.ring.read(slot)
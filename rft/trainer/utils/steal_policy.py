@@ -0,0 +1,129 @@
+import random
+from typing import Dict, Optional, Tuple
+
+# Work-stealing policies of LocalBalanceManager.work_stealing.
+#
+# On every SYNC_NODE_QUEUE_LENGTHS message (ready queue lengths of all nodes, up to ~3s stale) a node
+# asks its policy whether to steal, from which peer and how many chunks. Policies only look at queue
+# lengths and the cost model, so the same objects drive the balancer and benchmarks/sim_work_stealing.py.
+
+
+class StealCostModel:
+    """Decide whether moving `n` chunks to this node pays off.
+
+    transfer time : latency + n * chunk_bytes / bandwidth, both measured on previous steals (EWMA)
+    idle time     : n / consume_rate, the time the local trainers would wait for those chunks, consume_rate
+                    being the chunks/s the local trainers pull from the ready queue
+
+    A steal is worthwhile when the chunks arrive before the local queue runs dry.
+    """
+
+    def __init__(
+        self,
+        bandwidth: float = 1.25e9,
+        latency: float = 1e-3,
+        chunk_bytes: float = 64 * 2**20,
+        consume_rate: float = 1.0,
+        alpha: float = 0.2,
+    ):
+        self.bandwidth = bandwidth
+        self.latency = latency
+        self.chunk_bytes = chunk_bytes
+        self.consume_rate = consume_rate
+        self.alpha = alpha
+
+    def _ewma(self, old: float, new: float) -> float:
+        return (1 - self.alpha) * old + self.alpha * new
+
+    def observe_transfer(self, num_chunks: int, nbytes: int, seconds: float):
+        if num_chunks <= 0 or seconds <= 0:
+            return
+        self.chunk_bytes = self._ewma(self.chunk_bytes, nbytes / num_chunks)
+        self.bandwidth = self._ewma(self.bandwidth, nbytes / seconds)
+
+    def observe_consumption(self, num_chunks: int, seconds: float):
+        if seconds <= 0:
+            return
+        if num_chunks > 0:
+            self.consume_rate = self._ewma(self.consume_rate, num_chunks / seconds)
+
+    def transfer_time(self, n: int) -> float:
+        return self.latency + n * self.chunk_bytes / self.bandwidth
+
+    def idle_time(self, n: int) -> float:
+        return n / max(self.consume_rate, 1e-6)
+
+    def worthwhile(self, n: int, local_queue: int) -> bool:
+        transfer = self.transfer_time(n)
+        return transfer <= self.idle_time(local_queue)
+
+
+class StealPolicy:
+    """Steal from a peer above the mean when this node is `steal_threshold` chunks below it."""
+
+    name = "base"
+
+    def __init__(self, steal_threshold: int = 16, cost_model: Optional[StealCostModel] = None, rng: Optional[random.Random] = None):
+        self.steal_threshold = steal_threshold
+        self.cost_model = cost_model
+        self.rng = rng or random.Random()
+
+    def choose(self, donors: list) -> Tuple[str, int]:
+        raise NotImplementedError
+
+    def plan(self, self_addr: str, queue_lengths: Dict[str, int], local_queue: int) -> Optional[Tuple[str, int]]:
+        """Return (peer address, number of chunks) to steal, or None."""
+        if len(queue_lengths) <= 1:
+            return None
+        mean_queue_length = sum(queue_lengths.values()) / len(queue_lengths)
+        starving = mean_queue_length - local_queue
+        if starving <= self.steal_threshold:
+            return None
+
+        donors = [(addr, qlen) for addr, qlen in queue_lengths.items() if addr != self_addr and qlen > mean_queue_length]
+        if not donors:
+            return None
+        addr, remote_q = self.choose(donors)
+        nums_to_steal = min(int(starving / 2), int((remote_q - mean_queue_length) / 2))
+        if nums_to_steal <= 0:
+            return None
+        if self.cost_model is not None and not self.cost_model.worthwhile(nums_to_steal, local_queue):
+            return None
+        return addr, nums_to_steal
+
+
+class RandomDonorPolicy(StealPolicy):
+    """Any peer above the mean, uniformly at random."""
+
+    name = "random"
+
+    def choose(self, donors: list) -> Tuple[str, int]:
+        return self.rng.choice(donors)
+
+
+class PowerOfTwoChoicesPolicy(StealPolicy):
+    """Sample two peers above the mean and steal from the longer queue.
+
+    Almost as good as always picking the longest queue, without every starving node piling onto the same
+    donor when they all see the same stale queue lengths.
+    """
+
+    name = "p2c"
+
+    def choose(self, donors: list) -> Tuple[str, int]:
+        if len(donors) == 1:
+            return donors[0]
+        return max(self.rng.sample(donors, 2), key=lambda x: x[1])
+
+
+STEAL_POLICIES = {
+    RandomDonorPolicy.name: RandomDonorPolicy,
+    PowerOfTwoChoicesPolicy.name: PowerOfTwoChoicesPolicy,
+}
+
+
+def build_steal_policy(name: str, steal_threshold: int = 16, use_cost_model: bool = True, **kwargs) -> StealPolicy:
+    if name not in STEAL_POLICIES:
+        raise ValueError(f"Unknown steal policy {name}, choose from {list(STEAL_POLICIES)}")
+    cost_model = StealCostModel() if use_cost_model else None
+    return STEAL_POLICIES[name](steal_threshold=steal_threshold, cost_model=cost_model, **kwargs)
@@ -0,0 +1,246 @@
+import os
+import sys
+import copy
+import mmap
+import pickle
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Any, Iterator, Optional, Tuple
+
+# 按字节预算存储 LocalBalanceManager 中等待任务组同步的生成结果（`cached_tasks`，completion_id -> TaskAndContent）。
+#
+# 条目按插入顺序保存在内存中，直到其 `data` 的估计大小超过 `max_bytes`。超出后最早的条目被溢出：
+# `data` 序列化后追加写入段文件（`<directory>/<seq>.spill`，每段 `segment_bytes`），内存中只保留
+# `data=None` 的 TaskAndContent，同步线程和监控线程无需读盘即可查看每个 `status`。
+# 读取溢出的条目时返回重新载入 `data` 的副本：已封存的段通过 mmap 读取，当前写入的段通过 pread 读取。
+# 段中最后一个条目被取出后删除该段文件。
+#
+# 内存中的条目按张量、数组、字符串等的字节数估计大小，不做序列化；每个条目只在溢出时序列化一次。
+# 设置 `max_disk_bytes` 时溢出的字节数也有上限：超出后丢弃最早溢出的条目（生成结果丢失，计入 `evicted`），
+# 保证平衡管理器占用的内存和磁盘都不超过预算。`max_bytes=0` 时全部保存在内存中，与普通 dict 相同。
+
+
+def estimate_size(obj: Any) -> int:
+    """估计对象占用的字节数：张量、数组、图像按数据大小，容器递归累加"""
+    if isinstance(obj, (bytes, bytearray, str)):
+        return len(obj)
+    if isinstance(obj, dict):
+        return 64 + sum(estimate_size(k) + estimate_size(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set)):
+        return 64 + sum(estimate_size(v) for v in obj)
+    if hasattr(obj, "element_size") and hasattr(obj, "numel"):
+        # torch.Tensor
+        return obj.numel() * obj.element_size()
+    if hasattr(obj, "nbytes"):
+        # numpy.ndarray
+        return int(obj.nbytes)
+    if type(obj).__module__.startswith("PIL"):
+        width, height = obj.size
+        return width * height * len(obj.getbands())
+    return sys.getsizeof(obj)
+
+
+class _Segment:
+    def __init__(self, path: str):
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        self.size = 0
+        self.live = 0
+        self.sealed = False
+        self.map = None
+
+    def append(self, blob: bytes) -> int:
+        offset = self.size
+        os.pwrite(self.fd, blob, offset)
+        self.size += len(blob)
+        self.live += 1
+        return offset
+
+    def read(self, offset: int, length: int) -> bytes:
+        if not self.sealed:
+            return os.pread(self.fd, length, offset)
+        if self.map is None:
+            self.map = mmap.mmap(self.fd, self.size, access=mmap.ACCESS_READ)
+        return self.map[offset:offset + length]
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        os.close(self.fd)
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class SpillingTaskStore:
+    """completion_id -> TaskAndContent 的类 dict 存储，超出内存预算的条目溢出到磁盘"""
+
+    def __init__(
+        self,
+        max_bytes: int = 0,
+        directory: Optional[str] = None,
+        max_disk_bytes: int = 0,
+        segment_bytes: int = 64 * 2**20,
+    ):
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.segment_bytes = segment_bytes
+        self.directory = directory
+        if max_bytes > 0:
+            assert directory is not None, "A spill directory is required with a memory budget"
+            shutil.rmtree(directory, ignore_errors=True)
+            os.makedirs(directory)
+
+        # key -> (tac, data 的估计字节数)
+        self._hot = OrderedDict()
+        self._hot_bytes = 0
+        # key -> (不含 data 的 tac, 段序号, 偏移, 长度)
+        self._cold = OrderedDict()
+        self._cold_bytes = 0
+        self._segments = {}
+        self._active = None
+        self._seq = 0
+        self._lock = threading.RLock()
+        self.counters = {"spilled": 0, "loaded": 0, "evicted": 0}
+
+    # ---- dict 接口 ----
+
+    def __len__(self) -> int:
+        return len(self._hot) + len(self._cold)
+
+    def __contains__(self, key) -> bool:
+        return key in self._hot or key in self._cold
+
+    def __setitem__(self, key, tac):
+        with self._lock:
+            self._discard(key)
+            size = estimate_size(tac.data) if self.max_bytes > 0 else 0
+            self._hot[key] = (tac, size)
+            self._hot_bytes += size
+            self._enforce()
+
+    def __getitem__(self, key):
+        with self._lock:
+            if key in self._hot:
+                return self._hot[key][0]
+            tac, seq, offset, length = self._cold[key]
+            return self._load(tac, seq, offset, length)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def pop(self, key, *default):
+        with self._lock:
+            if key in self._hot:
+                tac, size = self._hot.pop(key)
+                self._hot_bytes -= size
+                return tac
+            if key in self._cold:
+                tac, seq, offset, length = self._cold.pop(key)
+                tac = self._load(tac, seq, offset, length)
+                self._release(seq, length)
+                return tac
+            if default:
+                return default[0]
+            raise KeyError(key)
+
+    def discard(self, key) -> bool:
+        """删除条目但不读回溢出的 data，返回条目是否存在"""
+        with self._lock:
+            found = key in self
+            self._discard(key)
+            return found
+
+    def keys(self):
+        with self._lock:
+            return list(self._hot.keys()) + list(self._cold.keys())
+
+    def items(self) -> Iterator[Tuple[Any, Any]]:
+        """带 data 的所有条目，溢出的条目逐个读回，不会一次全部载入内存"""
+        for key in self.keys():
+            tac = self.get(key)
+            if tac is not None:
+                yield key, tac
+
+    def statuses(self) -> list:
+        """所有条目的 (key, status)，不读取溢出的 data"""
+        with self._lock:
+            return ([(k, tac.status) for k, (tac, _) in self._hot.items()] +
+                    [(k, entry[0].status) for k, entry in self._cold.items()])
+
+    def copy(self) -> dict:
+        return dict(self.items())
+
+    def update(self, entries: dict):
+        for key, tac in entries.items():
+            self[key] = tac
+
+    # ---- 溢出 ----
+
+    def _discard(self, key):
+        if key in self._hot:
+            self._hot_bytes -= self._hot.pop(key)[1]
+        elif key in self._cold:
+            _, seq, _, length = self._cold.pop(key)
+            self._release(seq, length)
+
+    def _load(self, tac, seq: int, offset: int, length: int):
+        loaded = copy.copy(tac)
+        loaded.data = pickle.loads(self._segments[seq].read(offset, length))
+        self.counters["loaded"] += 1
+        return loaded
+
+    def _release(self, seq: int, length: int):
+        self._cold_bytes -= length
+        segment = self._segments[seq]
+        segment.live -= 1
+        if segment.live == 0 and segment.sealed:
+            segment.close()
+            del self._segments[seq]
+
+    def _spill(self, key, tac):
+        blob = pickle.dumps(tac.data, protocol=pickle.HIGHEST_PROTOCOL)
+        if self._active is None or (self._active.size > 0 and self._active.size + len(blob) > self.segment_bytes):
+            if self._active is not None:
+                self._active.sealed = True
+                if self._active.live == 0:
+                    self._active.close()
+                    del self._segments[self._seq - 1]
+            self._active = _Segment(os.path.join(self.directory, f"{self._seq:08d}.spill"))
+            self._segments[self._seq] = self._active
+            self._seq += 1
+        offset = self._active.append(blob)
+        stub = copy.copy(tac)
+        stub.data = None
+        self._cold[key] = (stub, self._seq - 1, offset, len(blob))
+        self._cold_bytes += len(blob)
+        self.counters["spilled"] += 1
+
+    def _enforce(self):
+        if self.max_bytes <= 0:
+            return
+        while self._hot_bytes > self.max_bytes and self._hot:
+            key, (tac, size) = self._hot.popitem(last=False)
+            self._hot_bytes -= size
+            self._spill(key, tac)
+        while self.max_disk_bytes > 0 and self._cold_bytes > self.max_disk_bytes and self._cold:
+            key, (_, seq, _, length) = self._cold.popitem(last=False)
+            self._release(seq, length)
+            self.counters["evicted"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hot": len(self._hot),
+                "hot_mb": self._hot_bytes / 2**20,
+                "spilled_now": len(self._cold),
+                "spilled_mb": self._cold_bytes / 2**20,
+                "segments": len(self._segments),
+                **self.counters,
+            }
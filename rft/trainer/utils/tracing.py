@@ -0,0 +1,168 @@
+import json
+import time
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, Optional
+
+# Per-completion stage timestamps of the rollout pipeline.
+#
+# Every completion carries `TaskStatus.stage_times` ({event: unix time}), stamped as it moves through
+#     generation_start -> generated      trainer, `sample_step`
+#     cached                             local balancer receives it
+#     synced                             advantage received, put into `valid_tasks`
+#     reprocess_start -> reprocessed     `reprocess` builds its chunk
+#     served                             provider hands the chunk to a trainer rank
+# When a chunk is served, the LocalBalanceManager records the time spent in each stage into per-node
+# histograms (`StageTracer`), exported as JSON lines and/or Prometheus text.
+
+EVENTS = ("generation_start", "generated", "cached", "synced", "reprocess_start", "reprocessed", "served")
+
+# stage name -> (from event, to event)
+STAGES = {
+    "generation": ("generation_start", "generated"),
+    "report": ("generated", "cached"),
+    "advantage_wait": ("cached", "synced"),
+    "reprocess_wait": ("synced", "reprocess_start"),
+    "reprocess": ("reprocess_start", "reprocessed"),
+    "ready_wait": ("reprocessed", "served"),
+    "end_to_end": ("generation_start", "served"),
+}
+
+# seconds, upper bounds of the histogram buckets
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, float("inf"))
+
+
+def mark(stage_times: dict, event: str, when: Optional[float] = None):
+    stage_times[event] = time.time() if when is None else when
+
+
+class StageHistogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile."""
+        if self.count == 0:
+            return 0.0
+        # at least one observation, so q=0 is the bucket of the smallest one
+        rank = max(q * self.count, 1)
+        total = 0
+        for bound, c in zip(BUCKETS, self.counts):
+            total += c
+            if total >= rank:
+                return bound
+        return BUCKETS[-1]
+
+
+class StageTracer:
+    """Per-node histograms of the time completions spend in each stage."""
+
+    def __init__(self, node: str):
+        self.node = node
+        self.histograms = {stage: StageHistogram() for stage in STAGES}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage_times: dict):
+        with self._lock:
+            for stage, (start, end) in STAGES.items():
+                if start in stage_times and end in stage_times:
+                    self.histograms[stage].observe(max(0.0, stage_times[end] - stage_times[start]))
+
+    def record_many(self, stage_times_list: Iterable[dict]):
+        for stage_times in stage_times_list:
+            self.record(stage_times)
+
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "time": time.time(),
+                "node": self.node,
+                "stages": {
+                    stage: {
+                        "count": h.count,
+                        "sum": h.sum,
+                        "p50": h.quantile(0.5),
+                        "p99": h.quantile(0.99),
+                        "buckets": list(h.counts),
+                    }
+                    for stage, h in self.histograms.items()
+                },
+                "counters": dict(self.counters),
+            }
+
+    def prometheus(self, gauges: Optional[Dict[str, float]] = None) -> str:
+        """Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        node = snapshot["node"]
+        lines = ["# TYPE arl_stage_seconds histogram"]
+        for stage, h in snapshot["stages"].items():
+            cumulative = 0
+            for bound, c in zip(BUCKETS, h["buckets"]):
+                cumulative += c
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'arl_stage_seconds_bucket{{node="{node}",stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'arl_stage_seconds_sum{{node="{node}",stage="{stage}"}} {h["sum"]}')
+            lines.append(f'arl_stage_seconds_count{{node="{node}",stage="{stage}"}} {h["count"]}')
+        lines.append("# TYPE arl_events_total counter")
+        for name, value in snapshot["counters"].items():
+            lines.append(f'arl_events_total{{node="{node}",event="{name}"}} {value}')
+        if gauges:
+            lines.append("# TYPE arl_queue_length gauge")
+            for name, value in gauges.items():
+                lines.append(f'arl_queue_length{{node="{node}",queue="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        snapshot = self.snapshot()
+        return " | ".join(
+            f"{stage} p50 {h['p50']:g}s p99 {h['p99']:g}s"
+            for stage, h in snapshot["stages"].items() if h["count"] > 0
+        )
+
+
+def serve_prometheus(tracer: StageTracer, port: int, gauges=None) -> ThreadingHTTPServer:
+    """Serve `/metrics` in a daemon thread; `gauges` is a callable returning extra {name: value}."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = tracer.prometheus(gauges() if gauges else None).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def export_jsonl(tracer: StageTracer, path: str, interval: float, gauges=None):
+    """Append a snapshot to `path` every `interval` seconds (blocking, run it in a thread)."""
+    with open(path, "a") as f:
+        while True:
+            time.sleep(interval)
+            snapshot = tracer.snapshot()
+            if gauges:
+                snapshot["queues"] = gauges()
+            f.write(json.dumps(snapshot) + "\n")
+            f.flush()
@@ -0,0 +1,78 @@
+import os
+import socket
+import tempfile
+from urllib.parse import urlparse
+
+import zmq
+
+# Endpoints and socket options of the 0MQ links between trainer ranks, sync managers and the task dispatcher.
+#
+# The global endpoints (task sync PUB, result collect ROUTER, data dispatch REP) are reached over TCP at
+# MASTER_ADDR when the job spans several nodes. With `transport="auto"` a single-node job binds them to
+# `ipc://` (Unix domain sockets) instead, which skips the TCP/IP stack on loopback. A job is single-node when
+# all its ranks are local (`WORLD_SIZE == LOCAL_WORLD_SIZE`, set by torchrun / accelerate launch); GPU counts
+# say nothing about it, a host may run fewer ranks than it has GPUs. `inproc://` does not apply:
+# it only connects sockets sharing one context in one process, and every party here is a separate process.
+# The node-local endpoints (local collect / provider) are configured as ipc addresses already.
+#
+# TCP sockets get larger kernel buffers and high-water marks before they bind or connect (`tune_socket`):
+#     ZMQ_TCP_BUFFER_MB   SO_SNDBUF / SO_RCVBUF, default 4
+#     ZMQ_TCP_HWM         send / receive high-water mark in messages, default 10000; HWMs already changed
+#                         from the 0MQ default (e.g. 0 for unbounded) are kept
+# ipc sockets keep the 0MQ defaults.
+
+TRANSPORTS = ("auto", "tcp", "ipc")
+_DEFAULT_HWM = 1000
+
+
+def single_node() -> bool:
+    """Whether every rank of the job runs on this host, tcp is kept when the launcher does not say."""
+    world_size = int(os.environ.get("WORLD_SIZE", "1"))
+    local_world_size = os.environ.get("LOCAL_WORLD_SIZE")
+    if local_world_size is None:
+        return world_size == 1
+    return world_size == int(local_world_size)
+
+
+def global_endpoint(name: str, host: str, port: int, transport: str = "auto") -> str:
+    assert transport in TRANSPORTS, f"Unknown transport {transport}"
+    if transport == "ipc" or (transport == "auto" and single_node()):
+        return "ipc://" + os.path.join(tempfile.gettempdir(), f"arl_{name}_{port}")
+    return f"tcp://{host}:{port}"
+
+
+def tune_socket(sock: zmq.Socket, address: str) -> zmq.Socket:
+    if not address.startswith("tcp://"):
+        return sock
+    buffer_bytes = int(float(os.environ.get("ZMQ_TCP_BUFFER_MB", "4")) * 2**20)
+    hwm = int(os.environ.get("ZMQ_TCP_HWM", "10000"))
+    sock.setsockopt(zmq.SNDBUF, buffer_bytes)
+    sock.setsockopt(zmq.RCVBUF, buffer_bytes)
+    if sock.getsockopt(zmq.SNDHWM) == _DEFAULT_HWM:
+        sock.setsockopt(zmq.SNDHWM, hwm)
+    if sock.getsockopt(zmq.RCVHWM) == _DEFAULT_HWM:
+        sock.setsockopt(zmq.RCVHWM, hwm)
+    return sock
+
+
+def bind(sock: zmq.Socket, address: str) -> zmq.Socket:
+    tune_socket(sock, address).bind(address)
+    return sock
+
+
+def connect(sock: zmq.Socket, address: str) -> zmq.Socket:
+    tune_socket(sock, address).connect(address)
+    return sock
+
+
+def local_ip(peer_address: str) -> str:
+    """IP of this host on the route to `peer_address`, loopback when the peer is not reached over TCP."""
+    parsed = urlparse(peer_address)
+    if parsed.scheme != "tcp":
+        return "127.0.0.1"
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.connect((parsed.hostname, parsed.port))
+        return s.getsockname()[0]
+    finally:
+        s.close()
@@ -0,0 +1,128 @@
+import re
+import math
+import time
+
+import torch
+import torch.distributed as dist
+from torch.distributed.tensor import DTensor, Shard
+
+# Copies the weights of the FSDP-wrapped training model into the separate inference model before every
+# sampling phase.
+#
+# The inference model keeps its parameters as preallocated bf16 tensors. On FSDP2 the local shards of
+# parameters sharded along dim 0 over a 1-D mesh are cast to bf16, packed into flat buckets of about
+# `bucket_mb` MB and all-gathered with one collective per bucket. Each gathered bucket is unpacked straight
+# into the inference parameters, so only one bucket of full weights exists at a time, instead of a full
+# bf16 state dict built by `full_tensor()` on every DTensor. Other DTensors (e.g. with tensor parallel
+# placements) fall back to `full_tensor()`. Plain tensors (FSDP1 inside `summon_full_params`) are copied in place.
+#
+# Parameters frozen in the training model (`requires_grad=False`, e.g. a frozen `vpm`) cannot change, so they
+# are only copied by the first sync. `sync` returns the time, the peak CUDA memory and the bytes gathered
+# and skipped.
+
+_WRAPPER_PREFIXES = re.compile(r"(_fsdp_wrapped_module|_checkpoint_wrapped_module|_orig_mod)\.")
+
+
+def _clean_name(name: str) -> str:
+    return _WRAPPER_PREFIXES.sub("", name)
+
+
+def _bucketable(src) -> bool:
+    return (isinstance(src, DTensor) and src.device_mesh.ndim == 1 and src.ndim > 0
+            and src.is_floating_point() and tuple(src.placements) == (Shard(0),))
+
+
+class WeightSyncEngine:
+    def __init__(self, inference_model: torch.nn.Module, bucket_mb: int = 512, dtype: torch.dtype = torch.bfloat16):
+        self.inference_model = inference_model
+        self.bucket_bytes = bucket_mb * 2**20
+        self.dtype = dtype
+        self.synced = False
+        for p in inference_model.parameters():
+            if p.is_floating_point():
+                p.data = p.data.to(dtype)
+
+    def _plan(self, model: torch.nn.Module) -> list:
+        """(source, target, frozen) of every parameter, checked before any collective is issued."""
+        targets = dict(self.inference_model.named_parameters())
+        plan = []
+        for name, src in model.named_parameters():
+            name = _clean_name(name)
+            if name not in targets:
+                raise ValueError(f"Parameter {name} of the training model is missing in the inference model")
+            plan.append((src, targets.pop(name), not src.requires_grad))
+        if targets:
+            raise ValueError(f"Parameters {sorted(targets)[:5]} of the inference model are missing in the training model")
+        return plan
+
+    @torch.no_grad()
+    def _gather_bucket(self, bucket: list, device) -> int:
+        """All-gather a bucket of Shard(0) DTensors on one mesh into their targets, returns the bytes gathered."""
+        group = bucket[0][0].device_mesh.get_group()
+        world = dist.get_world_size(group)
+        layout = []
+        for src, _ in bucket:
+            rows = src.shape[0]
+            chunk = math.ceil(rows / world)
+            layout.append((rows, chunk, math.prod(src.shape[1:])))
+        total = sum(chunk * rest for _, chunk, rest in layout)
+
+        send = torch.zeros(total, dtype=self.dtype, device=device)
+        offset = 0
+        for (src, _), (_, chunk, rest) in zip(bucket, layout):
+            local = src.to_local().reshape(-1)
+            send[offset:offset + local.numel()].copy_(local)
+            offset += chunk * rest
+        recv = torch.empty(world * total, dtype=self.dtype, device=device)
+        dist.all_gather_into_tensor(recv, send, group=group)
+        del send
+
+        recv = recv.view(world, total)
+        offset = 0
+        for (_, tgt), (rows, chunk, rest) in zip(bucket, layout):
+            # rank r holds rows [r * chunk, (r + 1) * chunk), the last ranks are padded
+            full = recv[:, offset:offset + chunk * rest].reshape(world * chunk, rest)[:rows]
+            tgt.copy_(full.view(tgt.shape))
+            offset += chunk * rest
+        return recv.numel() * recv.element_size()
+
+    @torch.no_grad()
+    def sync(self, model: torch.nn.Module, device) -> dict:
+        plan = self._plan(model)
+        torch.cuda.synchronize(device)
+        torch.cuda.reset_peak_memory_stats(device)
+        start = time.perf_counter()
+        self.inference_model.to(device)
+
+        gathered = skipped = 0
+        bucket, bucket_bytes = [], 0
+        for src, tgt, frozen in plan:
+            if frozen and self.synced:
+                skipped += tgt.numel() * tgt.element_size()
+                continue
+            if not _bucketable(src):
+                full = src.full_tensor() if isinstance(src, DTensor) else src
+                tgt.copy_(full.to(device=device).view(tgt.shape))
+                continue
+            if bucket and (src.device_mesh is not bucket[0][0].device_mesh or bucket_bytes >= self.bucket_bytes):
+                gathered += self._gather_bucket(bucket, device)
+                bucket, bucket_bytes = [], 0
+            bucket.append((src, tgt))
+            bucket_bytes += tgt.numel() * tgt.element_size()
+        if bucket:
+            gathered += self._gather_bucket(bucket, device)
+
+        targets = dict(self.inference_model.named_buffers())
+        for name, buf in model.named_buffers():
+            tgt = targets.get(_clean_name(name))
+            if tgt is not None:
+                tgt.copy_(buf)
+
+        torch.cuda.synchronize(device)
+        self.synced = True
+        return {
+            "seconds": time.perf_counter() - start,
+            "peak_memory_gb": torch.cuda.max_memory_allocated(device) / 2**30,
+            "gathered_gb": gathered / 2**30,
+            "skipped_gb": skipped / 2**30,
+        }
@@ -0,0 +1,84 @@
+import io
+import pickle
+import warnings
+from typing import Any, List, Sequence, Union
+
+import torch
+import zmq
+
+# Wire format for chunks sent between the local balancer and trainer ranks.
+#
+# frame 0   : pickled skeleton of the object, every tensor replaced by a persistent id
+#             ("tensor", index, dtype, shape)
+# frame 1..n: raw bytes of each tensor, in index order
+#
+# The sender keeps references to the tensors so the buffers can be handed to zmq with `copy=False`,
+# the receiver rebuilds every tensor with `torch.frombuffer` on the received frame, without copying.
+# Received tensors share memory with the zmq frames and are read-only: clone them before in-place updates.
+
+_DTYPES = {str(dtype): dtype for dtype in (
+    torch.float64, torch.float32, torch.float16, torch.bfloat16,
+    torch.int64, torch.int32, torch.int16, torch.int8, torch.uint8, torch.bool,
+    torch.complex64, torch.complex128,
+)}
+
+
+class _TensorPickler(pickle.Pickler):
+    def __init__(self, file, buffers: list):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.buffers = buffers
+
+    def persistent_id(self, obj):
+        if not isinstance(obj, torch.Tensor):
+            return None
+        t = obj.detach()
+        if t.device.type != "cpu":
+            t = t.cpu()
+        t = t.contiguous()
+        self.buffers.append(t.reshape(-1).view(torch.uint8).numpy() if t.numel() > 0 else b"")
+        return ("tensor", len(self.buffers) - 1, str(t.dtype), tuple(t.shape))
+
+
+class _TensorUnpickler(pickle.Unpickler):
+    def __init__(self, file, frames: Sequence):
+        super().__init__(file)
+        self.frames = frames
+
+    def persistent_load(self, pid):
+        kind, index, dtype, shape = pid
+        if kind != "tensor":
+            raise pickle.UnpicklingError(f"Unknown persistent id {kind}")
+        dtype = _DTYPES[dtype]
+        frame = self.frames[index]
+        buf = frame.buffer if isinstance(frame, zmq.Frame) else memoryview(frame)
+        if buf.nbytes == 0:
+            return torch.empty(shape, dtype=dtype)
+        with warnings.catch_warnings():
+            # zmq frames are read-only, torch warns about it on every call
+            warnings.simplefilter("ignore", UserWarning)
+            return torch.frombuffer(buf, dtype=torch.uint8).view(dtype).reshape(shape)
+
+
+def serialize_to_frames(obj: Any) -> List[Union[bytes, memoryview]]:
+    """Serialize `obj` into a header frame plus one raw frame per tensor."""
+    buffers = []
+    header = io.BytesIO()
+    _TensorPickler(header, buffers).dump(obj)
+    return [header.getvalue(), *buffers]
+
+
+def deserialize_from_frames(frames: Sequence[Union[bytes, zmq.Frame]]) -> Any:
+    """Inverse of `serialize_to_frames`, accepts frames from `recv_multipart(copy=False)`."""
+    header = frames[0].bytes if isinstance(frames[0], zmq.Frame) else frames[0]
+    return _TensorUnpickler(io.BytesIO(header), frames[1:]).load()
+
+
+def send_tensors(socket: zmq.Socket, obj: Any = None, frames: list = None):
+    """Send `obj` (or frames already built by `serialize_to_frames`) as one multipart message without copying."""
+    if frames is None:
+        frames = serialize_to_frames(obj)
+    socket.send_multipart(frames, copy=False)
+
+
+def recv_tensors(socket: zmq.Socket) -> Any:
+    return deserialize_from_frames(socket.recv_multipart(copy=False))
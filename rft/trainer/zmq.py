@@ -2,19 +2,22 @@ import zmq
 from dataclasses import dataclass,field
 import datetime
 import uuid
-from collections import defaultdict
+from collections import Counter, defaultdict, deque
 from typing import Optional,Any
 import numpy as np
 import pickle
+import json
 import os
 import time
-from .utils import logger,_process_inputs,Timer
+from .utils import logger,_process_inputs,ReprocessPool,Timer,serialize_to_frames,deserialize_from_frames,send_tensors,ShmRing,RolloutLog,load_snapshot,load_snapshot_entries,build_steal_policy,StageTracer,mark,serve_prometheus,export_jsonl,ImageCache,materialize_inputs,SpillingTaskStore
+from .utils import transport
 import threading
 import queue
+import atexit
+import re
 from transformers import AutoProcessor
 import socket
-import random
-from urllib.parse import urlparse
+import tempfile
 
 @dataclass
 class TaskStatus:
@@ -23,6 +26,14 @@ class TaskStatus:
     score: float
     created_time: datetime.datetime = field(default_factory=datetime.datetime.now)
     advantage: Optional[float] = None
+    # 各阶段的时间戳 {事件: unix 时间}，见 trainer/utils/tracing.py
+    stage_times: dict = field(default_factory=dict)
+    # 缓存该结果的节点，由本地平衡管理器填写；-1 表示未知，任务组会通知所有节点
+    node: int = -1
+    # 生成该结果的模型版本（训练进程生成时的 global_step），-1 表示未知
+    policy_version: int = -1
+    # 多轮任务中的轮次（与 data["step_id"] 相同），监控线程上报超时任务时无需读取已溢出的 data
+    step_id: int = 0
     
 @dataclass
 class TaskAndContent:
@@ -31,9 +42,93 @@ class TaskAndContent:
     
 @dataclass
 class SyncAdvantagesRequest:
-    gid: int
+    # 获取所有通知该节点、尚未取回的任务组，回复 [(gid, list[TaskStatus]), ...]
+    node: int
+
+@dataclass
+class StragglerReport:
+    # 节点缓存中超时未同步的任务：task_id -> step_id
+    tasks: dict
 
 DEFAULT_THRESHOLD = 0.90
+STRAGGLER_POLICIES = ("pad", "regenerate", "drop")
+
+
+class GroupStore:
+    """按列存储收集中的任务组。
+    
+    每个任务组占用一个槽位，分数、completion id（16 字节 UUID）按槽位预分配在连续数组中，
+    任务组完成后整批取出，用于向量化计算优势值，槽位立即回收。
+    同时记录缓存了该任务组结果的节点（位掩码，-1 表示未知的节点，即所有节点）。
+    """
+    
+    def __init__(self, group_size: int, capacity: int = 1024):
+        self.group_size = group_size
+        self.slots = {}
+        self.task_ids = [None] * capacity
+        self.scores = np.zeros((capacity, group_size), dtype=np.float64)
+        self.completion_ids = np.zeros((capacity, group_size, 16), dtype=np.uint8)
+        self.counts = np.zeros(capacity, dtype=np.int32)
+        self.first_arrival = np.zeros(capacity, dtype=np.float64)
+        self.nodes = [0] * capacity
+        self.free = list(range(capacity - 1, -1, -1))
+        self.completed = []
+    
+    def __len__(self):
+        return len(self.slots)
+    
+    def _grow(self):
+        capacity = len(self.task_ids)
+        self.task_ids.extend([None] * capacity)
+        self.nodes.extend([0] * capacity)
+        self.scores = np.concatenate([self.scores, np.zeros_like(self.scores)])
+        self.completion_ids = np.concatenate([self.completion_ids, np.zeros_like(self.completion_ids)])
+        self.counts = np.concatenate([self.counts, np.zeros_like(self.counts)])
+        self.first_arrival = np.concatenate([self.first_arrival, np.zeros_like(self.first_arrival)])
+        self.free.extend(range(2 * capacity - 1, capacity - 1, -1))
+    
+    def add(self, task_status: TaskStatus):
+        slot = self.slots.get(task_status.task_id)
+        if slot is None:
+            if not self.free:
+                self._grow()
+            slot = self.free.pop()
+            self.slots[task_status.task_id] = slot
+            self.task_ids[slot] = task_status.task_id
+            self.counts[slot] = 0
+            self.first_arrival[slot] = time.monotonic()
+            self.nodes[slot] = 0
+        self.nodes[slot] |= -1 if task_status.node < 0 else 1 << task_status.node
+        i = self.counts[slot]
+        self.scores[slot, i] = task_status.score
+        self.completion_ids[slot, i] = np.frombuffer(task_status.completion_id.bytes, dtype=np.uint8)
+        self.counts[slot] = i + 1
+        if i + 1 == self.group_size:
+            self.completed.append(slot)
+    
+    def pop_completed(self):
+        """取出所有已完成的任务组并回收槽位，返回 (task_ids, scores, completion_ids, first_arrival, nodes)。"""
+        slots = np.array(self.completed, dtype=np.int64)
+        self.completed = []
+        task_ids = [self.task_ids[slot] for slot in slots]
+        nodes = [self.nodes[slot] for slot in slots]
+        result = (task_ids, self.scores[slots], self.completion_ids[slots], self.first_arrival[slots], nodes)
+        for slot, task_id in zip(slots, task_ids):
+            del self.slots[task_id]
+            self.task_ids[slot] = None
+            self.free.append(int(slot))
+        return result
+    
+    def pop(self, task_id: int):
+        """取出未完成的任务组并回收槽位，返回 (scores, completion_ids, nodes)，任务组不存在时返回 None。"""
+        slot = self.slots.pop(task_id, None)
+        if slot is None:
+            return None
+        n = self.counts[slot]
+        result = (self.scores[slot, :n].copy(), self.completion_ids[slot, :n].copy(), self.nodes[slot])
+        self.task_ids[slot] = None
+        self.free.append(slot)
+        return result
 
 def global_sync_proc(
     *args,**kwargs
@@ -59,7 +154,12 @@ class GlobalSyncManager:
         num_generations: int,
         num_to_sync: int,
         num_nodes: int,
-        tp_size: int = 1
+        tp_size: int = 1,
+        rollout_log_dir: Optional[str] = None,
+        resume_dir: Optional[str] = None,
+        straggler_policy: str = "drop",
+        data_dispatch_address: Optional[str] = None,
+        report_outcomes: bool = False
     ):
         """初始化全局同步管理器。
         
@@ -70,13 +170,26 @@ class GlobalSyncManager:
             num_to_sync: 需要同步的数据量
             num_nodes: 节点数量
             tp_size: 张量并行大小
+            rollout_log_dir: 追加写入收到的 TaskStatus 的日志目录，None 表示不持久化
+            resume_dir: 恢复训练时检查点中的 rollout 目录，从其中的快照和之后的日志恢复状态
+            straggler_policy: 节点上报超时任务后如何处理未完成的任务组：
+                pad 以已到达结果的均值补齐缺失的分数后计算优势值并发布已到达的结果；
+                regenerate 丢弃已到达的结果并重新分发该任务（仅限多轮任务的第一步，其余退化为 pad）；
+                drop 丢弃已到达的结果
+            data_dispatch_address: 全局任务分发地址，regenerate 策略用于重新分发任务
+            report_outcomes: 是否把每个完成任务组的结果（task_id, 平均分, 是否会被丢弃）发送给任务分发进程，
+                供其在生成前跳过或降低总是满分/总是失败的任务的采样概率
         """
+        assert straggler_policy in STRAGGLER_POLICIES, f"Unknown straggler policy {straggler_policy}"
         self.sync_address = sync_address
         self.collect_address = collect_address
         self.num_generations = num_generations
         self.num_to_sync = num_to_sync
         self.num_nodes = num_nodes
         self.tp_size = tp_size
+        self.resume_dir = resume_dir
+        self.rollout_log = RolloutLog(rollout_log_dir, "global") if rollout_log_dir else None
+        self.straggler_policy = straggler_policy
         
         # 初始化变量
         self.num_machines = int(os.environ.get("NUM_MACHINES", "1"))
@@ -86,10 +199,31 @@ class GlobalSyncManager:
         self.send_count = 0
         self.current_gid = 0
         self.sync_steps = 0
+        # gid -> (task_id, completion_ids, scores, advantages, nodes)，通知的节点都取回后立即释放
         self.sync_pool = {}
+        # gid -> 尚未取回的节点数
         self.sync_count = defaultdict(int)
-        self.task_collection = defaultdict(list)
+        # 节点 -> 通知该节点、尚未取回的 gid（只通知缓存了任务组结果的节点）
+        self.node_pending = defaultdict(list)
+        # 从快照恢复时仍有待取回任务组的节点，重新发送同步信号直到该节点发来取回请求
+        self.republish_nodes = set()
+        # 同步消息统计：published 发布的任务组，signals 发送的通知，requests 节点的取回请求，payloads 发送的任务组份数
+        self.sync_stats = Counter()
+        self.task_collection = GroupStore(num_generations)
+        # 任务组从收到第一个结果到完成的耗时（秒）
+        self.group_latencies = deque(maxlen=10000)
         self.node_queue_lengths = {}
+        # 超时处理：task_id -> 仍可能迟到的结果数，迟到的结果直接作为丢弃的任务组发布
+        self.straggler_missing = defaultdict(int)
+        # 待发布的超时任务组 (task_id, completion_ids, scores, advantages or None, nodes)
+        self.straggler_groups = []
+        self.straggler_counts = Counter()
+        # 任务组结果，批量发送给任务分发进程
+        self.report_outcomes = report_outcomes
+        self.group_outcomes = []
+        self.last_outcome_report = time.monotonic()
+        # 浪费的生成：分数过高 (saturated) 或优势值相同 (uniform) 而被丢弃的任务组及其结果数
+        self.wasted_counts = Counter()
         
         # 初始化ZMQ
         self.zmqctx = zmq.Context(self.num_machines*2)
@@ -101,11 +235,21 @@ class GlobalSyncManager:
         self.sync_sender.setsockopt(zmq.TCP_KEEPALIVE_IDLE, 60)
         self.sync_sender.setsockopt(zmq.TCP_KEEPALIVE_CNT, 5)
         self.sync_sender.setsockopt(zmq.TCP_KEEPALIVE_INTVL, 10)
-        self.sync_sender.bind(self.sync_address)
+        transport.bind(self.sync_sender, self.sync_address)
         
         # 设置任务收集器
-        self.task_collect = self.zmqctx.socket(zmq.REP)
-        self.task_collect.bind(self.collect_address)
+        # ROUTER 按身份回复：REQ 客户端保持一问一答，DEALER 客户端可以流水线发送批量的 TaskStatus 并异步接收确认
+        self.task_collect = self.zmqctx.socket(zmq.ROUTER)
+        self.task_collect.setsockopt(zmq.SNDHWM, 0)
+        self.task_collect.setsockopt(zmq.RCVHWM, 0)
+        transport.bind(self.task_collect, self.collect_address)
+        self._envelope = None
+        
+        # 重新分发超时的任务，上报任务组结果
+        self.task_dispatch = None
+        if data_dispatch_address is not None and (straggler_policy == "regenerate" or report_outcomes):
+            self.task_dispatch = self.zmqctx.socket(zmq.REQ)
+            transport.connect(self.task_dispatch, data_dispatch_address)
     
     def _monitor(self):
         """监控线程，定期报告状态"""
@@ -114,20 +258,64 @@ class GlobalSyncManager:
             last_count = self.recv_count
             time.sleep(interval)
             logger.info(f"[ Global GID: {self.current_gid} | SyncPool Size: {len(self.sync_pool)} | {self.total_ack} acked / {self.recv_count} total ] Current {self.send_count} sent, {self.ack_advantages} ack. Speed {(self.recv_count-last_count)/interval:.2f}/s.")
+            if self.group_latencies:
+                latencies = np.array(self.group_latencies)
+                logger.info(f"[ Global Groups | Open: {len(self.task_collection)} ] Group completion latency "
+                            f"p50 {np.percentile(latencies, 50):.1f}s, p99 {np.percentile(latencies, 99):.1f}s, max {latencies.max():.1f}s.")
+            if self.straggler_counts:
+                logger.info(f"[ Global Stragglers | Policy: {self.straggler_policy} ] " +
+                            ", ".join(f"{k}: {v}" for k, v in sorted(self.straggler_counts.items())))
+            if self.sync_stats["published"]:
+                published = self.sync_stats["published"]
+                logger.info(f"[ Global Sync | {published} groups ] per group: "
+                            f"{self.sync_stats['signals'] / published:.2f} signals, "
+                            f"{self.sync_stats['requests'] / published:.2f} requests, "
+                            f"{self.sync_stats['payloads'] / published:.2f} payloads")
+            if self.wasted_counts["groups"]:
+                wasted = self.wasted_counts["saturated_completions"] + self.wasted_counts["uniform_completions"]
+                logger.info(f"[ Global Wasted Generations | {wasted} / {self.wasted_counts['completions']} "
+                            f"({wasted / max(self.wasted_counts['completions'], 1):.1%}) ] " +
+                            ", ".join(f"{k}: {v}" for k, v in sorted(self.wasted_counts.items())))
     
     def _sync_node_queue(self):
-        """节点队列同步线程"""
+        """节点队列同步线程，设置 NODE_QUEUE_TRACE 时把每次同步的队列长度追加到该文件，供窃取策略模拟器回放"""
+        trace_path = os.environ.get("NODE_QUEUE_TRACE")
+        trace = open(trace_path, "a") if trace_path else None
         while True:
             time.sleep(3)
+            self._republish_pending()
             with self.sync_lock:
                 self.sync_sender.send_multipart([
                     b"SYNC_NODE_QUEUE_LENGTHS",
                     pickle.dumps(self.node_queue_lengths)
                 ])
+            if trace is not None:
+                trace.write(json.dumps({"time": time.time(), "queues": self.node_queue_lengths}) + "\n")
+                trace.flush()
             logger.debug(f"Sync node queue lengths {len(self.node_queue_lengths)}")
     
+    def _republish_pending(self):
+        """向恢复后仍有待取回任务组的节点重新发送同步信号。
+        
+        恢复前发出的信号已随进程丢失，节点重连前发布的信号也会被丢弃，因此周期性重发直到节点取回
+        """
+        for node in list(self.republish_nodes):
+            pending = len(self.node_pending.get(node, ()))
+            if pending == 0:
+                self.republish_nodes.discard(node)
+                continue
+            with self.sync_lock:
+                self.sync_sender.send_multipart([
+                    f"SYNC_ADVANTAGES/{node}/".encode(),
+                    pickle.dumps(pending)
+                ])
+            self.sync_stats["signals"] += 1
+    
     def start(self):
         """启动同步管理器"""
+        if self.resume_dir is not None:
+            self._restore()
+        
         # 启动监控线程
         monitor_thd = threading.Thread(target=self._monitor, daemon=True)
         monitor_thd.start()
@@ -139,11 +327,19 @@ class GlobalSyncManager:
         # 主循环
         self._run_main_loop()
 
+    def _reply_string(self, message: str):
+        """按当前消息的身份信封回复字符串"""
+        self.task_collect.send_multipart(self._envelope + [message.encode()])
+
+    def _reply_pyobj(self, obj: Any):
+        """按当前消息的身份信封回复 Python 对象"""
+        self.task_collect.send_multipart(self._envelope + [pickle.dumps(obj)])
+
     def _handle_ack(self, ack_count: int):
         """处理确认消息 (int)"""
         self.ack_advantages += ack_count
         self.total_ack += ack_count
-        self.task_collect.send_string(f"Recived")
+        self._reply_string(f"Recived")
         
         if self.ack_advantages >= self.num_to_sync:
             # 同步所有设备进行更新
@@ -155,68 +351,276 @@ class GlobalSyncManager:
             self.ack_advantages -= self.num_to_sync
             self.send_count -= self.num_to_sync # 假设send_count在发送时增加
 
+    def _materialize_group(self, gid: int) -> list:
+        task_id, completion_ids, scores, advantages, _ = self.sync_pool[gid]
+        if advantages is None:
+            # 超时被丢弃的任务组，节点直接清除缓存
+            advantages = [None] * len(scores)
+        return [
+            TaskStatus(task_id=task_id, completion_id=uuid.UUID(bytes=cid.tobytes()), score=float(score),
+                       advantage=None if adv is None else float(adv))
+            for cid, score, adv in zip(completion_ids, scores, advantages)
+        ]
+
     def _handle_sync_request(self, request: SyncAdvantagesRequest):
-        """处理同步优势请求 (SyncAdvantagesRequest)"""
-        assert request.gid in self.sync_pool, f"Group {request.gid} not in SyncPool"
-        self.task_collect.send_pyobj(self.sync_pool[request.gid])
-        self.sync_count[request.gid] += 1
-        if self.sync_count[request.gid] == self.num_nodes:
-            # 所有节点已确认此任务
-            del self.sync_count[request.gid]
-            del self.sync_pool[request.gid]
-            logger.debug(f"Sync advantages for {request.gid} completed")
+        """处理同步优势请求 (SyncAdvantagesRequest)，回复通知该节点的所有任务组"""
+        gids = self.node_pending.pop(request.node, [])
+        self.republish_nodes.discard(request.node)
+        self._reply_pyobj([(gid, self._materialize_group(gid)) for gid in gids])
+        self.sync_stats["requests"] += 1
+        self.sync_stats["payloads"] += len(gids)
+        for gid in gids:
+            self.sync_count[gid] -= 1
+            if self.sync_count[gid] == 0:
+                # 所有通知的节点已取回此任务组
+                del self.sync_count[gid]
+                del self.sync_pool[gid]
+                logger.debug(f"Sync advantages for {gid} completed")
+
+    def _target_nodes(self, nodes: int) -> list:
+        """缓存了任务组结果的节点，未知时为所有节点"""
+        if nodes < 0:
+            return list(range(self.num_nodes))
+        return [node for node in range(nodes.bit_length()) if nodes >> node & 1]
 
     def _handle_queue_update(self, queue_lengths: dict):
         """处理节点队列长度更新 (dict)"""
         self.node_queue_lengths.update(queue_lengths)
-        self.task_collect.send_string("Recived node queue lengths")
+        self._reply_string("Recived node queue lengths")
 
     def _handle_task_status(self, task_status: TaskStatus):
         """处理任务状态 (TaskStatus)"""
-        self.task_collect.send_string(f"Recived completion {task_status.completion_id}")
-        self.recv_count += 1
-        self.task_collection[task_status.task_id].append(task_status)
+        if self.rollout_log is not None:
+            self.rollout_log.append("status", [task_status])
+        self._reply_string(f"Recived completion {task_status.completion_id}")
+        self._collect_task_status(task_status)
+        self._publish_completed_groups()
+
+    def _handle_task_status_batch(self, batch: list):
+        """处理批量任务状态 (list[TaskStatus])，整批只回复一次确认"""
+        if self.rollout_log is not None:
+            self.rollout_log.append("status", batch)
+        self._reply_string(f"Recived {len(batch)} completions")
+        for task_status in batch:
+            self._collect_task_status(task_status)
+        self._publish_completed_groups()
+
+    def _handle_straggler_report(self, report: StragglerReport):
+        """处理节点上报的超时任务 (StragglerReport)，回复每个任务的处理方式"""
+        if self.rollout_log is not None:
+            self.rollout_log.append("straggler", report)
+        actions = {task_id: self._resolve_straggler(task_id, step_id) for task_id, step_id in report.tasks.items()}
+        self._publish_completed_groups()
+        self._reply_pyobj(actions)
+
+    def _resolve_straggler(self, task_id: int, step_id: int, dispatch: bool = True) -> str:
+        """按策略处理一个未完成的任务组，已完成或其他节点已上报的任务返回 unknown"""
+        group = self.task_collection.pop(task_id)
+        if group is None:
+            return "unknown"
+        scores, completion_ids, nodes = group
+        missing = self.num_generations - len(scores)
+        self.straggler_missing[task_id] += missing
         
-        # 如果任务完成，计算并同步优势值
-        if len(self.task_collection[task_status.task_id]) == self.num_generations:
-            completed_task_group = self.task_collection.pop(task_status.task_id)
-            
-            scores = np.array([ts.score for ts in completed_task_group])
-            advantages = (scores - scores.mean()) / (scores.std() + 1e-2)
-            advantages = advantages.tolist()
+        policy = self.straggler_policy
+        if policy == "regenerate" and (step_id != 0 or self.task_dispatch is None):
+            # 多轮任务的后续步骤依赖已清除的历史结果，无法重新生成
+            policy = "pad"
+        if policy == "pad" and len(scores) < 2:
+            policy = "drop"
+        
+        if policy == "pad":
+            padded = np.concatenate([scores, np.full(missing, scores.mean())])
+            advantages = (scores - padded.mean()) / (padded.std() + 1e-2)
+            self.straggler_groups.append((task_id, completion_ids, scores, advantages, nodes))
+        else:
+            self.straggler_groups.append((task_id, completion_ids, scores, None, nodes))
+            if policy == "regenerate" and dispatch:
+                self.task_dispatch.send_pyobj({"requeue": [task_id] * self.num_generations, "priority": self.current_gid})
+                self.task_dispatch.recv()
+        self.straggler_counts[f"{policy}_groups"] += 1
+        self.straggler_counts["missing_completions"] += missing
+        logger.warning(f"Group of task {task_id} timed out with {len(scores)}/{self.num_generations} completions, {policy}")
+        return policy
+
+    def _handle_snapshot(self, path: str):
+        """保存检查点时写入状态快照 (("SNAPSHOT", 检查点的 rollout 目录))，之后的 TaskStatus 写入新的日志段"""
+        if self.rollout_log is None:
+            self._reply_string("Rollout log disabled")
+            return
+        state = {
+            "ack_advantages": self.ack_advantages,
+            "total_ack": self.total_ack,
+            "recv_count": self.recv_count,
+            "send_count": self.send_count,
+            "current_gid": self.current_gid,
+            "sync_steps": self.sync_steps,
+            "sync_pool": self.sync_pool,
+            "sync_count": dict(self.sync_count),
+            "node_pending": dict(self.node_pending),
+            "task_collection": self.task_collection,
+            "straggler_missing": dict(self.straggler_missing),
+        }
+        segment = self.rollout_log.snapshot(os.path.join(path, "global.pkl"), state)
+        logger.info(f"Snapshot global state to {path}: GID {self.current_gid}, {len(self.sync_pool)} groups in SyncPool, "
+                    f"{len(self.task_collection)} open groups, log segment {segment}")
+        self._reply_string("Snapshot saved")
+
+    def _restore(self):
+        """从检查点快照恢复状态，并重放快照之后记录的 TaskStatus"""
+        snapshot = load_snapshot(os.path.join(self.resume_dir, "global.pkl"))
+        if snapshot is None:
+            logger.warning(f"No global rollout snapshot in {self.resume_dir}, start from scratch")
+            return
+        state = snapshot["state"]
+        self.ack_advantages = state["ack_advantages"]
+        self.total_ack = state["total_ack"]
+        self.recv_count = state["recv_count"]
+        self.send_count = state["send_count"]
+        self.current_gid = state["current_gid"]
+        self.sync_steps = state["sync_steps"]
+        self.sync_pool = state["sync_pool"]
+        self.sync_count = defaultdict(int, state["sync_count"])
+        self.node_pending = defaultdict(list, state.get("node_pending", {}))
+        self.task_collection = state["task_collection"]
+        self.straggler_missing = defaultdict(int, state.get("straggler_missing", {}))
+        # 单调时钟在进程间不可比，从恢复时重新计时
+        self.task_collection.first_arrival[:] = time.monotonic()
+        
+        replayed = 0
+        if self.rollout_log is not None:
+            for kind, payload in self.rollout_log.replay(snapshot["segment"]):
+                if kind == "status":
+                    for task_status in payload:
+                        self._collect_task_status(task_status)
+                    replayed += len(payload)
+                elif kind == "straggler":
+                    # 超时任务在崩溃前已重新分发过
+                    for task_id, step_id in payload.tasks.items():
+                        self._resolve_straggler(task_id, step_id, dispatch=False)
+            # 完成顺序不变，重放后分配的 gid 与崩溃前一致
+            self._publish_completed_groups()
+        self.republish_nodes = {node for node, gids in self.node_pending.items() if gids}
+        self._republish_pending()
+        logger.info(f"Restore global state from {self.resume_dir}: GID {self.current_gid}, "
+                    f"{len(self.sync_pool)} groups in SyncPool, {replayed} completions replayed, "
+                    f"re-signal nodes {sorted(self.republish_nodes)}")
+
+    def _collect_task_status(self, task_status: TaskStatus):
+        """记录任务状态"""
+        self.recv_count += 1
+        task_id = task_status.task_id
+        if self.straggler_missing.get(task_id, 0) > 0 and task_id not in self.task_collection.slots:
+            # 任务组已按超时处理，迟到的结果直接丢弃
+            self.straggler_missing[task_id] -= 1
+            if self.straggler_missing[task_id] == 0:
+                del self.straggler_missing[task_id]
+            self.straggler_counts["late_completions"] += 1
+            self.straggler_groups.append((
+                task_id,
+                np.frombuffer(task_status.completion_id.bytes, dtype=np.uint8)[None],
+                np.array([task_status.score]),
+                None,
+                -1 if task_status.node < 0 else 1 << task_status.node,
+            ))
+            return
+        self.task_collection.add(task_status)
+
+    def _publish_completed_groups(self):
+        """对所有已完成的任务组向量化计算优势值，放入同步池，只向缓存了这些任务组结果的节点各发送一次同步信号"""
+        if not self.task_collection.completed and not self.straggler_groups:
+            return
+        first_gid = self.current_gid
+        group_nodes = []
+        if self.task_collection.completed:
+            task_ids, scores, completion_ids, first_arrival, nodes = self.task_collection.pop_completed()
+            self.group_latencies.extend((time.monotonic() - first_arrival).tolist())
             
-            # 更新任务状态中的优势值
-            for status, adv in zip(completed_task_group, advantages):
-                status.advantage = adv
+            means = scores.mean(axis=1, keepdims=True)
+            advantages = (scores - means) / (scores.std(axis=1, keepdims=True) + 1e-2)
+            # 分数过高或优势值相同的任务组将被节点丢弃
+            saturated = means[:, 0] > DEFAULT_THRESHOLD
+            dropped = saturated | np.all(advantages == advantages[:, :1], axis=1)
+            self._count_wasted(task_ids, means[:, 0], saturated, dropped, scores.shape[1])
             
-            # 将处理后的任务组放入同步池
-            self.sync_pool[self.current_gid] = completed_task_group
+            for i, task_id in enumerate(task_ids):
+                self.sync_pool[self.current_gid] = (task_id, completion_ids[i], scores[i], advantages[i], nodes[i])
+                group_nodes.append(nodes[i])
+                if dropped[i]:
+                    logger.debug(f"Group {self.current_gid} tasks likely dropped due to high score or uniform advantage.")
+                else:
+                    logger.debug(f"Group {self.current_gid} advantages calculated and ready for sync.")
+                self.current_gid += 1
             
-            # 发送同步优势信号
-            with self.sync_lock:
+            # 更新发送计数器
+            self.send_count += int((~dropped).sum()) * self.num_generations * self.tp_size
+        
+        # 超时的任务组只计入实际用于训练的结果，被丢弃的结果不影响计数
+        for task_id, completion_ids, scores, advantages, nodes in self.straggler_groups:
+            self.sync_pool[self.current_gid] = (task_id, completion_ids, scores, advantages, nodes)
+            group_nodes.append(nodes)
+            if advantages is not None and not (scores.mean() > DEFAULT_THRESHOLD or np.all(advantages == advantages[0])):
+                self.send_count += len(scores) * self.tp_size
+            self.current_gid += 1
+        self.straggler_groups = []
+        self._report_group_outcomes()
+        
+        # 每个节点只收到一次信号，并一次取回所有通知它的任务组
+        notified = set()
+        for gid, nodes in enumerate(group_nodes, start=first_gid):
+            targets = self._target_nodes(nodes)
+            self.sync_count[gid] = len(targets)
+            for node in targets:
+                self.node_pending[node].append(gid)
+            notified.update(targets)
+        self.sync_stats["published"] += len(group_nodes)
+        self.sync_stats["signals"] += len(notified)
+        with self.sync_lock:
+            for node in notified:
                 self.sync_sender.send_multipart([
-                    b"SYNC_ADVANTAGES",
-                    pickle.dumps(self.current_gid)
+                    f"SYNC_ADVANTAGES/{node}/".encode(),
+                    pickle.dumps(len(self.node_pending[node]))
                 ])
-            
-            gid_to_sync = self.current_gid
-            self.current_gid += 1
-            
-            # 更新发送计数器
-            self.send_count += self.num_generations * self.tp_size
-            if scores.mean() > DEFAULT_THRESHOLD or len(set(advantages)) == 1:
-                # 这些任务将被丢弃，减少发送计数
-                self.send_count -= self.num_generations * self.tp_size
-                logger.debug(f"Group {gid_to_sync} tasks likely dropped due to high score or uniform advantage.")
-            else:
-                logger.debug(f"Group {gid_to_sync} advantages calculated and ready for sync.")
 
 
+    def _count_wasted(self, task_ids, means, saturated, dropped, group_size: int):
+        """统计被丢弃的任务组浪费的生成，并记录任务组结果"""
+        uniform = dropped & ~saturated
+        self.wasted_counts["groups"] += len(task_ids)
+        self.wasted_counts["completions"] += len(task_ids) * group_size
+        self.wasted_counts["saturated_groups"] += int(saturated.sum())
+        self.wasted_counts["saturated_completions"] += int(saturated.sum()) * group_size
+        self.wasted_counts["uniform_groups"] += int(uniform.sum())
+        self.wasted_counts["uniform_completions"] += int(uniform.sum()) * group_size
+        if self.report_outcomes:
+            self.group_outcomes.extend(zip(
+                (int(t) for t in task_ids), means.tolist(), dropped.tolist()
+            ))
+
+    def _report_group_outcomes(self):
+        """攒批后把任务组结果发送给任务分发进程，避免每次发布都等待一次往返"""
+        if not self.group_outcomes or self.task_dispatch is None:
+            return
+        if (len(self.group_outcomes) < int(os.environ.get("OUTCOME_REPORT_BATCH", "64"))
+                and time.monotonic() - self.last_outcome_report < float(os.environ.get("OUTCOME_REPORT_INTERVAL", "5"))):
+            return
+        self.task_dispatch.send_pyobj({"outcomes": self.group_outcomes})
+        self.task_dispatch.recv()
+        self.group_outcomes = []
+        self.last_outcome_report = time.monotonic()
+
     def _run_main_loop(self):
         """主事件循环，接收消息并分发给相应的处理函数"""
         while True:
-            # 接收消息
-            message: Any = self.task_collect.recv_pyobj()
+            # 接收消息：[身份, (空帧,) 负载]
+            frames = self.task_collect.recv_multipart()
+            self._envelope = frames[:-1]
+            try:
+                message: Any = pickle.loads(frames[-1])
+            except Exception as e:
+                logger.error(f"Received undecodable message: {e}")
+                self._reply_string("Error: Undecodable message")
+                continue
             
             # 根据消息类型调用不同的处理函数
             if isinstance(message, int):
@@ -227,23 +631,68 @@ class GlobalSyncManager:
                 self._handle_queue_update(message)
             elif isinstance(message, TaskStatus):
                 self._handle_task_status(message)
+            elif isinstance(message, list) and all(isinstance(m, TaskStatus) for m in message):
+                self._handle_task_status_batch(message)
+            elif isinstance(message, StragglerReport):
+                self._handle_straggler_report(message)
+            elif isinstance(message, tuple) and message[0] == "SNAPSHOT":
+                self._handle_snapshot(message[1])
+            elif isinstance(message, tuple) and message[0] == "STATS":
+                self._reply_pyobj({"sync": dict(self.sync_stats), "wasted": dict(self.wasted_counts),
+                                   "stragglers": dict(self.straggler_counts)})
             elif isinstance(message, str):
                 # 处理字符串消息（如果需要）
                 logger.warning(f"Received unexpected string message: {message}")
                 # 可能需要发送一个响应，即使是错误响应
                 try:
-                    self.task_collect.send_string("Error: Unexpected string message")
+                    self._reply_string("Error: Unexpected string message")
                 except zmq.ZMQError as e:
                     logger.error(f"Error sending reply for string message: {e}")
-                # raise NotImplementedError(f"Received string: {message}") # 或者记录错误并继续
             else:
                 # 处理未知类型的消息
                 logger.error(f"Received unknown message type: {type(message)}")
                 try:
-                    self.task_collect.send_string("Error: Unknown message type")
+                    self._reply_string("Error: Unknown message type")
                 except zmq.ZMQError as e:
                     logger.error(f"Error sending reply for unknown message type: {e}")
 
+
+class AsyncStatusSender:
+    """通过 DEALER 套接字流水线发送 TaskStatus（可批量），确认异步接收。
+    
+    最多允许 `max_inflight` 条消息未确认，超过时阻塞等待确认，实现背压。
+    只能在单个线程中使用。
+    """
+    
+    def __init__(self, zmqctx: zmq.Context, address: str, max_inflight: int = 64):
+        self.socket = zmqctx.socket(zmq.DEALER)
+        transport.connect(self.socket, address)
+        self.max_inflight = max_inflight
+        self.inflight = 0
+    
+    def send(self, statuses):
+        """发送单个 TaskStatus 或 TaskStatus 列表"""
+        while self.inflight >= self.max_inflight:
+            self._recv_ack()
+        # 与 REQ 一致的空分隔帧，服务端统一按 [身份, 空帧, 负载] 处理
+        self.socket.send_multipart([b"", pickle.dumps(statuses)])
+        self.inflight += 1
+        self.poll_acks()
+    
+    def _recv_ack(self):
+        self.socket.recv_multipart()
+        self.inflight -= 1
+    
+    def poll_acks(self):
+        """非阻塞地接收所有已到达的确认"""
+        while self.inflight > 0 and self.socket.poll(0):
+            self._recv_ack()
+    
+    def flush(self):
+        """等待所有已发送消息的确认"""
+        while self.inflight > 0:
+            self._recv_ack()
+
 class LocalBalanceManager:
     """平衡本地机器创建的数据和任务，并与全局同步。"""
     
@@ -262,7 +711,24 @@ class LocalBalanceManager:
         max_prompt_length: int,
         steal_threshold: int = 16,
         tp_size: int = 1,
-        timeout: int = 3600
+        timeout: int = 3600,
+        shm_ring_slots: int = 0,
+        shm_slot_mb: int = 256,
+        report_batch_size: int = 256,
+        report_flush_interval: float = 0.05,
+        rollout_log_dir: Optional[str] = None,
+        resume_dir: Optional[str] = None,
+        steal_policy: str = "p2c",
+        steal_timeout: float = 30,
+        stage_trace_file: Optional[str] = None,
+        stage_metrics_port: int = 0,
+        reprocess_workers: int = 0,
+        image_cache_dir: Optional[str] = None,
+        cache_memory_mb: int = 0,
+        cache_disk_mb: int = 0,
+        cache_spill_dir: Optional[str] = None,
+        node_rank: int = 0,
+        max_staleness: int = 0
     ):
         """初始化本地平衡管理器。
         
@@ -280,7 +746,25 @@ class LocalBalanceManager:
             max_prompt_length: 最大提示长度
             steal_threshold: 窃取阈值
             tp_size: 张量并行大小
-            timeout: 超时时间
+            timeout: 缓存的生成结果超过该时间（秒）未同步时上报全局按超时策略处理，超过两倍时间仍未同步则直接清除
+            shm_ring_slots: 共享内存环的槽位数，0 表示不使用共享内存，数据块通过 ZMQ 发送
+            shm_slot_mb: 每个槽位的大小 (MB)，放不下的数据块退回 ZMQ 发送
+            report_batch_size: 累积多少个 TaskStatus 后批量上报全局
+            report_flush_interval: 未满一批时最长等待多少秒上报
+            rollout_log_dir: 追加写入收到的生成结果的日志目录，None 表示不持久化
+            resume_dir: 恢复训练时检查点中的 rollout 目录，从其中的快照和之后的日志恢复缓存
+            steal_policy: 窃取策略，p2c 在两个随机的候选节点中选择队列更长的一个，random 随机选择；均按传输代价估计决定是否窃取
+            steal_timeout: 窃取请求的超时时间（秒），超时后重建到该节点的连接
+            stage_trace_file: 各阶段耗时直方图的 JSON lines 导出文件，文件名后追加节点名，None 表示不导出
+            stage_metrics_port: Prometheus 指标端口 (/metrics)，0 表示不启动
+            reprocess_workers: 处理数据块的子进程数，0 表示在本进程的 reprocess 线程中处理
+            image_cache_dir: 本节点图像缓存目录，训练进程发送精简的生成结果（图像以哈希引用）时，
+                处理数据块前从该目录还原图像；None 表示生成结果携带完整数据
+            cache_memory_mb: 等待同步的生成结果在内存中最多占用的大小 (MB)，超出后最早的结果写入 cache_spill_dir，0 表示不限制
+            cache_disk_mb: 写入磁盘的生成结果最多占用的大小 (MB)，超出后丢弃最早的结果，0 表示不限制
+            cache_spill_dir: 生成结果的溢出目录，None 表示系统临时目录下按本地收集地址命名的目录
+            node_rank: 节点序号，写入缓存的 TaskStatus，全局只通知缓存了任务组结果的节点
+            max_staleness: 生成结果的模型版本落后训练进程当前版本超过该步数时丢弃（处理前和发送前各检查一次），0 表示不过滤
         """
         self.local_collect_address = local_collect_address
         self.local_provider_address = local_provider_address
@@ -296,6 +780,30 @@ class LocalBalanceManager:
         self.steal_threshold = steal_threshold
         self.tp_size = tp_size
         self.timeout = timeout
+        self.shm_ring_slots = shm_ring_slots
+        self.shm_slot_mb = shm_slot_mb
+        self.report_batch_size = report_batch_size
+        self.report_flush_interval = report_flush_interval
+        self.resume_dir = resume_dir
+        self.rollout_name = f"node-{socket.gethostname()}"
+        self.rollout_log = RolloutLog(rollout_log_dir, self.rollout_name) if rollout_log_dir else None
+        self.steal_policy = build_steal_policy(steal_policy, steal_threshold)
+        self.steal_timeout = steal_timeout
+        # 到其他节点的持久窃取连接：地址 -> REQ 套接字（仅窃取线程使用）
+        self.steal_peers = {}
+        # provider 从就绪队列取出的数据块数，用于估计本地消耗速度
+        self.served_chunks = 0
+        # 各阶段耗时统计
+        self.stage_trace_file = stage_trace_file
+        self.stage_metrics_port = stage_metrics_port
+        self.tracer = StageTracer(self.rollout_name)
+        self.reprocess_workers = reprocess_workers
+        self.node_rank = node_rank
+        self.max_staleness = max_staleness
+        # 训练进程的当前模型版本，取收到的生成结果和数据块请求中的最大值
+        self.policy_version = -1
+        self.image_cache_dir = image_cache_dir
+        self.image_cache = ImageCache(image_cache_dir) if image_cache_dir else None
         
         # 初始化ZMQ上下文
         self.zmqctx = zmq.Context(16)
@@ -304,67 +812,86 @@ class LocalBalanceManager:
         self._init_sockets()
         
         # 初始化缓存和队列
-        self.cached_tasks = {}
+        if cache_spill_dir is None:
+            cache_spill_dir = os.path.join(tempfile.gettempdir(), "arl_spill" + re.sub(r"[^0-9A-Za-z]+", "_", local_collect_address))
+        self.cached_tasks = SpillingTaskStore(cache_memory_mb * 2**20, cache_spill_dir, cache_disk_mb * 2**20)
         self.global_ready_queue_length = {self.steal_addr: 0}
         self.valid_tasks = queue.Queue(max_cache_size // 4 * 3)
         self.ready_queue = queue.Queue(max_cache_size // 4)
         self.local_gid = 0
+        # 超时统计：reported 上报的任务组，dropped 被全局丢弃的结果，evicted 直接清除的结果
+        self.straggler_counts = Counter()
+        # 生成信用：已授予训练进程、尚未收到的生成结果数；训练进程使用信用流控后不再以暂停接收限流
+        self.credit_outstanding = 0
+        self.credit_flow = False
+        self.credit_counts = Counter()
         
         # 加载处理器
-        self.processor = AutoProcessor.from_pretrained(processing_class_name_or_path, trust_remote_code=True)
+        self.processor = self._load_processor()
+    
+    def _load_processor(self):
+        return AutoProcessor.from_pretrained(self.processing_class_name_or_path, trust_remote_code=True)
+    
+    def _process_chunk(self, inputs: list) -> dict:
+        """把 chunk_size 个任务的数据处理成一个训练数据块"""
+        return _process_inputs(materialize_inputs(inputs, self.image_cache), self.processor, self.max_prompt_length)
+    
+    def _decode_completion(self, data: dict) -> str:
+        """生成结果的文本，精简的生成结果只携带 token id，需要时再解码"""
+        if "completion" in data:
+            return data["completion"]
+        return self.processor.tokenizer.decode(data["completion_ids"], skip_special_tokens=True)
     
     def _init_sockets(self):
         """初始化所有ZMQ套接字和网络连接"""
         # 队列同步器
         self.queue_syncer = self.zmqctx.socket(zmq.REQ)
-        self.queue_syncer.connect(self.global_result_collect_address)
+        transport.connect(self.queue_syncer, self.global_result_collect_address)
         
-        # 获取本机IP地址
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        parsed = urlparse(self.global_result_collect_address)
-        try:
-            s.connect((parsed.hostname, parsed.port))
-            node_ip = s.getsockname()[0]
-        finally:
-            s.close()
+        # 获取本机IP地址（全局地址为 ipc 时为单节点，使用回环地址）
+        node_ip = transport.local_ip(self.global_result_collect_address)
         
         # 设置窃取地址和套接字
         self.steal_addr = f"tcp://{node_ip}:{self.local_steal_port}"
         self.steal_recv = self.zmqctx.socket(zmq.REP)
-        self.steal_recv.bind(self.steal_addr)
+        transport.bind(self.steal_recv, self.steal_addr)
         logger.info(f"Listen for stealing at {self.steal_addr}")
         
         # 同步信号订阅者
         self.sync_signal = self.zmqctx.socket(zmq.SUB)
-        self.sync_signal.setsockopt(zmq.SUBSCRIBE, b"SYNC_ADVANTAGES")
+        # 只订阅发给本节点的同步信号（以 / 结尾，避免节点 1 匹配到节点 12）
+        self.sync_signal.setsockopt(zmq.SUBSCRIBE, f"SYNC_ADVANTAGES/{self.node_rank}/".encode())
         self._set_tcp_keepalive(self.sync_signal)
-        self.sync_signal.connect(self.global_sync_address)
+        transport.connect(self.sync_signal, self.global_sync_address)
         
         # 队列同步订阅者
         self.sync_queue = self.zmqctx.socket(zmq.SUB)
         self.sync_queue.setsockopt(zmq.SUBSCRIBE, b"SYNC_NODE_QUEUE_LENGTHS")
         self._set_tcp_keepalive(self.sync_queue)
-        self.sync_queue.connect(self.global_sync_address)
+        transport.connect(self.sync_queue, self.global_sync_address)
         
-        # 结果发送者
-        self.result_sender = self.zmqctx.socket(zmq.REQ)
-        self.result_sender.connect(self.global_result_collect_address)
+        # 超时任务上报者（仅监控线程使用）
+        self.straggler_reporter = self.zmqctx.socket(zmq.REQ)
+        transport.connect(self.straggler_reporter, self.global_result_collect_address)
+        
+        # 结果发送者（流水线发送，异步确认）
+        self.result_sender = AsyncStatusSender(self.zmqctx, self.global_result_collect_address)
         
         # 任务分发发送者
         self.task_dispatch_sender = self.zmqctx.socket(zmq.REQ)
-        self.task_dispatch_sender.connect(self.global_data_dispatch_address)
+        transport.connect(self.task_dispatch_sender, self.global_data_dispatch_address)
         
         # 优势同步器
         self.advantage_syncer = self.zmqctx.socket(zmq.REQ)
-        self.advantage_syncer.connect(self.global_result_collect_address)
+        transport.connect(self.advantage_syncer, self.global_result_collect_address)
         
         # 平衡收集器
         self.balance_collect = self.zmqctx.socket(zmq.REP)
-        self.balance_collect.bind(self.local_collect_address)
+        transport.bind(self.balance_collect, self.local_collect_address)
         
         # 平衡提供者
         self.balance_provider = self.zmqctx.socket(zmq.REP)
-        self.balance_provider.bind(self.local_provider_address)
+        transport.bind(self.balance_provider, self.local_provider_address)
     
     def _set_tcp_keepalive(self, socket):
         """设置TCP保持连接选项"""
@@ -373,24 +900,123 @@ class LocalBalanceManager:
         socket.setsockopt(zmq.TCP_KEEPALIVE_CNT, 5)
         socket.setsockopt(zmq.TCP_KEEPALIVE_INTVL, 10)
     
+    def _put_chunk(self, collected: list, chunk_data: dict, start: float, end: float):
+        stage_times = []
+        for tac in collected:
+            mark(tac.status.stage_times, "reprocess_start", start)
+            mark(tac.status.stage_times, "reprocessed", end)
+            stage_times.append(tac.status.stage_times)
+        # 随数据块一起移动（包括被窃取时），provider 发送前取出
+        chunk_data["stage_times"] = stage_times
+        self.ready_queue.put(chunk_data)
+    
+    def _staleness(self, version: int) -> int:
+        """模型版本 `version` 落后训练进程当前版本的步数，版本未知时为 0"""
+        if version < 0 or self.policy_version < 0:
+            return 0
+        return self.policy_version - version
+    
+    def _collect_tasks(self) -> list:
+        """从 valid_tasks 取出 chunk_size 个任务，丢弃过旧的生成结果"""
+        collected = []
+        while len(collected) < self.chunk_size:
+            tac = self.valid_tasks.get()
+            if self.max_staleness > 0 and self._staleness(tac.status.policy_version) > self.max_staleness:
+                self.straggler_counts["stale"] += 1
+                self.tracer.count("stale_completions")
+                continue
+            collected.append(tac)
+        return collected
+    
     def reprocess(self):
-        """处理任务并生成处理后的数据块"""
+        """处理任务并生成处理后的数据块，每个数据块包含 chunk_size 个任务"""
+        if self.reprocess_workers > 0:
+            self._reprocess_parallel()
+            return
         while True:
-            collected = [self.valid_tasks.get().data for _ in range(self.chunk_size)]
-            chunk_data = _process_inputs(collected, self.processor, self.max_prompt_length)
-            self.ready_queue.put(chunk_data)
+            collected = self._collect_tasks()
+            start = time.time()
+            chunk_data = self._process_chunk([tac.data for tac in collected])
+            self._put_chunk(collected, chunk_data, start, time.time())
+    
+    def _reprocess_parallel(self):
+        """按 chunk_size 分组后交给子进程处理，收集线程把完成的数据块放入就绪队列（完成顺序可能与提交顺序不同）"""
+        pool = ReprocessPool(self.processing_class_name_or_path, self.max_prompt_length, self.reprocess_workers,
+                             image_cache_dir=self.image_cache_dir)
+        atexit.register(pool.close)
+        logger.info(f"Reprocess chunks with {self.reprocess_workers} worker processes")
+        submitted = {}
+        
+        def collect():
+            while True:
+                seq, chunk_data, start, end, error = pool.get()
+                collected = submitted.pop(seq, None)
+                if collected is None:
+                    # 已按工作进程退出报告丢失的数据块
+                    continue
+                if error is not None:
+                    # 处理出错或工作进程退出（已重启），这些生成结果无法再用于训练
+                    self.tracer.count("reprocess_failed_chunks")
+                    self.tracer.count("reprocess_failed_completions", len(collected))
+                    logger.error(f"Reprocess of chunk {seq} failed, drop {len(collected)} completions: {error}")
+                    continue
+                self._put_chunk(collected, chunk_data, start, end)
+        
+        threading.Thread(target=collect, daemon=True).start()
+        seq = 0
+        while True:
+            collected = self._collect_tasks()
+            submitted[seq] = collected
+            pool.submit(seq, [tac.data for tac in collected])
+            seq += 1
     
     def provider(self):
-        """为工作进程提供数据"""
+        """为工作进程提供数据
+
+        请求: (tp_gid, rank, recv_idx[, released_slots[, policy_version]])
+        回复: [b"SHM", 控制消息] 数据块已写入共享内存环的槽位；[b"RAW", *frames] 数据块直接随消息发送
+        """
         cached_group_data = defaultdict(dict)
         visited_counts = defaultdict(dict)
+        ring = None
+        if self.shm_ring_slots > 0:
+            ring_name = "arl_ring" + re.sub(r"[^0-9A-Za-z]+", "_", self.local_provider_address)
+            ring = ShmRing(ring_name, self.shm_ring_slots, self.shm_slot_mb * 2**20, create=True)
+            atexit.register(ring.close)
+            logger.info(f"Serve chunks through /dev/shm/{ring_name} with {self.shm_ring_slots} x {self.shm_slot_mb} MB slots")
         
         while True:
-            tp_gid, rank, recv_idx = self.balance_provider.recv_pyobj()
+            req = self.balance_provider.recv_pyobj()
+            tp_gid, rank, recv_idx = req[:3]
+            if ring is not None and len(req) > 3:
+                for slot in req[3]:
+                    ring.release(slot)
+            if len(req) > 4:
+                self.policy_version = max(self.policy_version, req[4])
+            
             if cached_group_data[tp_gid].get(recv_idx, None) is None:
-                # 该组的新数据
+                # 该组的新数据，只序列化一次
                 chunk_data = self.ready_queue.get()
-                cached_group_data[tp_gid][recv_idx] = pickle.dumps(chunk_data)
+                while self.max_staleness > 0 and self._chunk_staleness(chunk_data) > self.max_staleness:
+                    # 在就绪队列中等待过久的数据块（也可能是窃取来的）
+                    self.straggler_counts["stale"] += len(chunk_data["advantages"])
+                    self.tracer.count("stale_completions", len(chunk_data["advantages"]))
+                    chunk_data = self.ready_queue.get()
+                self.served_chunks += 1
+                stage_times = chunk_data.pop("stage_times", [])
+                now = time.time()
+                for st in stage_times:
+                    mark(st, "served", now)
+                self.tracer.record_many(stage_times)
+                frames = serialize_to_frames(chunk_data)
+                slot = ring.acquire(self.tp_size) if ring is not None and ring.fits(frames) else None
+                if slot is not None:
+                    # 写入共享内存一次，同组的每个 rank 原地读取
+                    ring.write(slot, frames)
+                    cached_group_data[tp_gid][recv_idx] = [b"SHM", ring.control_message(slot)]
+                else:
+                    # 张量以原始缓冲区的形式零拷贝发送给同组的每个 rank
+                    cached_group_data[tp_gid][recv_idx] = [b"RAW", *frames]
                 visited_counts[tp_gid][recv_idx] = 0
             
             # 重用数据
@@ -403,7 +1029,13 @@ class LocalBalanceManager:
                 del cached_group_data[tp_gid][recv_idx]
                 del visited_counts[tp_gid][recv_idx]
             
-            self.balance_provider.send(chunk_data)
+            self.balance_provider.send_multipart(chunk_data, copy=False)
+    
+    def _chunk_staleness(self, chunk_data: dict) -> int:
+        versions = chunk_data.get("policy_versions")
+        if versions is None or len(versions) == 0:
+            return 0
+        return self._staleness(int(versions.min()))
     
     def reporter(self):
         """报告队列状态"""
@@ -422,7 +1054,7 @@ class LocalBalanceManager:
             nums_to_offer = max(int(min((self.ready_queue.qsize() - mean_queue_length) / 2, nums_to_steal)), 0)
             
             if nums_to_offer <= 0:
-                self.steal_recv.send_pyobj(None)
+                send_tensors(self.steal_recv, None)
             else:
                 chunk_datas = []
                 try:
@@ -430,10 +1062,35 @@ class LocalBalanceManager:
                         chunk_datas.append(self.ready_queue.get_nowait())
                 except:
                     pass
-                self.steal_recv.send_pyobj(chunk_datas)
+                # 与 provider 相同的线格式，张量零拷贝发送
+                send_tensors(self.steal_recv, chunk_datas)
+    
+    def _steal_from(self, addr: str, nums_to_steal: int):
+        """通过到 `addr` 的持久连接窃取数据块，超时返回 None"""
+        steal_req = self.steal_peers.get(addr)
+        if steal_req is None:
+            steal_req = self.zmqctx.socket(zmq.REQ)
+            transport.connect(steal_req, addr)
+            self.steal_peers[addr] = steal_req
+        
+        start = time.perf_counter()
+        steal_req.send_pyobj(nums_to_steal)
+        if not steal_req.poll(int(self.steal_timeout * 1000)):
+            # REQ 套接字在未收到回复时无法继续使用，关闭后下次重建
+            logger.warning(f"Steal from {addr} timed out after {self.steal_timeout}s")
+            steal_req.close(linger=0)
+            del self.steal_peers[addr]
+            return None
+        frames = steal_req.recv_multipart(copy=False)
+        elapsed = time.perf_counter() - start
+        stealed = deserialize_from_frames(frames)
+        if stealed and self.steal_policy.cost_model is not None:
+            self.steal_policy.cost_model.observe_transfer(len(stealed), sum(len(f) for f in frames), elapsed)
+        return stealed
     
     def work_stealing(self):
         """从其他节点窃取任务"""
+        last_served, last_time = self.served_chunks, time.monotonic()
         while True:
             parts = self.sync_queue.recv_multipart()
             if len(parts) != 2:
@@ -442,38 +1099,24 @@ class LocalBalanceManager:
             
             _, d = parts
             self.global_ready_queue_length.update(pickle.loads(d))
-            if len(self.global_ready_queue_length) == 1:
-                continue
             
-            current_q = self.ready_queue.qsize()
-            mean_queue_length = sum(self.global_ready_queue_length.values()) / len(self.global_ready_queue_length)
+            # 更新本地消耗速度
+            now = time.monotonic()
+            if self.steal_policy.cost_model is not None:
+                self.steal_policy.cost_model.observe_consumption(self.served_chunks - last_served, now - last_time)
+            last_served, last_time = self.served_chunks, now
             
-            starving = mean_queue_length - current_q
-            if starving > self.steal_threshold:
-                nums_to_steal = int(starving / 2)
-            else:
-                nums_to_steal = 0
+            plan = self.steal_policy.plan(self.steal_addr, self.global_ready_queue_length, self.ready_queue.qsize())
+            if plan is None:
+                continue
             
-            if nums_to_steal > 0:
-                # 选择目标
-                items = [(addr, qlen) for addr, qlen in self.global_ready_queue_length.items() 
-                         if addr != self.steal_addr and qlen > mean_queue_length]
-                if not items:
-                    continue
-                
-                addr, remote_q = random.choice(items)
-                # 随机选择
-                nums_to_steal = min(nums_to_steal, int((remote_q - mean_queue_length) / 2))
-                
-                # 进行窃取
-                with self.zmqctx.socket(zmq.REQ) as steal_req:
-                    steal_req.connect(addr)
-                    steal_req.send_pyobj(nums_to_steal)
-                    stealed = steal_req.recv_pyobj()
-                
-                if stealed:
-                    for chunk_data in stealed:
-                        self.ready_queue.put(chunk_data)
+            # 进行窃取
+            addr, nums_to_steal = plan
+            stealed = self._steal_from(addr, nums_to_steal)
+            if stealed:
+                logger.debug(f"Stole {len(stealed)} chunks from {addr}")
+                for chunk_data in stealed:
+                    self.ready_queue.put(chunk_data)
     
     def sync_handler(self):
         """处理同步信号并更新任务状态"""
@@ -484,18 +1127,27 @@ class LocalBalanceManager:
                 continue
             
             topic, d = parts
-            latest_gid = pickle.loads(d)
+            # 只有缓存了任务组结果的节点会收到通知，一次取回所有通知本节点的任务组
+            self.advantage_syncer.send_pyobj(SyncAdvantagesRequest(self.node_rank))
+            groups = self.advantage_syncer.recv_pyobj()
+            if groups:
+                logger.debug(f"Sync advantages for groups {groups[0][0]} ~ {groups[-1][0]}")
             
-            while self.local_gid <= latest_gid:
-                logger.debug(f"Sync advantages for group {self.local_gid}")
-                self.advantage_syncer.send_pyobj(SyncAdvantagesRequest(self.local_gid))
-                task_status = self.advantage_syncer.recv_pyobj()
-                task_status.sort(key=lambda x: x.advantage, reverse=True)
+            for gid, task_status in groups:
+                self.local_gid = gid
+                if task_status[0].advantage is None:
+                    # 超时被全局丢弃的任务组，直接删除，不读回溢出的 data
+                    dropped = sum(self.cached_tasks.discard(status.completion_id) for status in task_status)
+                    self.straggler_counts["dropped"] += dropped
+                    if dropped:
+                        logger.debug(f"Drop {dropped} timed out tasks in Group {self.local_gid}")
+                    continue
                 
-                next_new_tasks = []
+                task_status.sort(key=lambda x: x.advantage, reverse=True)
+            
                 valid_next_task_completions = []
                 scores = []
-                
+            
                 for status in task_status:
                     scores.append(status.score)
                     if (status.score >= float(os.environ.get("MULTITURN_SAMPLE_THRESHOLD", DEFAULT_THRESHOLD)) and 
@@ -503,15 +1155,24 @@ class LocalBalanceManager:
                         # 考虑将下一轮任务添加到任务队列
                         valid_next_task_completions.append(status.completion_id)
                 
-                # 检查是否可能有进一步的任务
-                for status in task_status:
-                    if status.completion_id in self.cached_tasks:
-                        d = self.cached_tasks[status.completion_id]
-                        if (d.data.get("next_id", None) is not None and 
-                            d.status.completion_id in valid_next_task_completions):
-                            # 考虑将下一轮任务添加到任务队列
-                            next_new_tasks.append(d)
+                scores = np.array(scores)
+                # 得分过高或优势全部相同的任务组不参与训练，直接丢弃
+                drop_group = scores.mean() > DEFAULT_THRESHOLD or len(set(map(lambda x: x.advantage, task_status))) == 1
                 
+                # 每个条目只取出一次：需要 data 的（下一轮任务或参与训练）读回，其余直接删除
+                entries = {}
+                discarded = 0
+                for status in task_status:
+                    if drop_group and status.completion_id not in valid_next_task_completions:
+                        discarded += self.cached_tasks.discard(status.completion_id)
+                    elif (d := self.cached_tasks.pop(status.completion_id, None)) is not None:
+                        entries[status.completion_id] = d
+            
+                # 检查是否可能有进一步的任务
+                next_new_tasks = [entries[completion_id] for completion_id in valid_next_task_completions
+                                  if completion_id in entries and
+                                  entries[completion_id].data.get("next_id", None) is not None]
+            
                 if next_new_tasks:
                     # 发送到全局任务分发循环
                     data = []
@@ -521,14 +1182,14 @@ class LocalBalanceManager:
                             "gid": self.local_gid,
                             "next_id": item.data["next_id"],
                             "completion_id": item.status.completion_id,
-                            "completion": item.data["completion"],
+                            "completion": self._decode_completion(item.data),
                         })
-                    
+                
                     # 计算发送数据的正确长度
                     valid_completions_counts = len(valid_next_task_completions)
                     ratio = len(task_status) // valid_completions_counts
                     data = data * ratio
-                    
+                
                     if (rem := len(task_status) % valid_completions_counts) != 0:
                         # 仅对一个节点附加提醒
                         # 选择包含最小字典顺序UUID的节点并添加提醒
@@ -539,68 +1200,165 @@ class LocalBalanceManager:
                             if item["completion_id"] == small_completion_id:
                                 contains_smallest = True
                                 break
-                        
+                    
                         if contains_smallest:
                             data += data[:1] * rem
-                    
+                
                     self.task_dispatch_sender.send_pyobj(data)
                     self.task_dispatch_sender.recv()
-                
-                scores = np.array(scores)
-                if scores.mean() > DEFAULT_THRESHOLD or len(set(map(lambda x: x.advantage, task_status))) == 1:
+            
+                if drop_group:
                     # 检查缓存的任务是否可以更新并发回进行反向传播
                     # 我们应该直接丢弃任务
-                    drop = []
-                    for status in task_status:
-                        if status.completion_id in self.cached_tasks:
-                            drop.append(self.cached_tasks.pop(status.completion_id))
-                    
-                    if drop:
-                        logger.debug(f"Drop {len(drop)} tasks in Group {self.local_gid}, "
-                                     f"Cache size: {len(self.cached_tasks) + len(drop)} -> {len(self.cached_tasks)}")
-                    del drop
+                    dropped = discarded + len(entries)
+                    self.tracer.count("dropped_completions", dropped)
+                    if dropped:
+                        logger.debug(f"Drop {dropped} tasks in Group {self.local_gid}, "
+                                     f"Cache size: {len(self.cached_tasks) + dropped} -> {len(self.cached_tasks)}")
+                    del entries
                 else:
                     # 有不同的优势
-                    pre_len = len(self.cached_tasks)
+                    pre_len = len(self.cached_tasks) + len(entries)
                     for status in task_status:
-                        if status.completion_id in self.cached_tasks:
-                            self.cached_tasks[status.completion_id].status.advantage = status.advantage
-                            d = self.cached_tasks.pop(status.completion_id)
+                        if (d := entries.get(status.completion_id)) is not None:
+                            d.status.advantage = status.advantage
                             d.data["advantage"] = d.status.advantage
+                            mark(d.status.stage_times, "synced")
                             self.valid_tasks.put(d)
-                            
+                        
                             if d.status.completion_id == task_status[0].completion_id:
                                 # 最佳任务
-                                logger.info("Best Completion (%.2f) : %s", d.status.score, d.data["completion"])
-                    
+                                logger.info("Best Completion (%.2f) : %s", d.status.score, self._decode_completion(d.data))
+                
                     logger.debug(f"Sync {len(task_status)} tasks in Group {self.local_gid}, "
                                  f"Cache size: {pre_len} -> {len(self.cached_tasks)}")
-                
-                self.local_gid += 1
     
     def monitor(self):
-        """检查缓存中是否有超时的任务"""
+        """检查缓存中超时的任务：首次超时上报全局处理所在的任务组，超过两倍超时仍未同步则直接清除"""
         interval = int(os.environ.get("LOCAL_MONITOR_INTERVAL", "300"))
+        reported = set()
         while True:
             time.sleep(interval)
             oldest_task = None
+            stale = {}
+            now = datetime.datetime.now()
             
-            for k, v in list(self.cached_tasks.items()):
-                if oldest_task is None or v.status.created_time < oldest_task.status.created_time:
-                    oldest_task = v
+            # 只检查状态，不读取已写入磁盘的数据
+            for k, status in self.cached_tasks.statuses():
+                if oldest_task is None or status.created_time < oldest_task.created_time:
+                    oldest_task = status
                 
-                if (datetime.datetime.now() - v.status.created_time).total_seconds() > self.timeout:
-                    logger.warning(f"Task {v.status.task_id}, completion {k} is out of time.")
-                    # del self.cached_tasks[k]
+                age = (now - status.created_time).total_seconds()
+                if age <= self.timeout:
+                    continue
+                if k not in reported:
+                    logger.warning(f"Task {status.task_id}, completion {k} is out of time.")
+                    stale[status.task_id] = status.step_id
+                    reported.add(k)
+                elif age > 2 * self.timeout and self.cached_tasks.discard(k):
+                    # 全局未能处理（任务组已完成或已由其他节点上报），直接清除
+                    logger.warning(f"Evict task {status.task_id}, completion {k} after {age:.0f}s.")
+                    self.straggler_counts["evicted"] += 1
+            reported.intersection_update(self.cached_tasks.keys())
+            
+            if stale:
+                self.straggler_reporter.send_pyobj(StragglerReport(stale))
+                actions = self.straggler_reporter.recv_pyobj()
+                self.straggler_counts["reported"] += len(stale)
+                logger.warning(f"Report {len(stale)} timed out groups to global: {dict(Counter(actions.values()))}")
             
             if oldest_task is not None:
                 logger.info(f"[ Local GID: {self.local_gid} | Cached: {len(self.cached_tasks)}, "
                             f"Reprocessing: {self.valid_tasks.qsize()} | Queued: {self.ready_queue.qsize()} ] "
-                            f"The oldest task id {oldest_task.status.task_id}, "
-                            f"create time: {oldest_task.status.created_time}")
+                            f"The oldest task id {oldest_task.task_id}, "
+                            f"create time: {oldest_task.created_time}")
+            if self.cached_tasks.max_bytes > 0:
+                logger.info(f"[ Local Cache ] " +
+                            ", ".join(f"{k}: {v:.1f}" if isinstance(v, float) else f"{k}: {v}"
+                                      for k, v in self.cached_tasks.stats().items()))
+            if (summary := self.tracer.summary()):
+                logger.info(f"[ Local Stages ] {summary}")
+            if self.credit_flow:
+                logger.info(f"[ Local Credits ] outstanding: {self.credit_outstanding}, " +
+                            ", ".join(f"{k}: {v}" for k, v in sorted(self.credit_counts.items())))
+            if self.straggler_counts:
+                logger.info(f"[ Local Stragglers ] " +
+                            ", ".join(f"{k}: {v}" for k, v in sorted(self.straggler_counts.items())))
+            if self.image_cache is not None and self.rollout_log is None:
+                # 缓存中的生成结果最多保留两倍超时时间，之后其图像不会再被使用；
+                # 启用日志时检查点快照仍引用这些图像，图像按内容去重，占用不超过数据集的图像总量
+                removed = self.image_cache.prune(3 * self.timeout)
+                if removed:
+                    logger.info(f"Prune {removed} images from {self.image_cache_dir}")
+    
+    def _grant_credit(self, n: int, force: bool = False) -> int:
+        """为训练进程的下一批生成预留 `n` 个缓存位置，空闲容量不足时拒绝（返回 0），`force` 时超额授予"""
+        self.credit_flow = True
+        free = self.max_cache_size - len(self.cached_tasks) - self.credit_outstanding
+        if free < n and not force:
+            self.credit_counts["denied"] += 1
+            self.tracer.count("credit_denied")
+            return 0
+        self.credit_outstanding += n
+        self.credit_counts["forced" if free < n else "granted"] += 1
+        return n
+    
+    def _consume_credit(self, n: int):
+        """收到的 `n` 个生成结果已进入缓存，释放为其预留的位置（未申请预留的结果不影响计数）"""
+        self.credit_outstanding = max(0, self.credit_outstanding - n)
+    
+    def _snapshot(self, path: str) -> str:
+        """写入缓存、队列和本地 GID 的快照，之后收到的生成结果写入新的日志段"""
+        if self.rollout_log is None:
+            return "Rollout log disabled"
+        with self.valid_tasks.mutex:
+            valid_tasks = list(self.valid_tasks.queue)
+        with self.ready_queue.mutex:
+            ready_chunks = list(self.ready_queue.queue)
+        state = {
+            "valid_tasks": valid_tasks,
+            "ready_chunks": ready_chunks,
+            "local_gid": self.local_gid,
+        }
+        # 缓存的生成结果在状态之后逐条写入，溢出到磁盘的条目逐个读回，不会全部载入内存
+        segment = self.rollout_log.snapshot(os.path.join(path, f"{self.rollout_name}.pkl"), state,
+                                            self.cached_tasks.items())
+        logger.info(f"Snapshot node state to {path}: Local GID {self.local_gid}, Cached {len(self.cached_tasks)}, "
+                    f"Reprocessing {len(valid_tasks)}, Queued {len(ready_chunks)}, log segment {segment}")
+        return "Snapshot saved"
+    
+    def _restore(self):
+        """从检查点快照恢复缓存和队列，并重放快照之后缓存的生成结果（其 TaskStatus 由全局重放，不再上报）"""
+        snapshot = load_snapshot(os.path.join(self.resume_dir, f"{self.rollout_name}.pkl"))
+        if snapshot is None:
+            logger.warning(f"No rollout snapshot of {self.rollout_name} in {self.resume_dir}, start from scratch")
+            return
+        state = snapshot["state"]
+        # 逐条恢复缓存，超出内存预算的条目随即溢出；旧快照把缓存整体保存在状态中
+        self.cached_tasks.update(state.get("cached_tasks", {}))
+        for completion_id, tac in load_snapshot_entries(os.path.join(self.resume_dir, f"{self.rollout_name}.pkl")):
+            self.cached_tasks[completion_id] = tac
+        self.local_gid = state["local_gid"]
+        # 线程尚未启动，直接填充队列
+        self.valid_tasks.queue.extend(state["valid_tasks"])
+        self.ready_queue.queue.extend(state["ready_chunks"])
+        
+        replayed = 0
+        if self.rollout_log is not None:
+            for kind, payload in self.rollout_log.replay(snapshot["segment"]):
+                if kind != "cache":
+                    continue
+                for tac in payload:
+                    self.cached_tasks[tac.status.completion_id] = tac
+                replayed += len(payload)
+        logger.info(f"Restore node state from {self.resume_dir}: Local GID {self.local_gid}, "
+                    f"Cached {len(self.cached_tasks)}, {replayed} completions replayed")
     
     def start(self):
         """启动所有线程并运行主循环"""
+        if self.resume_dir is not None:
+            self._restore()
+        
         # 启动所有线程
         threads = [
             threading.Thread(target=self.reprocess, daemon=True),
@@ -615,17 +1373,70 @@ class LocalBalanceManager:
         for thread in threads:
             thread.start()
         
+        # 各阶段耗时导出
+        gauges = lambda: {
+            "cached": len(self.cached_tasks),
+            "cached_spilled": self.cached_tasks.stats()["spilled_now"],
+            "credit_outstanding": self.credit_outstanding,
+            "valid_tasks": self.valid_tasks.qsize(),
+            "ready_queue": self.ready_queue.qsize(),
+        }
+        if self.stage_trace_file:
+            path = f"{self.stage_trace_file}.{self.rollout_name}"
+            threading.Thread(target=export_jsonl, args=(self.tracer, path, float(os.environ.get("STAGE_EXPORT_INTERVAL", "30")), gauges), daemon=True).start()
+        if self.stage_metrics_port:
+            serve_prometheus(self.tracer, self.stage_metrics_port, gauges)
+            logger.info(f"Serve rollout stage metrics at :{self.stage_metrics_port}/metrics")
+        
         # 主循环
+        pending_status = []
+        first_pending_time = None
         while True:
-            tac: TaskAndContent = self.balance_collect.recv_pyobj()
-            self.cached_tasks[tac.status.completion_id] = tac
-            self.balance_collect.send_string("Received")
+            # 有待上报的状态时，最多等待到刷新时间点
+            timeout = None
+            if pending_status:
+                timeout = max(0, int((first_pending_time + self.report_flush_interval - time.monotonic()) * 1000))
+            if self.balance_collect.poll(timeout):
+                # 训练进程一次发送一整批生成结果 (list[TaskAndContent])，也兼容单个 TaskAndContent
+                received = self.balance_collect.recv_pyobj()
+                if isinstance(received, tuple) and received[0] == "SNAPSHOT":
+                    # 快照前先上报所有待发送的状态，保证全局日志包含缓存中的每个生成结果
+                    if pending_status:
+                        self.result_sender.send(pending_status)
+                        pending_status = []
+                    self.result_sender.flush()
+                    self.balance_collect.send_string(self._snapshot(received[1]))
+                    continue
+                if isinstance(received, tuple) and received[0] == "CREDIT":
+                    # ("CREDIT", n, force)：训练进程在生成下一批之前申请缓存位置
+                    self.balance_collect.send_pyobj(self._grant_credit(*received[1:]))
+                    continue
+                tacs: list[TaskAndContent] = received if isinstance(received, list) else [received]
+                if self.rollout_log is not None:
+                    self.rollout_log.append("cache", tacs)
+                now = time.time()
+                for tac in tacs:
+                    mark(tac.status.stage_times, "cached", now)
+                    tac.status.node = self.node_rank
+                    self.policy_version = max(self.policy_version, tac.status.policy_version)
+                    self.cached_tasks[tac.status.completion_id] = tac
+                self.tracer.count("received_completions", len(tacs))
+                self._consume_credit(len(tacs))
+                self.balance_collect.send_string("Received")
+                
+                if not pending_status:
+                    first_pending_time = time.monotonic()
+                pending_status.extend(tac.status for tac in tacs)
             
-            # 发送任务状态到全局
-            self.result_sender.send_pyobj(tac.status)
-            self.result_sender.recv_string()
+            # 批量发送任务状态到全局，不等待确认
+            if pending_status and (len(pending_status) >= self.report_batch_size
+                                   or time.monotonic() - first_pending_time >= self.report_flush_interval):
+                self.result_sender.send(pending_status)
+                pending_status = []
+            else:
+                self.result_sender.poll_acks()
             
-            if len(self.cached_tasks) >= self.max_cache_size:
+            if len(self.cached_tasks) >= self.max_cache_size and not self.credit_flow:
                 logger.warning(f"Too many cached tasks. [ Local GID: {self.local_gid} | "
                                f"Cached: {len(self.cached_tasks)}, Reprocessing: {self.valid_tasks.qsize()} | "
                                f"Queued: {self.ready_queue.qsize()} ]")
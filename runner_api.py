@@ -7,23 +7,13 @@ import json
 import base64
 from io import BytesIO
 from mark_coordinates import mark_coordinates
+from agent_metrics import REGISTRY
+from eval.utils.resize_policy import DEFAULT_RESIZE_POLICY
 
 
-# 将图片长边缩放至1120以降低计算和显存压力
-def __resize__(origin_img):
-    resolution = origin_img.size
-    w,h = resolution
-    max_line_res = 1120
-    if max_line_res is not None:
-        max_line = max_line_res
-        if h > max_line:
-            w = int(w * max_line / h)
-            h = max_line
-        if w > max_line:
-            h = int(h * max_line / w)
-            w = max_line
-    img = origin_img.resize((w,h),resample=Image.Resampling.LANCZOS)
-    return img
+# 将图片长边缩放至1120以降低计算和显存压力，缩放方式见 eval/utils/resize_policy.py
+def __resize__(origin_img, policy=DEFAULT_RESIZE_POLICY):
+    return policy(origin_img)
 
 
 
@@ -78,21 +68,16 @@ def query_ollama(image_base64, instruction:str):
         "stream": False,
     }
     try:
-        response = requests.post(url, headers=headers, json=data)
+        with REGISTRY.span("model"):
+            response = requests.post(url, headers=headers, json=data)
         response.raise_for_status()
-        content = response.content
-        encodings = ['utf-8', 'ascii', 'latin1']
-        for encoding in encodings:
-            try:
-                decoded_content = content.decode(encoding)
-                # 输出结果
-                return json.loads(decoded_content)
-            except UnicodeDecodeError:
-                continue
-            except json.JSONDecodeError:
-                continue
-        return None
+        # json.loads 可直接解析 bytes（自动识别 UTF-8/16/32），无需逐个尝试编码
+        return json.loads(response.content)
     except requests.exceptions.RequestException as e:
+        REGISTRY.counter("model_errors_total", "Failed or undecodable model requests.").inc(reason="request")
+        return None
+    except ValueError as e:
+        REGISTRY.counter("model_errors_total", "Failed or undecodable model requests.").inc(reason="decode")
         return None
 
    
@@ -122,8 +107,10 @@ if __name__ == "__main__":
     instruction = "请帮我搜索周杰伦的歌"
     image_path = "assets/test.jpeg"  # 你的图片路径
     image = Image.open(image_path).convert("RGB")
-    image = __resize__(image)
-    image_base64 = encode_image_to_base64(image)
+    with REGISTRY.span("preprocess"):
+        image = __resize__(image)
+        image_base64 = encode_image_to_base64(image)
 
     result = query_ollama(image_base64, instruction)
-    print(result)
\ No newline at end of file
+    print(result)
+    print(REGISTRY.render())
\ No newline at end of file
@@ -16,6 +16,9 @@ from torch.utils.data import Dataset
 from transformers import AutoProcessor, AutoTokenizer
 import logging
 
+# the entrypoint (finetune.py) puts the repository root on the import path
+from eval.utils.resize_policy import ResizePolicy
+
 logger = logging.getLogger(__name__)
 
 llama3_chat_template = "{% set loop_messages = messages %}{% for message in loop_messages %}{% set content = '<|start_header_id|>' + message['role'] + '<|end_header_id|>\n\n'+ message['content'] | trim + '<|eot_id|>' %}{% if loop.index0 == 0 %}{% set content = bos_token + content %}{% endif %}{{ content }}{% endfor %}"
@@ -34,7 +37,8 @@ class SupervisedDataset(Dataset):
         query_nums=64,
         batch_vision=False,
         max_length=2048,
-        max_line_res=1120
+        max_line_res=1120,
+        resize_policy="legacy"
     ):
         super(SupervisedDataset, self).__init__()
         self.raw_data = raw_data
@@ -47,23 +51,20 @@ class SupervisedDataset(Dataset):
         self.batch_vision = batch_vision
         self.max_length = max_length
         self.max_line_res = max_line_res
+        # keep the resize aligned with the processor's slicing so that `slice_image` does not resize again
+        self.resize_policy = ResizePolicy.from_name(
+            resize_policy,
+            max_line_res=max_line_res,
+            patch_size=patch_size,
+            scale_resolution=slice_config.get("scale_resolution", 448) if slice_config else 448,
+            max_slice_nums=slice_config.get("max_slice_nums", 9) if slice_config else 9,
+        )
 
     def __len__(self):
         return len(self.raw_data)
     
     def __resize__(self, origin_img):
-        resolution = origin_img.size
-        w,h = resolution
-        if self.max_line_res is not None:
-            max_line = self.max_line_res
-            if h > max_line:
-                w = int(w * max_line / h)
-                h = max_line
-            if w > max_line:
-                h = int(h * max_line / w)
-                w = max_line
-        img = origin_img.resize((w,h),resample=Image.Resampling.LANCZOS)
-        return img
+        return self.resize_policy(origin_img)
     
     def __getitem__(self, i) -> Dict[str, torch.Tensor]:
         try:
@@ -2,6 +2,7 @@ import glob
 import json
 import logging
 import os
+import sys
 from dataclasses import dataclass, field
 from functools import partial
 from typing import Dict, List, Optional, Union, Literal, Tuple
@@ -18,6 +19,8 @@ from transformers import AutoModel, AutoTokenizer
 from transformers.integrations import deepspeed
 from transformers import AutoModel, AutoTokenizer
 
+# dataset.py uses the resize policies in eval.utils at the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from dataset import SupervisedDataset, data_collator
 from trainer import CPMTrainer
 
@@ -37,6 +40,9 @@ class DataArguments:
         default=None, metadata={"help": "Path to the evaluation data."}
     )
     max_line_res: Optional[int] = field(default=1120)
+    resize_policy: str = field(
+        default="legacy", metadata={"help": "Screenshot resize policy: legacy, fast or slice (see eval/utils/resize_policy.py)."}
+    )
 
 
 @dataclass
@@ -117,7 +123,8 @@ def make_supervised_data_module(
         query_nums=query_nums,
         batch_vision=batch_vision,
         max_length=max_length,
-        max_line_res=data_args.max_line_res
+        max_line_res=data_args.max_line_res,
+        resize_policy=data_args.resize_policy
     )
 
     if data_args.eval_data_path:
@@ -132,7 +139,8 @@ def make_supervised_data_module(
             query_nums=query_nums,
             batch_vision=batch_vision,
             max_length=max_length,
-            max_line_res=data_args.max_line_res
+            max_line_res=data_args.max_line_res,
+            resize_policy=data_args.resize_policy
         )
     else:
         eval_dataset = None
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Root-level modules (agent_*.py) and `eval.utils` are imported from the repository root, like the scripts do.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,87 @@
+import importlib.util
+import json
+import os
+
+import pytest
+
+from eval.utils.action_parser import (
+    Action,
+    ValidationError,
+    compile_validator,
+    load_action,
+    loads_action_json,
+    try_load_action,
+)
+
+SCHEMA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "eval", "utils", "schema")
+
+
+def _schema_cases():
+    # the hand-written cases of eval/utils/schema/test_schema.py
+    spec = importlib.util.spec_from_file_location("schema_cases", os.path.join(SCHEMA_DIR, "test_schema.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.test_cases
+
+
+@pytest.mark.parametrize("case", _schema_cases(), ids=lambda case: case["name"])
+def test_extraction_schema_cases(case):
+    assert compile_validator("schema_for_extraction.json").is_valid(case["data"]) == case["expected"]
+
+
+@pytest.mark.parametrize("name", ["schema.json", "schema_for_extraction.json"])
+def test_agrees_with_jsonschema(name):
+    jsonschema = pytest.importorskip("jsonschema")
+    with open(os.path.join(SCHEMA_DIR, name), encoding="utf-8") as f:
+        schema = json.load(f)
+    validator = compile_validator(schema)
+    instances = [case["data"] for case in _schema_cases()] + [
+        {"POINT": [0, 1000]},
+        {"POINT": [1001, 0]},
+        {"POINT": [1.5, 2]},
+        {"POINT": [True, 2]},
+        {"PRESS": "HOME", "duration": 10},
+        {"TYPE": 1},
+        {"STATUS": "finish"},
+        {"thought": "look", "POINT": [10, 10], "to": "up"},
+        {"POINT": [10, 10], "to": "sideways"},
+        {},
+        [],
+        None,
+    ]
+    for instance in instances:
+        expected = jsonschema.Draft7Validator(schema).is_valid(instance)
+        assert validator.is_valid(instance) == expected, instance
+
+
+def test_validate_raises_with_message():
+    validator = compile_validator("schema.json")
+    assert validator.error({"POINT": [10, 10]}) is None
+    with pytest.raises(ValidationError) as info:
+        validator.validate({"POINT": [10, 10], "unknown": 1})
+    assert str(info.value)
+
+
+def test_unsupported_keyword_is_rejected():
+    with pytest.raises(NotImplementedError):
+        compile_validator({"type": "string", "pattern": "^a"})
+
+
+def test_loads_action_json_rejects_duplicate_keys():
+    assert loads_action_json(b'{"POINT": [1, 2], "to": "up"}') == {"POINT": [1, 2], "to": "up"}
+    with pytest.raises(ValueError):
+        loads_action_json('{"POINT": [1, 2], "POINT": [3, 4]}')
+
+
+def test_load_action_round_trip():
+    validator = compile_validator("schema.json")
+    action = load_action('{"thought": "t", "POINT": [10, 20], "duration": 300, "STATUS": "finish"}', validator)
+    assert action == Action(thought="t", point=[10, 20], duration=300, status="finish")
+    assert action.to_dict() == {"thought": "t", "POINT": [10, 20], "duration": 300, "STATUS": "finish"}
+    assert Action(point=[1, 2]).duration_or(200) == 200
+
+    assert try_load_action("{not json", validator)[1].startswith("Invalid JSON")
+    action, err = try_load_action({"POINT": [2000, 0]}, validator)
+    assert action is None and err
+    with pytest.raises(ValidationError):
+        load_action({"POINT": [2000, 0]}, validator)
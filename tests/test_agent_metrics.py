@@ -0,0 +1,46 @@
+import pytest
+
+from agent_metrics import Histogram, MetricsRegistry
+
+
+def test_histogram_quantile_interpolates_like_prometheus():
+    h = Histogram("h", buckets=(1.0, 2.0, 4.0))
+    assert h.quantile(0.5) is None
+    for value in [0.5, 1.5, 1.5, 3.0]:
+        h.observe(value)
+    assert h.quantile(0.25) == pytest.approx(1.0)
+    assert h.quantile(0.5) == pytest.approx(1.5)
+    assert h.quantile(1.0) == pytest.approx(4.0)
+    h.observe(100.0)
+    assert h.quantile(1.0) == 4.0
+
+
+def test_span_records_latency_and_errors_with_scope_labels():
+    registry = MetricsRegistry()
+    with registry.scope(speculative="true"):
+        with registry.span("model"):
+            pass
+    with pytest.raises(RuntimeError):
+        with registry.span("execute"):
+            raise RuntimeError("device gone")
+
+    assert registry.stage_seconds.count(stage="model", speculative="true") == 1
+    assert registry.stage_seconds.count(stage="model") == 0
+    assert registry.counter("stage_errors_total").value(stage="execute") == 1
+    assert set(registry.summary()) == {"execute"}
+
+
+def test_render_and_textfile(tmp_path):
+    registry = MetricsRegistry()
+    registry.counter("model_errors_total", "Model errors.").inc(reason="decode")
+    registry.gauge("queue_depth").set(3, device='emu"1')
+    text = registry.render()
+    assert "# TYPE agent_model_errors_total counter" in text
+    assert 'agent_model_errors_total{reason="decode"} 1' in text
+    assert 'agent_queue_depth{device="emu\\"1"} 3' in text
+    with pytest.raises(TypeError):
+        registry.gauge("model_errors_total")
+
+    path = tmp_path / "metrics" / "agent.prom"
+    registry.write_textfile(str(path))
+    assert path.read_text() == text
@@ -0,0 +1,160 @@
+import asyncio
+import base64
+import json
+import threading
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+pytest.importorskip("fastapi")
+httpx = pytest.importorskip("httpx")
+
+from agent_server import QueueFull, RequestGate, SessionStore, create_app  # noqa: E402
+from eval.utils.action_parser import Action  # noqa: E402
+
+
+def _image_base64():
+    buf = BytesIO()
+    Image.new("RGB", (8, 16), (255, 0, 0)).save(buf, format="PNG")
+    return base64.b64encode(buf.getvalue()).decode()
+
+
+class _Agent:
+    def __init__(self, actions=None, release=None):
+        self.actions = list(actions or [])
+        self.release = release
+        self.calls = 0
+
+    def get_action(self, image, instruction, history):
+        self.calls += 1
+        if self.release is not None:
+            self.release.wait(10)
+        history.append({"role": "user", "content": instruction})
+        history.append({"role": "assistant", "content": "{}"})
+        return self.actions.pop(0) if self.actions else Action(point=[1, 2])
+
+
+class _Device:
+    def __init__(self):
+        self.executed = []
+
+    def take_screenshot(self):
+        return Image.new("RGB", (8, 16))
+
+    def execute_action(self, action):
+        self.executed.append(action)
+        return action.status
+
+
+def _client(app):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+def test_session_store_evicts_by_capacity_and_ttl(monkeypatch):
+    import agent_server
+
+    now = [0.0]
+    monkeypatch.setattr(agent_server.time, "monotonic", lambda: now[0])
+    store = SessionStore(max_sessions=2, ttl=10, max_history_turns=1)
+    a = store.get_or_create("a")
+    store.get_or_create("b")
+    store.get_or_create("a")
+    store.get_or_create("c")
+    # "b" was the least recently used
+    assert "b" not in store and "a" in store and "c" in store
+    a.history.extend([1, 2, 3])
+    assert list(a.history) == [2, 3]
+    now[0] = 20.0
+    store.get_or_create("d")
+    assert len(store) == 1 and "d" in store
+    assert store.drop("d") and not store.drop("d")
+
+
+def test_gate_rejects_when_the_queue_is_full():
+    async def run():
+        gate = RequestGate(max_concurrency=1, max_queue=0)
+        async with gate:
+            with pytest.raises(QueueFull):
+                async with gate:
+                    pass
+        async with gate:
+            assert gate.running == 1
+        assert gate.running == 0 and gate.waiting == 0
+
+    asyncio.run(run())
+
+
+def test_step_keeps_a_session_history():
+    async def run():
+        agent = _Agent([Action(point=[1, 2]), Action(press="HOME", status="finish")])
+        app = create_app(agent, SessionStore(max_history_turns=8), RequestGate())
+        async with _client(app) as client:
+            first = (await client.post("/step", json={"instruction": "go", "image": _image_base64()})).json()
+            second = (await client.post("/step", json={"instruction": "go", "image": _image_base64(),
+                                                      "session_id": first["session_id"]})).json()
+            assert first["action"] == {"POINT": [1, 2]} and first["step"] == 1
+            assert second["session_id"] == first["session_id"]
+            assert second["step"] == 2 and second["status"] == "finish"
+            assert (await client.post("/step", json={"instruction": "go", "image": "nope"})).status_code == 400
+            assert (await client.delete(f"/sessions/{first['session_id']}")).status_code == 200
+            assert (await client.delete(f"/sessions/{first['session_id']}")).status_code == 404
+
+    asyncio.run(run())
+
+
+def test_step_returns_503_and_drops_the_rejected_session():
+    async def run():
+        release = threading.Event()
+        sessions = SessionStore()
+        app = create_app(_Agent(release=release), sessions, RequestGate(max_concurrency=1, max_queue=0))
+        async with _client(app) as client:
+            slow = asyncio.create_task(client.post("/step", json={"instruction": "go", "image": _image_base64()}))
+            while len(sessions) == 0:
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.05)
+            rejected = await client.post("/step", json={"instruction": "go", "image": _image_base64()})
+            assert rejected.status_code == 503 and rejected.headers["retry-after"] == "1"
+            assert len(sessions) == 1
+            release.set()
+            assert (await slow).status_code == 200
+
+    asyncio.run(run())
+
+
+def test_episode_streams_steps_until_the_task_ends():
+    async def run():
+        device = _Device()
+        agent = _Agent([Action(point=[1, 2]), Action(press="BACK", status="finish")])
+        app = create_app(agent, SessionStore(), RequestGate(), devices={"emu": device})
+        async with _client(app) as client:
+            response = await client.post("/episode", json={"device_id": "emu", "instruction": "go",
+                                                           "settle_seconds": 0})
+            events = [json.loads(line) for line in response.text.splitlines()]
+            assert [e["event"] for e in events] == ["step", "step", "end"]
+            assert events[-1] == {"event": "end", "status": "finish", "steps": 2}
+            assert len(device.executed) == 2
+            missing = await client.post("/episode", json={"device_id": "other", "instruction": "go"})
+            assert missing.status_code == 404
+            devices = (await client.get("/devices")).json()
+            assert devices == {"devices": ["emu"], "busy": []}
+
+    asyncio.run(run())
+
+
+def test_episode_on_a_busy_device_is_rejected():
+    async def run():
+        release = threading.Event()
+        app = create_app(_Agent(release=release), SessionStore(), RequestGate(), devices={"emu": _Device()})
+        async with _client(app) as client:
+            running = asyncio.create_task(client.post("/episode", json={"device_id": "emu", "instruction": "go",
+                                                                        "max_steps": 1, "settle_seconds": 0}))
+            while (await client.get("/devices")).json()["busy"] != ["emu"]:
+                await asyncio.sleep(0.01)
+            busy = await client.post("/episode", json={"device_id": "emu", "instruction": "go"})
+            assert busy.status_code == 409
+            release.set()
+            events = [json.loads(line) for line in (await running).text.splitlines()]
+            assert events[-1]["status"] == "max_steps"
+
+    asyncio.run(run())
@@ -0,0 +1,73 @@
+from PIL import Image
+
+from agent_speculation import SpeculativeExecutor, frame_diff, is_deterministic
+from eval.utils.action_parser import Action
+
+
+class _Controller:
+    def __init__(self, action=None, error=None):
+        self.conversation_history = [{"role": "user", "content": "start"}]
+        self.action = action
+        self.error = error
+
+    def get_action(self, frame, instruction, history):
+        if self.error is not None:
+            raise self.error
+        history.append({"role": "assistant", "content": "spec"})
+        return self.action
+
+
+def _frame(value):
+    return Image.new("RGB", (200, 400), (value, value, value))
+
+
+def test_deterministic_actions():
+    assert is_deterministic(Action(press="BACK"))
+    assert is_deterministic(Action(press="HOME"))
+    assert not is_deterministic(Action(press="ENTER"))
+    assert is_deterministic(Action(press="ENTER"), prev_action=Action(text="hello"))
+    assert not is_deterministic(Action(press="BACK", status="finish"))
+    assert not is_deterministic(Action(point=[1, 2]))
+
+
+def test_frame_diff():
+    assert frame_diff(_frame(10), _frame(10)) == 0.0
+    assert abs(frame_diff(_frame(0), _frame(255)) - 1.0) < 1e-6
+
+
+def test_hit_reuses_the_action_and_merges_history():
+    action = Action(point=[5, 5])
+    controller = _Controller(action)
+    executor = SpeculativeExecutor(controller)
+    try:
+        executor.start(_frame(10), "open settings")
+        assert executor.pending
+        assert executor.resolve(_frame(10), "open settings") is action
+        assert controller.conversation_history[-1] == {"role": "assistant", "content": "spec"}
+        assert not executor.pending
+    finally:
+        executor.shutdown()
+
+
+def test_miss_when_the_screen_or_history_changed():
+    controller = _Controller(Action(point=[5, 5]))
+    executor = SpeculativeExecutor(controller)
+    try:
+        executor.start(_frame(10), "open settings")
+        assert executor.resolve(_frame(200), "open settings") is None
+        executor.start(_frame(10), "open settings")
+        controller.conversation_history.append({"role": "user", "content": "changed"})
+        assert executor.resolve(_frame(10), "open settings") is None
+        assert len(controller.conversation_history) == 2
+    finally:
+        executor.shutdown()
+
+
+def test_failed_speculation_falls_back():
+    executor = SpeculativeExecutor(_Controller(error=RuntimeError("model down")))
+    try:
+        executor.start(_frame(10), "open settings")
+        assert executor.resolve(_frame(10), "open settings") is None
+        assert executor.resolve(_frame(10), "open settings") is None
+    finally:
+        executor.shutdown()
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from eval.utils.resize_policy import (
+    DEFAULT_RESIZE_POLICY,
+    ResizePolicy,
+    slice_plan,
+    visual_token_count,
+)
+
+SIZES = [(1080, 2400), (1440, 3200), (720, 1280), (2400, 1080), (400, 300), (1120, 1120)]
+
+
+def _legacy_resize(origin_img):
+    # the `__resize__` every entry point used to carry
+    w, h = origin_img.size
+    max_line = 1120
+    if h > max_line:
+        w = int(w * max_line / h)
+        h = max_line
+    if w > max_line:
+        h = int(h * max_line / w)
+        w = max_line
+    return origin_img.resize((w, h), resample=Image.Resampling.LANCZOS)
+
+
+def _image(size):
+    rng = np.random.default_rng(0)
+    return Image.fromarray(rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8))
+
+
+@pytest.mark.parametrize("size", [(1080, 2400), (2400, 1080), (400, 300)])
+def test_legacy_matches_previous_resize(size):
+    img = _image(size)
+    assert DEFAULT_RESIZE_POLICY == ResizePolicy.from_name("legacy")
+    assert DEFAULT_RESIZE_POLICY(img).tobytes() == _legacy_resize(img).tobytes()
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_patch_alignment(size):
+    w, h = ResizePolicy.from_name("fast").target_size(size)
+    assert w % 14 == 0 and h % 14 == 0
+    assert max(w, h) <= 1120
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_slice_alignment_is_a_fixed_point(size):
+    policy = ResizePolicy.from_name("slice")
+    target = policy.target_size(size)
+    assert target[0] % 14 == 0 and target[1] % 14 == 0
+    legacy = DEFAULT_RESIZE_POLICY.target_size(size)
+    _, grid, _ = slice_plan(legacy)
+    _, new_grid, refine = slice_plan(target)
+    # the processor slices the resized image with the same grid ...
+    assert new_grid == grid
+    assert visual_token_count(target) == visual_token_count(legacy)
+    if grid is not None and target != ResizePolicy.from_name("fast").target_size(size):
+        # ... and, unless the refine size is not a fixed point and the patch aligned size is used, without a second resize
+        assert tuple(refine) == tuple(target)
+
+
+def test_slice_alignment_falls_back_to_patch_alignment():
+    # 630x1120 refines to 588x1050, which the processor would slice with another grid
+    assert ResizePolicy.from_name("slice").target_size((720, 1280)) == (630, 1120)
+
+
+def test_overrides_and_unknown_names():
+    policy = ResizePolicy.from_name("legacy", max_line_res=560, resample="bilinear")
+    assert policy.target_size((1080, 2400)) == (252, 560)
+    assert ResizePolicy.PRESETS["legacy"].max_line_res == 1120
+    with pytest.raises(ValueError):
+        ResizePolicy.from_name("huge")
+    with pytest.raises(ValueError):
+        ResizePolicy(align="diagonal").target_size((100, 100))
@@ -39,6 +39,11 @@ UIAutomator Controller with AgentCPM-GUI
 - --task: 要执行的任务指令（必需）
 - --max-steps: 最大执行步数，默认为 10
 - --reset-history: 重置对话历史，开始新的对话
+- --metrics-file: 每步结束后写入 Prometheus textfile 格式的指标文件（可选）
+- --metrics-port: 在该端口开启 /metrics HTTP 端点（可选）
+- --resize-policy: 截图缩放策略 legacy / fast / slice（见 eval/utils/resize_policy.py）
+- --speculate: 在 BACK/HOME/ENTER 等确定性动作后提前对下一屏推理（见 agent_speculation.py）
+- --strict-actions: 不符合 schema 的动作视为无效并结束任务；默认记录（schema_violations_total）后照常执行
 
 故障排除:
 1. 设备连接问题:
@@ -60,6 +65,7 @@ UIAutomator Controller with AgentCPM-GUI
 
 import uiautomator2 as u2
 import json
+import re
 import time
 import os
 import torch
@@ -69,22 +75,14 @@ from io import BytesIO
 import argparse
 # from transformers import AutoTokenizer, AutoModelForCausalLM
 import requests
+from agent_metrics import REGISTRY
+from agent_speculation import SpeculativeExecutor, capture, is_deterministic
+from eval.utils.action_parser import Action, compile_validator, loads_action_json, try_load_action
+from eval.utils.resize_policy import DEFAULT_RESIZE_POLICY, ResizePolicy
 
-# 将图片长边缩放至1120以降低计算和显存压力
-def resize_image(origin_img):
-    resolution = origin_img.size
-    w, h = resolution
-    max_line_res = 1120
-    if max_line_res is not None:
-        max_line = max_line_res
-        if h > max_line:
-            w = int(w * max_line / h)
-            h = max_line
-        if w > max_line:
-            h = int(h * max_line / w)
-            w = max_line
-    img = origin_img.resize((w, h), resample=Image.Resampling.LANCZOS)
-    return img
+# 将图片长边缩放至1120以降低计算和显存压力，缩放方式见 eval/utils/resize_policy.py
+def resize_image(origin_img, policy=DEFAULT_RESIZE_POLICY):
+    return policy(origin_img)
 
 def encode_image_to_base64(image):
     buffered = BytesIO()
@@ -92,7 +90,7 @@ def encode_image_to_base64(image):
     return base64.b64encode(buffered.getvalue()).decode("utf-8")
 
 class AgentCPMController:
-    def __init__(self, model_path="model/AgentCPM-GUI", device="cuda:0"):
+    def __init__(self, model_path="model/AgentCPM-GUI", device="cuda:0", resize_policy="legacy", strict_actions=False):
         # # 加载模型和分词器
         # print("Loading model from", model_path)
         # self.tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
@@ -104,6 +102,10 @@ class AgentCPMController:
         # 加载 schema
         schema_path = 'eval/utils/schema/schema.json'
         self.action_schema = json.load(open(schema_path, encoding="utf-8"))
+        # 预编译动作校验器（不强制 thought 字段，避免模型省略思考时整步失败）
+        self.action_validator = compile_validator(self.action_schema)
+        # 严格模式下不符合 schema 的动作视为无效；默认记录后照常执行，与加入校验前一致
+        self.strict_actions = strict_actions
         
         # 设置系统提示
         items = list(self.action_schema.items())
@@ -125,23 +127,46 @@ class AgentCPMController:
 # Schema
 {json.dumps(self.action_schema, indent=None, ensure_ascii=False, separators=(',', ':'))}'''
 
+        # 截图缩放策略
+        self.resize_policy = ResizePolicy.from_name(resize_policy) if isinstance(resize_policy, str) else resize_policy
+
         # 初始化对话历史
         self.conversation_history = []
 
-    def get_action(self, image, instruction):
+    def get_action(self, image, instruction, history=None):
         """
         获取模型对当前屏幕的操作建议
+        history: 对话历史（list 或 deque），默认使用控制器自身的 conversation_history
         """
+        if history is None:
+            history = self.conversation_history
         # 调整图像大小
-        image = resize_image(image)
-        image_base64 = encode_image_to_base64(image)
+        with REGISTRY.span("preprocess"):
+            image = resize_image(image, self.resize_policy)
+            image_base64 = encode_image_to_base64(image)
 
         # 解析输出
         try:
             # 推理
-            outputs = self.query_ollama(image_base64, instruction)
-            action_content = outputs['choices'][-1]['message']['content']
-            action = json.loads(action_content)
+            with REGISTRY.span("model"):
+                outputs = self.query_ollama(image_base64, instruction, history)
+            if outputs is None:
+                # 失败原因已在 query_ollama 中按 reason 计数
+                return None
+            with REGISTRY.span("parse"):
+                action_content = outputs['choices'][-1]['message']['content']
+                action, error = try_load_action(action_content, self.action_validator)
+                if action is None and not self.strict_actions:
+                    action = self._pass_through(action_content, error)
+            if action is None:
+                REGISTRY.counter("parse_failures_total", "Model outputs that could not be parsed into an action.").inc()
+                print(f"Invalid action from model: {error}")
+                print(action_content)
+                return None
+            usage = outputs.get('usage') or {}
+            for kind in ("prompt_tokens", "completion_tokens"):
+                if kind in usage:
+                    REGISTRY.counter("model_tokens_total", "Tokens consumed by the model.").inc(usage[kind], kind=kind)
             
             # 更新对话历史
             # 添加用户消息到历史记录
@@ -149,22 +174,35 @@ class AgentCPMController:
                 "role": "user",
                 "content": f"<Question>{instruction}</Question>\n当前屏幕截图：[图片]"
             }
-            self.conversation_history.append(user_message)
+            history.append(user_message)
             
             # 添加助手回复到历史记录
             assistant_message = {
                 "role": "assistant",
                 "content": action_content
             }
-            self.conversation_history.append(assistant_message)
+            history.append(assistant_message)
             
             return action
         except Exception as e:
+            REGISTRY.counter("parse_failures_total", "Model outputs that could not be parsed into an action.").inc()
             print("Error parsing model!")
             print(e)
             return None
     
-    def query_ollama(self, image_base64, instruction:str):
+    def _pass_through(self, action_content, error):
+        """JSON 合法但不符合 schema 的输出：记录并计数后按原样转换为 Action"""
+        try:
+            data = loads_action_json(action_content)
+        except ValueError:
+            return None
+        if not isinstance(data, dict):
+            return None
+        REGISTRY.counter("schema_violations_total", "Model actions violating the schema, executed unless --strict-actions.").inc()
+        print(f"Action violates the schema, executing it anyway: {error}")
+        return Action.from_dict(data)
+
+    def query_ollama(self, image_base64, instruction:str, history=None):
         url = "http://localhost:11434/v1/chat/completions"
         headers = {
             "Content-Type": "application/json"
@@ -174,8 +212,10 @@ class AgentCPMController:
         messages = [{"role": "system", "content": self.system_prompt}]
         
         # 添加历史对话（不包含当前请求）
-        if self.conversation_history:
-            messages.extend(self.conversation_history)
+        if history is None:
+            history = self.conversation_history
+        if history:
+            messages.extend(history)
         
         # 添加当前用户消息（包含当前截图）
         current_message = {
@@ -202,21 +242,16 @@ class AgentCPMController:
         try:
             response = requests.post(url, headers=headers, json=data)
             response.raise_for_status()
-            content = response.content
-            encodings = ['utf-8', 'ascii', 'latin1']
-            for encoding in encodings:
-                try:
-                    decoded_content = content.decode(encoding)
-                    # 输出结果
-                    return json.loads(decoded_content)
-                except UnicodeDecodeError:
-                    continue
-                except json.JSONDecodeError:
-                    continue
-            return None
+            # json.loads 可直接解析 bytes（自动识别 UTF-8/16/32），无需逐个尝试编码
+            return json.loads(response.content)
         except requests.exceptions.RequestException as e:
+            REGISTRY.counter("model_errors_total", "Failed or undecodable model requests.").inc(reason="request")
             print(f"Request error: {e}")
             return None
+        except ValueError as e:
+            REGISTRY.counter("model_errors_total", "Failed or undecodable model requests.").inc(reason="decode")
+            print(f"Invalid response: {e}")
+            return None
 
 class UIAutomatorController:
     def __init__(self, device_id=None):
@@ -231,40 +266,42 @@ class UIAutomatorController:
         
         print(f"Connected to device: {self.device.info}")
         
-        # 创建输出目录
+        # 创建输出目录；截图文件名带设备序列号，多个设备（/episode）同时截图不会互相覆盖
         self.screenshot_dir = "screenshots"
+        self.screenshot_prefix = "screen_" + re.sub(r"[^0-9A-Za-z]+", "_", str(self.device.serial))
         os.makedirs(self.screenshot_dir, exist_ok=True)
     
     def take_screenshot(self):
         """
         截取当前屏幕
         """
-        screenshot_path = os.path.join(self.screenshot_dir, f"screen_{int(time.time())}.png")
-        self.device.screenshot(screenshot_path)
-        return Image.open(screenshot_path)
+        screenshot_path = os.path.join(self.screenshot_dir, f"{self.screenshot_prefix}_{time.time_ns()}.png")
+        with REGISTRY.span("capture"):
+            self.device.screenshot(screenshot_path)
+            return Image.open(screenshot_path)
     
-    def execute_action(self, action):
+    def execute_action(self, action: Action):
         """
         执行模型输出的动作
         """
-        print(f"Executing action: {json.dumps(action, ensure_ascii=False)}")
+        print(f"Executing action: {json.dumps(action.to_dict(), ensure_ascii=False)}")
         
         # 打印思考过程
-        if "thought" in action:
-            print(f"Thought: {action['thought']}")
+        if action.thought is not None:
+            print(f"Thought: {action.thought}")
         
         # 点击操作
-        if "POINT" in action:
-            x, y = action["POINT"]
+        if action.point is not None:
+            x, y = action.point
             # 将0-1000的坐标转换为实际屏幕坐标
             screen_width, screen_height = self.device.window_size()
             actual_x = int(x * screen_width / 1000)
             actual_y = int(y * screen_height / 1000)
             
             # 检查是否有滑动操作
-            if "to" in action:
-                to_value = action["to"]
-                duration = action.get("duration", 200)
+            if action.to is not None:
+                to_value = action.to
+                duration = action.duration_or(200)
                 
                 if isinstance(to_value, list):  # 如果是坐标
                     end_x, end_y = to_value
@@ -284,7 +321,7 @@ class UIAutomatorController:
                         self.device.swipe(actual_x, actual_y, actual_x + swipe_distance, actual_y, duration/1000.0)
             else:
                 # 普通点击或长按
-                duration = action.get("duration", 200)
+                duration = action.duration_or(200)
                 if duration > 200:  # 长按
                     print(f"Long pressing at ({actual_x}, {actual_y}) for {duration}ms")
                     self.device.long_click(actual_x, actual_y, duration/1000.0)
@@ -293,8 +330,8 @@ class UIAutomatorController:
                     self.device.click(actual_x, actual_y)
         
         # 特殊按键操作
-        elif "PRESS" in action:
-            button = action["PRESS"]
+        elif action.press is not None:
+            button = action.press
             if button == "HOME":
                 print("Pressing HOME button")
                 self.device.press("home")
@@ -306,13 +343,14 @@ class UIAutomatorController:
                 self.device.press("enter")
         
         # 文本输入操作
-        elif "TYPE" in action:
-            text = action["TYPE"]
+        elif action.text is not None:
+            text = action.text
             print(f"Typing text: {text}")
             self.device.send_keys(text)
         
         # 检查任务状态
-        status = action.get("STATUS", "continue")
+        status = action.status
+        REGISTRY.counter("status_total", "Distribution of task status reported by the model.").inc(status=status)
         return status
 
 def main():
@@ -323,11 +361,22 @@ def main():
     parser.add_argument("--task", type=str, help="Task instruction", required=True)
     parser.add_argument("--max-steps", type=int, help="Maximum number of steps", default=10)
     parser.add_argument("--reset-history", action="store_true", help="Reset conversation history")
+    parser.add_argument("--metrics-file", type=str, help="Write Prometheus textfile metrics to this path after each step", default=None)
+    parser.add_argument("--metrics-port", type=int, help="Expose /metrics over HTTP on this port", default=None)
+    parser.add_argument("--resize-policy", type=str, help="Screenshot resize policy", choices=sorted(ResizePolicy.PRESETS), default="legacy")
+    parser.add_argument("--strict-actions", action="store_true", help="Treat actions violating the schema as invalid instead of executing them")
+    parser.add_argument("--speculate", action="store_true", help="Start inference on the next screen right after BACK/HOME/ENTER")
+    parser.add_argument("--speculate-threshold", type=float, help="Max frame difference (0-1) to reuse a speculative result", default=0.01)
     args = parser.parse_args()
+
+    if args.metrics_port:
+        REGISTRY.serve(args.metrics_port)
+        print(f"Serving metrics at http://0.0.0.0:{args.metrics_port}/metrics")
     
     # 初始化控制器
     ui_controller = UIAutomatorController(args.device)
-    agent_controller = AgentCPMController(args.model, args.device_gpu)
+    agent_controller = AgentCPMController(args.model, args.device_gpu, resize_policy=args.resize_policy,
+                                          strict_actions=args.strict_actions)
     
     # 如果指定了重置历史，则清空历史记录
     if args.reset_history:
@@ -338,27 +387,46 @@ def main():
     instruction = args.task
     step_count = 0
     status = "continue"
+    prev_action = None
+    speculator = SpeculativeExecutor(agent_controller, args.speculate_threshold) if args.speculate else None
     
     print(f"Starting task: {instruction}")
     
     while status == "continue" and step_count < args.max_steps:
         step_count += 1
         print(f"\nStep {step_count}:")
+        step_start = time.perf_counter()
+        REGISTRY.counter("steps_total", "Number of agent steps started.").inc()
         
         # 截取屏幕
         screenshot = ui_controller.take_screenshot()
         
-        # 获取模型动作
-        action = agent_controller.get_action(screenshot, instruction)
+        # 获取模型动作（优先复用推测结果）
+        action = speculator.resolve(screenshot, instruction) if speculator and speculator.pending else None
+        if action is None:
+            action = agent_controller.get_action(screenshot, instruction)
         if not action:
             print("Failed to get action from model")
+            status = "failed"
             break
         
         # 执行动作
-        status = ui_controller.execute_action(action)
+        with REGISTRY.span("execute"):
+            status = ui_controller.execute_action(action)
+        
+        # 确定性动作后立即截图并开始推测推理，与等待UI更新重叠
+        if speculator and status == "continue" and step_count < args.max_steps and is_deterministic(action, prev_action):
+            speculator.start(capture(ui_controller), instruction)
+        prev_action = action
         
         # 等待UI更新
-        time.sleep(1)
+        with REGISTRY.span("settle"):
+            time.sleep(1)
+        
+        REGISTRY.stage_seconds.observe(time.perf_counter() - step_start, stage="step")
+        REGISTRY.gauge("history_messages", "Messages kept in the conversation history.").set(len(agent_controller.conversation_history))
+        if args.metrics_file:
+            REGISTRY.write_textfile(args.metrics_file)
         
         # 检查任务状态
         if status == "finish":
@@ -382,6 +450,19 @@ def main():
     
     print("Task execution finished")
     
+    if speculator:
+        speculator.shutdown()
+        hit_rate = speculator.hit_rate()
+        if hit_rate is not None:
+            print(f"[metrics] speculation hit rate: {hit_rate:.1%}")
+    
+    # 记录任务结果并输出指标
+    REGISTRY.counter("tasks_total", "Finished tasks by final status.").inc(status=status)
+    for stage, stats in REGISTRY.summary(("capture", "preprocess", "model", "parse", "execute", "step")).items():
+        print(f"[metrics] {stage}: n={stats['count']} p50={stats['p50']*1000:.1f}ms p99={stats['p99']*1000:.1f}ms")
+    if args.metrics_file:
+        REGISTRY.write_textfile(args.metrics_file)
+    
     # 打印对话历史长度
     print(f"Conversation history length: {len(agent_controller.conversation_history)} messages")
     